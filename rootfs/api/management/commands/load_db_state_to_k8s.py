@@ -1,60 +1,112 @@
+import functools
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.shortcuts import get_object_or_404
 
-from api.models import Key, App, Domain, Certificate
-from api.exceptions import DeisException, AlreadyExists
+from api.models import App
+from api.exceptions import AlreadyExists
+from api.reconcile import ClusterState, drift, repair
+from api.utils import async_run
+
+# seconds an interrupted run is picked up again for, after that the applications it got
+# through may well have drifted since and everything is compared again
+CHECKPOINT_TTL = 3600
 
 
 class Command(BaseCommand):
     """Management command for publishing Deis platform state from the database
     to k8s.
     """
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.DEIS_RECONCILE_WORKERS,
+            help='How many applications to reconcile at once'
+        )
+        parser.add_argument(
+            '--checkpoint', default=settings.DEIS_RECONCILE_CHECKPOINT,
+            help='File recording the applications done, so an interrupted run can resume'
+        )
+        parser.add_argument(
+            '--all', action='store_true', default=False,
+            help='Write and redeploy every application, whether it drifted or not'
+        )
+
     def handle(self, *args, **options):
-        """Publishes Deis platform state from the database to kubernetes."""
+        """
+        Publishes Deis platform state from the database to kubernetes, for the applications
+        that differ from what kubernetes has
+        """
         print("Publishing DB state to kubernetes...")
+        self.checkpoint = options['checkpoint']
+        self.done = self.load_checkpoint()
+        self.lock = threading.Lock()
+        if self.done:
+            print('Resuming, {} applications were done already'.format(len(self.done)))
 
-        self.save_apps()
-
-        # certificates have to be attached to domains to create k8s secrets
-        for cert in Certificate.objects.all():
-            for domain in cert.domains:
-                domain = get_object_or_404(Domain, domain=domain)
-                cert.attach_in_kubernetes(domain)
-
-        # deploy applications
-        print("Deploying available applications")
-        for application in App.objects.all():
-            rel = application.release_set.filter(failed=False).latest()
-            if rel.build is None:
-                print('WARNING: {} has no build associated with '
-                      'its latest release. Skipping deployment...'.format(application))
-                continue
-
-            try:
-                application.deploy(rel)
-            except AlreadyExists as error:
-                print('WARNING: {} has a deployment in progress. '
-                      'Skipping deployment...'.format(application))
-                continue
-            except DeisException as error:
-                print('ERROR: There was a problem deploying {} '
-                      'due to {}'.format(application, str(error)))
+        # a few cluster wide lists instead of reading every application on its own
+        state = ClusterState()
+        apps = [app for app in App.objects.order_by('id') if app.id not in self.done]
+        self.progress, self.total = 0, len(apps)
+        print('Comparing {} applications with kubernetes'.format(self.total))
 
+        tasks = [functools.partial(self.reconcile, app, state, options['all']) for app in apps]
+        async_run(tasks, limit=options['workers'], fail_fast=False)
+
+        self.clear_checkpoint()
         print("Done Publishing DB state to kubernetes.")
 
-    def save_apps(self):
-        """Saves important Django data models to the database."""
-        for app in App.objects.all():
-            try:
-                app.save()
-                app.config_set.latest().save()
-            except DeisException as error:
-                print('ERROR: Problem saving to model {} for {}'
-                      'due to {}'.format(str(App.__name__), str(app), str(error)))
-        for model in (Key, Domain, Certificate):
-            for obj in model.objects.all():
-                try:
-                    obj.save()
-                except DeisException as error:
-                    print('ERROR: Problem saving to model {} for {}'
-                          'due to {}'.format(str(model.__name__), str(obj), str(error)))
+    def reconcile(self, app, state, everything=False):
+        done = True
+        try:
+            # a missing namespace means writing everything
+            differences = ['namespace'] if everything else drift(app, state)
+            if differences:
+                repair(app, differences)
+                outcome = 'repaired {}'.format(', '.join(differences))
+            else:
+                outcome = 'in sync'
+        except AlreadyExists:
+            outcome = 'WARNING: has a deployment in progress, skipped'
+        except Exception as error:
+            # tried again when an interrupted run resumes
+            done = False
+            outcome = 'ERROR: {}'.format(error)
+
+        with self.lock:
+            self.progress += 1
+            if done:
+                self.done.add(app.id)
+                self.save_checkpoint()
+
+            print('[{}/{}] {}: {}'.format(self.progress, self.total, app, outcome))
+
+    def load_checkpoint(self):
+        """The applications an interrupted run got through, if it was not too long ago"""
+        try:
+            with open(self.checkpoint) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return set()
+
+        if checkpoint.get('updated', 0) < time.time() - CHECKPOINT_TTL:
+            return set()
+
+        return set(checkpoint.get('done', []))
+
+    def save_checkpoint(self):
+        # write it whole or not at all, the process may be killed any moment
+        tmp = '{}.tmp'.format(self.checkpoint)
+        with open(tmp, 'w') as f:
+            json.dump({'updated': time.time(), 'done': sorted(self.done)}, f)
+
+        os.replace(tmp, self.checkpoint)
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,132 @@
+from datetime import timedelta
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api.models import App, Operation
+from api.exceptions import AlreadyExists
+from api.reconcile import ClusterState, cost, drift, repair
+from api.utils import advisory_lock
+
+# seconds an application is left alone after it changed, so a deploy or scale still
+# underway is not mistaken for drift
+GRACE = 600
+
+
+class Command(BaseCommand):
+    """Management command for repairing Kubernetes objects that drifted from the database"""
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', default=False,
+            help='Make one pass right away and exit instead of repeating it'
+        )
+        parser.add_argument(
+            '--budget', type=int, default=settings.DEIS_RECONCILE_BUDGET,
+            help='Roughly how many writes to the API server a pass may spend on repairs'
+        )
+        parser.add_argument(
+            '--interval', type=int, default=settings.DEIS_RECONCILE_INTERVAL,
+            help='Seconds between passes, 0 turns reconciling off'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Only report what drifted'
+        )
+
+    def handle(self, *args, **options):
+        """Compare applications with kubernetes every so often and repair what drifted"""
+        if not options['once'] and not options['interval']:
+            print("Reconciling is turned off")
+            return
+
+        print("Reconciling kubernetes with the database...")
+        while True:
+            if not options['once']:
+                # load_db_state_to_k8s takes care of things right after a start
+                time.sleep(options['interval'])
+
+            # drop connections the database closed or that are past CONN_MAX_AGE
+            close_old_connections()
+            try:
+                # every controller replica runs this, only one of them makes a pass at a time
+                with advisory_lock('reconcile', wait=False) as locked:
+                    if locked:
+                        self.reconcile(options['budget'], options['dry_run'])
+                    else:
+                        print('Another controller is reconciling, skipped this pass')
+            except Exception as error:
+                # the API server may be unreachable for a bit, try again next pass
+                print('ERROR: reconcile pass failed: {}'.format(error))
+
+            if options['once']:
+                break
+
+    def reconcile(self, budget, dry_run=False):
+        """
+        Make one pass over all applications, repairing the cheapest differences first until
+        the budget of writes is spent. Returns how much of it was spent
+        """
+        # a few cluster wide lists, the cost of a pass grows with the drift found
+        state = ClusterState()
+        drifted = []
+        for app in App.objects.order_by('id'):
+            if self.busy(app):
+                continue
+
+            try:
+                differences = drift(app, state)
+            except Exception as error:
+                print('ERROR: could not compare {}: {}'.format(app, error))
+                continue
+
+            if differences:
+                drifted.append((cost(app, differences), app, differences))
+
+        drifted.sort(key=lambda item: item[0])
+        spent = 0
+        for position, (price, app, differences) in enumerate(drifted):
+            # a repair bigger than the whole budget still gets its turn at the start of a pass
+            if spent and spent + price > budget:
+                print('{} applications left for the next pass'.format(len(drifted) - position))
+                break
+
+            if dry_run:
+                print('{}: drifted {}'.format(app, ', '.join(differences)))
+                continue
+
+            # comparing takes a while, someone may have started changing it since
+            app.refresh_from_db()
+            if self.busy(app):
+                continue
+
+            self.repair(app, differences)
+            spent += price
+
+        return spent
+
+    def repair(self, app, differences):
+        """Repair one application, reporting how that went"""
+        try:
+            repair(app, differences)
+            print('{}: repaired {}'.format(app, ', '.join(differences)))
+        except AlreadyExists:
+            print('WARNING: {} has a deployment in progress, skipped'.format(app))
+        except Exception as error:
+            print('ERROR: could not repair {}: {}'.format(app, error))
+
+    def busy(self, app):
+        """Whether an application changed too recently or has operations waiting to run"""
+        recent = timezone.now() - timedelta(seconds=GRACE)
+        if app.updated > recent:
+            return True
+
+        for related in [app.release_set, app.appsettings_set, app.domain_set]:
+            if related.filter(created__gt=recent).exists():
+                return True
+
+        return Operation.objects.filter(
+            app=app, state__in=[Operation.QUEUED, Operation.RUNNING]
+        ).exists()
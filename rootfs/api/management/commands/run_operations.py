@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.models import Operation
+
+
+class Command(BaseCommand):
+    """Management command for running deploys, scaling and such queued by the API"""
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', default=False,
+            help='Run what is queued right now and exit instead of waiting for more'
+        )
+
+    def handle(self, *args, **options):
+        """Run queued operations one after the other, any number of workers can run"""
+        print("Running queued operations...")
+        while True:
+            # drop connections the database closed or that are past CONN_MAX_AGE
+            close_old_connections()
+            try:
+                operation = Operation.claim()
+                if operation is not None:
+                    operation.run()
+                    print('{} {}'.format(operation, operation.state))
+                    continue
+            except Exception as error:
+                # the database may be unreachable for a bit, try again after the interval
+                print('ERROR: running queued operations failed: {}'.format(error))
+
+            if options['once']:
+                break
+
+            time.sleep(settings.DEIS_OPERATIONS_POLL_INTERVAL)
@@ -3,7 +3,6 @@
 """
 Data models for the Deis API.
 """
-import importlib
 import logging
 import uuid
 import morph
@@ -19,7 +18,7 @@ from rest_framework.authtoken.models import Token
 
 from api.exceptions import DeisException, AlreadyExists, ServiceUnavailable, UnprocessableEntity  # noqa
 from api.utils import dict_merge
-from scheduler import KubeException
+from scheduler import KubeException, get_client, informers
 
 logger = logging.getLogger(__name__)
 
@@ -46,8 +45,12 @@ class AuditedModel(models.Model):
 
     @property
     def _scheduler(self):
-        mod = importlib.import_module(settings.SCHEDULER_MODULE)
-        return mod.SchedulerClient(settings.SCHEDULER_URL)
+        client = get_client(settings.SCHEDULER_URL, settings.SCHEDULER_MODULE)
+        if settings.KUBERNETES_INFORMER_CACHE:
+            # serve list reads from in-process caches kept fresh by watches
+            informers.start(client)
+
+        return client
 
     def _fetch_service_config(self, app):
         try:
@@ -81,19 +84,22 @@ class AuditedModel(models.Model):
         return config
 
     def _save_service_config(self, app, component, data):
-        # fetch setvice definition with minimum structure
-        svc = self._fetch_service_config(app)
+        """
+        Write service config as annotations on the application Service
 
+        Only the given keys are sent as a merge patch, so the Service does not have to
+        be fetched first and concurrent changes to other annotations are kept
+        """
         # always assume a .deis.io ending
         component = "%s.deis.io/" % component
 
         # add component to data and flatten
         data = {"%s%s" % (component, key): value for key, value in list(data.items())}
-        svc['metadata']['annotations'].update(morph.flatten(data))
+        annotations = morph.flatten(data)
 
         # Update the k8s service for the application with new service information
         try:
-            self._scheduler.svc.update(app, app, svc)
+            self._scheduler.svc.patch(app, app, {'metadata': {'annotations': annotations}})
         except KubeException as e:
             raise ServiceUnavailable('Could not update Kubernetes Service {}'.format(app)) from e
 
@@ -120,6 +126,7 @@ from .certificate import Certificate, validate_certificate  # noqa
 from .config import Config  # noqa
 from .domain import Domain  # noqa
 from .key import Key, validate_base64  # noqa
+from .operation import Operation  # noqa
 from .release import Release  # noqa
 from .tls import TLS  # noqa
 
@@ -1,6 +1,7 @@
 import backoff
 import base64
 from collections import OrderedDict
+import copy
 from datetime import datetime
 from docker.auth import auth as docker_auth
 import functools
@@ -29,10 +30,18 @@ from api.models.release import Release
 from api.models.tls import TLS
 from api.models.appsettings import AppSettings
 
-from scheduler import KubeHTTPException, KubeException
+from scheduler import KubeHTTPException, KubeException, progress
+from scheduler.utils import manifest_hash
 
 logger = logging.getLogger(__name__)
 
+# env vars that differ between every release, set on pods by value instead of through the
+# env secret, which then stays the same for releases that leave the config alone
+RELEASE_ENV_VARS = [
+    'WORKFLOW_RELEASE', 'WORKFLOW_RELEASE_SUMMARY', 'WORKFLOW_RELEASE_CREATED_AT',
+    'SOURCE_VERSION', 'SLUG_URL',
+]
+
 session = None
 
 
@@ -269,7 +278,13 @@ class App(UuidAuditedModel):
         """
         Restart found pods by deleting them (RC / Deployment will recreate).
         Wait until they are all drained away and RC / Deployment has gotten to a good state
+
+        With DEIS_RESTART_STRATEGY set to rolling anything but a single pod is restarted
+        by a rolling update of the Deployments instead, see _rolling_restart
         """
+        if 'name' not in kwargs and settings.DEIS_RESTART_STRATEGY == 'rolling':
+            return self._rolling_restart(**kwargs)
+
         try:
             # Resolve single pod name if short form (cmd-1269180282-1nyfz) is passed
             if 'name' in kwargs and kwargs['name'].count('-') == 2:
@@ -281,9 +296,9 @@ class App(UuidAuditedModel):
                 desired = 0
                 labels = self._scheduler_filter(**kwargs)
                 # fetch RS (which represent Deployments)
-                controllers = self._scheduler.rs.get(kwargs['id'], labels=labels)
+                controllers = self._scheduler.rs.items(kwargs['id'], labels=labels)
 
-                for controller in controllers.json()['items']:
+                for controller in controllers:
                     desired += controller['spec']['replicas']
         except KubeException:
             # Nothing was found
@@ -298,7 +313,8 @@ class App(UuidAuditedModel):
                 ) for pod in self.list_pods(**kwargs)
             ]
 
-            async_run(tasks)
+            # try to stop every pod even if some of them fail
+            async_run(tasks, fail_fast=False)
         except Exception as e:
             err = "warning, some pods failed to stop:\n{}".format(str(e))
             self.log(err, logging.WARNING)
@@ -344,6 +360,38 @@ class App(UuidAuditedModel):
         pods = self.list_pods(**kwargs)
         return pods
 
+    def _rolling_restart(self, **kwargs):
+        """
+        Restart the pods of every process type, or of the one given, by having their
+        Deployments roll them over in batches, so the application never runs short of pods
+        """
+        proc_types = [kwargs['type']] if 'type' in kwargs else list(self.structure)
+        proc_types = [proc_type for proc_type in proc_types if self.structure.get(proc_type)]
+        if not proc_types:
+            return []
+
+        release = self.release_set.filter(failed=False).latest()
+        app_settings = self.appsettings_set.latest()
+        tasks = [
+            functools.partial(
+                self._scheduler.deployment.restart,
+                self.id, self._get_job_id(proc_type),
+                **self._gather_app_settings(
+                    release, app_settings, proc_type, self.structure[proc_type], write=False
+                )
+            ) for proc_type in proc_types
+        ]
+
+        try:
+            async_run(tasks)
+        except Exception as e:
+            err = '(restart): {}'.format(e)
+            self.log(err, logging.ERROR)
+            raise ServiceUnavailable(err) from e
+
+        # the replaced pods may still be on their way out
+        return [pod for pod in self.list_pods(**kwargs) if pod['state'] != 'terminating']
+
     def _clean_app_logs(self):
         """Delete application logs stored by the logger component"""
         try:
@@ -356,11 +404,11 @@ class App(UuidAuditedModel):
             err = 'Error deleting existing application logs: {}'.format(e)
             self.log(err, logging.WARNING)
 
-    def scale(self, user, structure):  # noqa
-        """Scale containers up or down to match requested structure."""
-        # use create to make sure minimum resources are created
-        self.create()
-
+    def validate_structure(self, structure):
+        """
+        Check a requested scaling structure against the latest release, turning the counts
+        into integers in place
+        """
         if self.release_set.filter(failed=False).latest().build is None:
             raise DeisException('No build associated with this release')
 
@@ -384,6 +432,13 @@ class App(UuidAuditedModel):
                 raise NotFound(
                     'Container type {} does not exist in application'.format(container_type))
 
+    def scale(self, user, structure):  # noqa
+        """Scale containers up or down to match requested structure."""
+        # use create to make sure minimum resources are created
+        self.create()
+
+        self.validate_structure(structure)
+
         # merge current structure and the new items together
         old_structure = self.structure
         new_structure = old_structure.copy()
@@ -511,6 +566,9 @@ class App(UuidAuditedModel):
 
                 # otherwise just re-raise
                 raise
+            finally:
+                # how well the fan-out reused connections to the API server
+                self.log('connection pools: {}'.format(self._scheduler.pool_stats()), logging.DEBUG)  # noqa
         except Exception as e:
             # This gets shown to the end user
             err = '(app::deploy): {}'.format(e)
@@ -655,12 +713,14 @@ class App(UuidAuditedModel):
                 'Router was not ready to serve traffic to process type {} in time, waited {} seconds'.format(app_type, delta),  # noqa
                 level=logging.WARNING
             )
+            progress.emit(self.id, 'router', type=app_type, ready=False, waited=delta)
             return
 
         self.log(
             'Router is ready to serve traffic to process type {}'.format(app_type),
             level=logging.DEBUG
         )
+        progress.emit(self.id, 'router', type=app_type, ready=True, waited=round(time.time() - start))  # noqa
 
     @backoff.on_exception(backoff.expo, ServiceUnavailable, max_tries=3)
     def logs(self, log_lines=str(settings.LOG_LINES)):
@@ -691,10 +751,38 @@ class App(UuidAuditedModel):
         return str(r.content.decode('utf-8'))
 
     def run(self, user, command):
+        """Run a one-off command in an ephemeral app container."""
+        name, args, data = self._run_pod(user, command)
+        try:
+            exit_code, output = self._scheduler.run(self.id, name, *args, **data)
+
+            return exit_code, output
+        except Exception as e:
+            err = '{} (run): {}'.format(name, e)
+            raise ServiceUnavailable(err) from e
+
+    def run_stream(self, user, command):
+        """
+        Run a one-off command in an ephemeral app container, generating its output as it is
+        written and finally its exit code, see :meth:`scheduler.KubeHTTPClient.run_stream`
+        """
+        # fail right away when there is nothing to run
+        name, args, data = self._run_pod(user, command)
+
+        def stream():
+            try:
+                yield from self._scheduler.run_stream(self.id, name, *args, **data)
+            except Exception as e:
+                err = '{} (run): {}'.format(name, e)
+                raise ServiceUnavailable(err) from e
+
+        return stream()
+
+    def _run_pod(self, user, command):
+        """Work out the name, image, entrypoint, command and settings of a run pod"""
         def pod_name(size=5, chars=string.ascii_lowercase + string.digits):
             return ''.join(random.choice(chars) for _ in range(size))
 
-        """Run a one-off command in an ephemeral app container."""
         release = self.release_set.filter(failed=False).latest()
         if release.build is None:
             raise DeisException('No build associated with this release to run this command')
@@ -712,20 +800,7 @@ class App(UuidAuditedModel):
         name = self._get_job_id(scale_type) + '-' + pod_name()
         self.log("{} on {} runs '{}'".format(user.username, name, command))
 
-        try:
-            exit_code, output = self._scheduler.run(
-                self.id,
-                name,
-                image,
-                self._get_entrypoint(scale_type),
-                [command],
-                **data
-            )
-
-            return exit_code, output
-        except Exception as e:
-            err = '{} (run): {}'.format(name, e)
-            raise ServiceUnavailable(err) from e
+        return name, (image, self._get_entrypoint(scale_type), [command]), data
 
     def list_pods(self, *args, **kwargs):
         """Used to list basic information about pods running for a given application"""
@@ -736,7 +811,7 @@ class App(UuidAuditedModel):
             if 'name' in kwargs:
                 pods = [self._scheduler.pod.get(self.id, kwargs['name']).json()]
             else:
-                pods = self._scheduler.pod.get(self.id, labels=labels).json()['items']
+                pods = self._scheduler.pod.items(self.id, labels=labels)
 
             data = []
             for p in pods:
@@ -836,80 +911,68 @@ class App(UuidAuditedModel):
         """
         Turn application maintenance mode on/off
         """
-        service = self._fetch_service_config(self.id)
-        old_service = service.copy()  # in case anything fails for rollback
-
+        data = {'metadata': {'annotations': {'router.deis.io/maintenance': str(mode).lower()}}}
         try:
-            service['metadata']['annotations']['router.deis.io/maintenance'] = str(mode).lower()
-            self._scheduler.svc.update(self.id, self.id, data=service)
+            self._scheduler.svc.patch(self.id, self.id, data)
         except KubeException as e:
-            self._scheduler.svc.update(self.id, self.id, data=old_service)
             raise ServiceUnavailable(str(e)) from e
 
     def routable(self, routable):
         """
         Turn on/off if an application is publically routable
         """
-        service = self._fetch_service_config(self.id)
-        old_service = service.copy()  # in case anything fails for rollback
-
+        data = {'metadata': {'labels': {'router.deis.io/routable': str(routable).lower()}}}
         try:
-            service['metadata']['labels']['router.deis.io/routable'] = str(routable).lower()
-            self._scheduler.svc.update(self.id, self.id, data=service)
+            self._scheduler.svc.patch(self.id, self.id, data)
         except KubeException as e:
-            self._scheduler.svc.update(self.id, self.id, data=old_service)
             raise ServiceUnavailable(str(e)) from e
 
     def _update_application_service(self, namespace, app_type, port, routable=False, annotations={}):  # noqa
         """Update application service with all the various required information"""
         service = self._fetch_service_config(namespace)
-        old_service = service.copy()  # in case anything fails for rollback
 
         try:
-            # Update service information
-            for key, value in annotations.items():
-                if value is not None:
-                    service['metadata']['annotations']['router.deis.io/%s' % key] = str(value)
-                else:
-                    service['metadata']['annotations'].pop('router.deis.io/%s' % key, None)
-            if routable:
-                service['metadata']['labels']['router.deis.io/routable'] = 'true'
-            else:
-                # delete the annotation
-                service['metadata']['labels'].pop('router.deis.io/routable', None)
+            # Update service information, a key set to None is removed by the patch
+            data = {
+                'metadata': {
+                    'annotations': {
+                        'router.deis.io/%s' % key: str(value) if value is not None else None
+                        for key, value in annotations.items()
+                    },
+                    # delete the label if not routable
+                    'labels': {'router.deis.io/routable': 'true' if routable else None},
+                },
+            }
 
             # Set app type if there is not one available
             if 'type' not in service['spec']['selector']:
-                service['spec']['selector']['type'] = app_type
+                data['spec'] = {'selector': {'type': app_type}}
 
-            # Find if target port exists already, update / create as required
+            # Find if target port exists already, update as required
             if routable:
-                for pos, item in enumerate(service['spec']['ports']):
+                ports = copy.deepcopy(service['spec']['ports'])
+                for item in ports:
                     if item['port'] == 80 and port != item['targetPort']:
                         # port 80 is the only one we care about right now
-                        service['spec']['ports'][pos]['targetPort'] = int(port)
+                        item['targetPort'] = int(port)
 
-            self._scheduler.svc.update(namespace, namespace, data=service)
+                if ports != service['spec']['ports']:
+                    # ports are merged on their port number
+                    data.setdefault('spec', {})['ports'] = ports
+
+            self._scheduler.svc.patch(namespace, namespace, data, strategic=True, current=service)
         except Exception as e:
-            # Fix service to old port and app type
-            self._scheduler.svc.update(namespace, namespace, data=old_service)
             raise ServiceUnavailable(str(e)) from e
 
     def whitelist(self, whitelist):
         """
         Add/ Delete addresses to application whitelist
         """
-        service = self._fetch_service_config(self.id)
-
+        # an empty whitelist removes the annotation
+        addresses = ",".join(address for address in whitelist) if whitelist else None
+        data = {'metadata': {'annotations': {'router.deis.io/whitelist': addresses}}}
         try:
-            if whitelist:
-                addresses = ",".join(address for address in whitelist)
-                service['metadata']['annotations']['router.deis.io/whitelist'] = addresses
-            elif 'router.deis.io/whitelist' in service['metadata']['annotations']:
-                service['metadata']['annotations'].pop('router.deis.io/whitelist', None)
-            else:
-                return
-            self._scheduler.svc.update(self.id, self.id, data=service)
+            self._scheduler.svc.patch(self.id, self.id, data)
         except KubeException as e:
             raise ServiceUnavailable(str(e)) from e
 
@@ -923,12 +986,12 @@ class App(UuidAuditedModel):
 
         try:
             # get the target for autoscaler, in this case Deployment
-            self._scheduler.hpa.get(self.id, name)
+            current = self._scheduler.hpa.get(self.id, name).json()
             if autoscale is None:
                 self._scheduler.hpa.delete(self.id, name)
             else:
                 self._scheduler.hpa.update(
-                    self.id, name, proc_type, target, **autoscale
+                    self.id, name, proc_type, target, current=current, **autoscale
                 )
         except KubeHTTPException as e:
             if e.response.status_code == 404:
@@ -939,18 +1002,20 @@ class App(UuidAuditedModel):
                 # let the user know about any other errors
                 raise ServiceUnavailable(str(e)) from e
 
-    def image_pull_secret(self, namespace, registry, image):
+    def image_pull_secret(self, namespace, registry, image, write=True):
         """
         Take registry information and set as an imagePullSecret for an RC / Deployment
         http://kubernetes.io/docs/user-guide/images/#specifying-imagepullsecrets-on-a-pod
+
+        With write unset only the name of the secret is worked out
         """
         docker_config, name, create = self._get_private_registry_config(image, registry)
         if create is None:
             return
-        elif create:
+        elif create and write:
             data = {'.dockerconfigjson': docker_config}
             try:
-                self._scheduler.secret.get(namespace, name)
+                current = self._scheduler.secret.get(namespace, name).json()
             except KubeHTTPException:
                 self._scheduler.secret.create(
                     namespace,
@@ -963,7 +1028,8 @@ class App(UuidAuditedModel):
                     namespace,
                     name,
                     data,
-                    secret_type='kubernetes.io/dockerconfigjson'
+                    secret_type='kubernetes.io/dockerconfigjson',
+                    current=current
                 )
 
         return name
@@ -1006,12 +1072,13 @@ class App(UuidAuditedModel):
         })
         return docker_config, name, True
 
-    def _gather_app_settings(self, release, app_settings, process_type, replicas):
+    def _gather_app_settings(self, release, app_settings, process_type, replicas, write=True):
         """
         Gathers all required information needed in one easy place for passing into
         the Kubernetes client to deploy an application
 
-        Any global setting that can also be set per app goes here
+        Any global setting that can also be set per app goes here. Unless write is unset the
+        image pull secret is created or updated on the way
         """
         envs = self._build_env_vars(release)
         config = release.config
@@ -1032,7 +1099,7 @@ class App(UuidAuditedModel):
         image_pull_policy = config.values.get('IMAGE_PULL_POLICY', settings.IMAGE_PULL_POLICY)
 
         # create image pull secret if needed
-        image_pull_secret_name = self.image_pull_secret(self.id, config.registry, release.image)
+        image_pull_secret_name = self.image_pull_secret(self.id, config.registry, release.image, write)  # noqa
 
         # only web / cmd are routable
         # http://docs.deis.io/en/latest/using_deis/process-types/#web-vs-cmd-process-types
@@ -1060,36 +1127,72 @@ class App(UuidAuditedModel):
             'release_summary': release.summary,
             'pod_termination_grace_period_seconds': pod_termination_grace_period_seconds,
             'image_pull_secret_name': image_pull_secret_name,
-            'image_pull_policy': image_pull_policy
+            'image_pull_policy': image_pull_policy,
+            'env_secret_name': self._env_secret(release, envs)[0],
+            'env_values': self._release_env_vars(release, envs),
         }
 
     def set_application_config(self, release):
         """
-        Creates the application config as a secret in Kubernetes and
-        updates it if it already exists
+        Creates the application config as a secret in Kubernetes, unless a secret with the
+        same config is there already
+
+        The secret is named after its content and never changed, so releases that leave the
+        environment alone share it with the release before them
         """
-        # env vars are stored in secrets and mapped to env in k8s
-        version = 'v{}'.format(release.version)
+        secret_name, secrets_env, labels = self._env_secret(release)
+        manifest = self._scheduler.secret.manifest(
+            self.id, secret_name, secrets_env, labels=labels, immutable=True
+        )
         try:
-            labels = {
-                'version': version,
-                'type': 'env'
-            }
+            # compare the manifest hash, the API server hands the data back base64 encoded
+            current = self._scheduler.secret.get(self.id, secret_name).json()
+            if self._scheduler.secret.unchanged(current, manifest):
+                return
 
-            # secrets use dns labels for keys, map those properly here
-            secrets_env = {}
-            for key, value in self._build_env_vars(release).items():
+            # changed behind the back of Deis, immutable secrets can only be replaced
+            self._scheduler.secret.delete(self.id, secret_name)
+        except KubeHTTPException:
+            pass
+
+        try:
+            self._scheduler.secret.create(
+                self.id, secret_name, secrets_env, labels=labels, immutable=True
+            )
+        except KubeHTTPException as e:
+            # a concurrent deploy with the same config got there first
+            if e.response.status_code != 409:
+                raise
+
+    def _env_secret(self, release, envs=None):
+        """
+        The name, data and labels of the secret holding the env vars of a release, named
+        after a hash of the data
+        """
+        if envs is None:
+            envs = self._build_env_vars(release)
+
+        # secrets use dns labels for keys, map those properly here
+        secrets_env = {}
+        by_value = self._release_env_vars(release, envs)
+        for key, value in envs.items():
+            if key not in by_value:
                 secrets_env[key.lower().replace('_', '-')] = str(value)
 
-            # dictionary sorted by key
-            secrets_env = OrderedDict(sorted(secrets_env.items(), key=lambda t: t[0]))
+        # dictionary sorted by key
+        secrets_env = OrderedDict(sorted(secrets_env.items(), key=lambda t: t[0]))
 
-            secret_name = "{}-{}-env".format(self.id, version)
-            self._scheduler.secret.get(self.id, secret_name)
-        except KubeHTTPException:
-            self._scheduler.secret.create(self.id, secret_name, secrets_env, labels=labels)
-        else:
-            self._scheduler.secret.update(self.id, secret_name, secrets_env, labels=labels)
+        digest = manifest_hash(secrets_env)[:16]
+        labels = {'type': 'env', 'env-hash': digest}
+        return "{}-env-{}".format(self.id, digest), secrets_env, labels
+
+    def _release_env_vars(self, release, envs):
+        """The env vars of a release that are set on pods by value, see RELEASE_ENV_VARS"""
+        return {
+            key: envs[key] for key in RELEASE_ENV_VARS
+            # set by the user, so part of the config
+            if key in envs and key not in release.config.values
+        }
 
     def create_object_store_secret(self):
         try:
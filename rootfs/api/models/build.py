@@ -52,7 +52,11 @@ class Build(UuidAuditedModel):
     def version(self):
         return 'git-{}'.format(self.sha) if self.source_based else 'latest'
 
-    def create(self, user, *args, **kwargs):
+    def create(self, user, *args, deploy=True, **kwargs):
+        """
+        Create a release out of this build and roll it out, unless deploy is False in
+        which case the caller takes care of the rollout
+        """
         latest_release = self.app.release_set.filter(failed=False).latest()
         latest_version = self.app.release_set.latest().version
         try:
@@ -62,7 +66,9 @@ class Build(UuidAuditedModel):
                 config=latest_release.config,
                 source_version=self.version
             )
-            self.app.deploy(new_release)
+            if deploy:
+                self.app.deploy(new_release)
+
             return new_release
         except Exception as e:
             # check if the exception is during create or publish
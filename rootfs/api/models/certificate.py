@@ -196,21 +196,7 @@ class Certificate(AuditedModel):
                           '{} for {}'.format(name, namespace)
                     raise ServiceUnavailable(msg) from e
 
-        # get config for the service
-        config = self._load_service_config(namespace, 'router')
-
-        # See if certificates are available
-        if 'certificates' not in config:
-            config['certificates'] = ''
-
-        # convert from string to list to work with and filter out empty strings
-        cert = '{}:{}'.format(domain.domain, self.name)
-        certificates = [_f for _f in config['certificates'].split(',') if _f]
-        if cert not in certificates:
-            certificates.append(cert)
-        config['certificates'] = ','.join(certificates)
-
-        self._save_service_config(namespace, 'router', config)
+        self._save_certificates(domain.app)
 
     def detach(self, *args, **kwargs):
         # remove the certificate from the domain
@@ -230,18 +216,16 @@ class Certificate(AuditedModel):
             except KubeException as e:
                 raise ServiceUnavailable("Could not delete certificate secret {} for application {}".format(name, namespace)) from e  # noqa
 
-        # get config for the service
-        config = self._load_service_config(namespace, 'router')
-
-        # See if certificates are available
-        if 'certificates' not in config:
-            config['certificates'] = ''
+        self._save_certificates(domain.app)
 
-        # convert from string to list to work with and filter out empty strings
-        cert = '{}:{}'.format(domain.domain, self.name)
-        certificates = [_f for _f in config['certificates'].split(',') if _f]
-        if cert in certificates:
-            certificates.remove(cert)
-        config['certificates'] = ','.join(certificates)
+    def _save_certificates(self, app):
+        """
+        Write which certificate each domain of the app uses to the router config
 
-        self._save_service_config(namespace, 'router', config)
+        The database is the source of truth, so the Service does not have to be read first
+        """
+        domains = Domain.objects.filter(app=app, certificate__isnull=False)
+        certificates = sorted(
+            '{}:{}'.format(domain.domain, domain.certificate.name) for domain in domains
+        )
+        self._save_service_config(app.id, 'router', {'certificates': ','.join(certificates)})
@@ -93,9 +93,8 @@ class Config(UuidAuditedModel):
         if not self.tags:
             return
 
-        # Get all nodes with label selectors
-        nodes = self._scheduler.node.get(labels=self.tags).json()
-        if nodes['items']:
+        # See if any nodes have the labels
+        if self._scheduler.node.count(labels=self.tags):
             return
 
         labels = ['{}={}'.format(key, value) for key, value in self.tags.items()]
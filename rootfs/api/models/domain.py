@@ -25,21 +25,11 @@ class Domain(AuditedModel):
 
     def save(self, *args, **kwargs):
         app = str(self.app)
-        domain = str(self.domain)
-
-        # get config for the service
-        config = self._load_service_config(app, 'router')
-
-        # See if domains are available
-        if 'domains' not in config:
-            config['domains'] = ''
-
-        # convert from string to list to work with and filter out empty strings
-        domains = [_f for _f in config['domains'].split(',') if _f]
-        if domain not in domains:
-            domains.append(domain)
-        config['domains'] = ','.join(domains)
+        domains = self._other_domains()
+        domains.add(str(self.domain))
 
+        # the database knows all domains, no need to read the service first
+        config = {'domains': ','.join(sorted(domains))}
         self._save_service_config(app, 'router', config)
 
         # Save to DB
@@ -47,21 +37,9 @@ class Domain(AuditedModel):
 
     def delete(self, *args, **kwargs):
         app = str(self.app)
-        domain = str(self.domain)
-
-        # get config for the service
-        config = self._load_service_config(app, 'router')
-
-        # See if domains are available
-        if 'domains' not in config:
-            config['domains'] = ''
-
-        # convert from string to list to work with and filter out empty strings
-        domains = [_f for _f in config['domains'].split(',') if _f]
-        if domain in domains:
-            domains.remove(domain)
-        config['domains'] = ','.join(domains)
+        domains = self._other_domains()
 
+        config = {'domains': ','.join(sorted(domains))}
         self._save_service_config(app, 'router', config)
 
         # Deatch cert, updates k8s
@@ -71,5 +49,10 @@ class Domain(AuditedModel):
         # Delete from DB
         return super(Domain, self).delete(*args, **kwargs)
 
+    def _other_domains(self):
+        """All other domains of the app as stored in the database"""
+        domains = Domain.objects.filter(app=self.app).exclude(pk=self.pk)
+        return set(domains.values_list('domain', flat=True))
+
     def __str__(self):
         return self.domain
@@ -0,0 +1,160 @@
+from datetime import timedelta
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Q
+from django.utils import timezone
+from jsonfield import JSONField
+
+from api.models import UuidAuditedModel
+from api.exceptions import DeisException
+from api.utils import advisory_lock_key
+
+logger = logging.getLogger(__name__)
+
+
+class Operation(UuidAuditedModel):
+    """
+    A deploy, build, scale or restart of an application queued to be run by a worker
+    (see the run_operations management command) instead of inside the HTTP request
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    SUPERSEDED = 'superseded'
+    STATES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (SUPERSEDED, 'Superseded'),
+    )
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    app = models.ForeignKey('App', on_delete=models.CASCADE)
+    # deploy, build, scale or restart
+    type = models.CharField(max_length=32)
+    # arguments for the action, such as the release version for a deploy
+    params = JSONField(default={}, blank=True)
+    state = models.CharField(max_length=16, choices=STATES, default=QUEUED, db_index=True)
+    result = JSONField(default={}, blank=True)
+    error = models.TextField(blank=True)
+    # not to be run before this time, so later changes can supersede it
+    run_after = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        get_latest_by = 'created'
+        ordering = ['-created']
+
+    def __str__(self):
+        return "{}-{}-{}".format(self.app.id, self.type, str(self.uuid)[:7])
+
+    @classmethod
+    def deploy(cls, owner, release):
+        """
+        Queue the rollout of a release, superseding rollouts of the application that are
+        still waiting to run so only the newest release is actually rolled out
+
+        The rollout is held back for DEIS_DEPLOY_COALESCE_WINDOW seconds, and every newer
+        release starts that window anew
+        """
+        run_after = timezone.now() + timedelta(seconds=settings.DEIS_DEPLOY_COALESCE_WINDOW)
+        with transaction.atomic():
+            cls.objects.filter(app=release.app, type='deploy', state=cls.QUEUED).update(
+                state=cls.SUPERSEDED, result={'superseded_by': {'version': release.version}}
+            )
+            return cls.objects.create(
+                owner=owner, app=release.app, type='deploy',
+                params={'release': release.version}, run_after=run_after
+            )
+
+    @classmethod
+    def claim(cls):
+        """
+        Take the oldest queued operation off the queue, None if there is nothing to do
+
+        Workers claim one at a time, holding an advisory lock until the claim is committed,
+        so only one operation per application runs at a time. Running operations whose
+        worker stopped renewing their lease are put back on the queue first
+        """
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [advisory_lock_key('operations')])  # noqa
+
+            expired = timezone.now() - timedelta(seconds=settings.DEIS_OPERATIONS_LEASE)
+            for operation in cls.objects.filter(state=cls.RUNNING, updated__lt=expired):
+                logger.warning('{} operation {} was abandoned, queueing it again'.format(
+                    operation.type, operation.uuid
+                ))
+                operation.state = cls.QUEUED
+                operation.save()
+
+            running = cls.objects.filter(state=cls.RUNNING).values('app')
+            due = Q(run_after__isnull=True) | Q(run_after__lte=timezone.now())
+            operation = cls.objects.filter(
+                due, state=cls.QUEUED
+            ).exclude(app__in=running).order_by('created').first()
+            if operation is None:
+                return None
+
+            operation.state = cls.RUNNING
+            operation.save()
+            return operation
+
+    def run(self):
+        """Carry out the operation, recording how it went"""
+        self.app.log('running {} operation {}'.format(self.type, self.uuid))
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._renew_lease, args=(stop,), daemon=True)
+        heartbeat.start()
+        try:
+            self.result = getattr(self, '_run_{}'.format(self.type))(**self.params) or {}
+            self.state = self.SUCCEEDED
+        except Exception as e:
+            logger.exception('{} operation {} failed'.format(self.type, self.uuid))
+            self.state = self.FAILED
+            self.error = str(e)
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        self.save()
+
+    def _renew_lease(self, stop):
+        """Show other workers the operation is still being worked on, until stop is set"""
+        try:
+            while not stop.wait(settings.DEIS_OPERATIONS_LEASE / 3):
+                Operation.objects.filter(pk=self.pk, state=self.RUNNING).update(
+                    updated=timezone.now()
+                )
+        except Exception:
+            logger.exception('could not renew the lease of operation {}'.format(self.uuid))
+        finally:
+            # every thread gets a connection of its own
+            connection.close()
+
+    def _run_build(self, build):
+        new_release = self.app.build_set.get(uuid=build).create(self.owner)
+        return {'release': {'version': new_release.version}}
+
+    def _run_deploy(self, release):
+        release = self.app.release_set.get(version=release)
+        try:
+            self.app.deploy(release)
+        except Exception as e:
+            release.failed = True
+            release.summary = "{} deployed a config that failed".format(self.owner)
+            release.save()
+            raise DeisException(str(e)) from e
+
+        return {'release': {'version': release.version}}
+
+    def _run_scale(self, structure):
+        self.app.scale(self.owner, structure)
+
+    def _run_restart(self, **kwargs):
+        return {'pods': self.app.restart(id=self.app.id, **kwargs)}
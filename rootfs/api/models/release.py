@@ -3,11 +3,10 @@ import logging
 from django.conf import settings
 from django.db import models
 
-from registry import publish_release, get_port as docker_get_port, RegistryException
+from registry import publish_release, get_port as docker_get_port, pin_image, RegistryException
 from api.utils import dict_diff
 from api.models import UuidAuditedModel
 from api.exceptions import DeisException, AlreadyExists
-from scheduler import KubeHTTPException
 
 logger = logging.getLogger(__name__)
 
@@ -135,6 +134,36 @@ class Release(UuidAuditedModel):
         deis_registry = bool(self.build.source_based)
         publish_release(source_image, self.image, deis_registry, self.get_registry_auth())
 
+    def promote(self, user, app):
+        """
+        Create a build (and with it a release) of another application out of the image
+        this release has published already and deploy it, without moving any image layers
+        """
+        if self.build is None:
+            raise DeisException('No build associated with release v{} of {} to promote'.format(self.version, self.app))  # noqa
+
+        image = self.image
+        if (
+            self.build.type != 'buildpack' and
+            settings.REGISTRY_API_INSPECT and
+            image.startswith(settings.REGISTRY_URL)
+        ):
+            try:
+                # use the exact image that was published even if the tag is moved later on
+                image = pin_image(image, bool(self.build.source_based))
+            except RegistryException as e:
+                self.app.log('Could not pin {} to a digest: {}'.format(image, e), logging.WARNING)  # noqa
+
+        # the image already lives in the registry, so publishing it is a no-op
+        build = app.build_set.create(
+            owner=user,
+            image=image,
+            sha=self.build.sha,
+            procfile=self.build.procfile,
+            dockerfile=self.build.dockerfile
+        )
+        return build.create(user)
+
     def get_port(self):
         """
         Get application port for a given release. If pulling from private registry
@@ -263,8 +292,8 @@ class Release(UuidAuditedModel):
         # Cleanup controllers
         labels = {'heritage': 'deis'}
         controller_removal = []
-        controllers = self._scheduler.rc.get(self.app.id, labels=labels).json()
-        for controller in controllers['items']:
+        controllers = self._scheduler.rc.items(self.app.id, labels=labels)
+        for controller in controllers:
             current_version = controller['metadata']['labels']['version']
             # skip the latest release
             if current_version == latest_version:
@@ -287,60 +316,52 @@ class Release(UuidAuditedModel):
         # handle Deployments specific cleanups
         self._cleanup_deployment_secrets_and_configs(self.app.id)
 
-        # Remove stray pods
-        labels = {'heritage': 'deis'}
-        pods = self._scheduler.pod.get(self.app.id, labels=labels).json()
-        for pod in pods['items']:
-            if self._scheduler.pod.deleted(pod):
-                continue
-
-            current_version = pod['metadata']['labels']['version']
-            # skip the latest release
-            if current_version == latest_version:
-                continue
-
-            try:
-                self._scheduler.pod.delete(self.app.id, pod['metadata']['name'])
-            except KubeHTTPException as e:
-                # Sometimes k8s will manage to remove the pod from under us
-                if e.response.status_code == 404:
-                    continue
+        # Remove stray pods, all at once
+        labels = {
+            'heritage': 'deis',
+            # http://kubernetes.io/docs/user-guide/labels/#set-based-requirement
+            'version': None,
+            'version__notin': [latest_version],
+        }
+        self._scheduler.pod.delete_collection(self.app.id, labels=labels)
 
     def _cleanup_deployment_secrets_and_configs(self, namespace):
         """
         Clean up any environment secrets (and in the future ConfigMaps) that
-        are tied to a release Deployments no longer track
+        no ReplicaSet refers to anymore
 
-        This is done by checking the available ReplicaSets and only removing
-        objects not attached to anything. This will allow releases done outside
+        Env secrets are shared by every release with the same config, so they are
+        counted by the references in the pod templates of the available ReplicaSets
+        instead of going by release version. This will allow releases done outside
         of Deis Controller
         """
-
-        # Find all ReplicaSets
-        versions = []
+        # the latest release is always kept in case the ReplicaSets were read from a cache
+        # that has not caught up with the Deployment yet
+        in_use = {self.app._env_secret(self)[0]}
         labels = {'heritage': 'deis', 'app': namespace}
-        replicasets = self._scheduler.rs.get(namespace, labels=labels).json()
-        for replicaset in replicasets['items']:
-            if (
-                'version' not in replicaset['metadata']['labels'] or
-                replicaset['metadata']['labels']['version'] in versions
-            ):
-                continue
-
-            versions.append(replicaset['metadata']['labels']['version'])
-
-        # find all env secrets not owned by any replicaset
-        labels = {
-            'heritage': 'deis',
-            'app': namespace,
-            'type': 'env',
-            # http://kubernetes.io/docs/user-guide/labels/#set-based-requirement
-            'version__notin': versions
-        }
+        for replicaset in self._scheduler.rs.items(namespace, labels=labels):
+            for container in replicaset['spec']['template']['spec'].get('containers', []):
+                for env in container.get('env', []):
+                    reference = env.get('valueFrom', {}).get('secretKeyRef')
+                    if reference is not None:
+                        in_use.add(reference['name'])
+
+        # env secrets are named <app>-env-<hash>, or <app>-<version>-env before that
+        hashes, versions = [], []
+        for name in in_use:
+            if name.startswith('{}-env-'.format(namespace)):
+                hashes.append(name[len(namespace) + 5:])
+            elif name.startswith('{}-v'.format(namespace)) and name.endswith('-env'):
+                versions.append(name[len(namespace) + 1:-4])
+
+        # delete the ones not referenced, one request for each naming
         self.app.log('Cleaning up orphaned env var secrets for application {}'.format(namespace), level=logging.DEBUG)  # noqa
-        secrets = self._scheduler.secret.get(namespace, labels=labels).json()
-        for secret in secrets['items']:
-            self._scheduler.secret.delete(namespace, secret['metadata']['name'])
+        for key, values in [('env-hash', hashes), ('version', versions)]:
+            labels = {'heritage': 'deis', 'app': namespace, 'type': 'env', key: None}
+            if values:
+                labels[key + '__notin'] = values
+
+            self._scheduler.secret.delete_collection(namespace, labels=labels)
 
     def _delete_release_in_scheduler(self, namespace, version):
         """
@@ -358,8 +379,7 @@ class Release(UuidAuditedModel):
         # see if the app config has deploy timeout preference, otherwise use global
         timeout = self.config.values.get('DEIS_DEPLOY_TIMEOUT', settings.DEIS_DEPLOY_TIMEOUT)
 
-        controllers = self._scheduler.rc.get(namespace, labels=labels).json()
-        for controller in controllers['items']:
+        for controller in self._scheduler.rc.items(namespace, labels=labels):
             # Deployment takes care of this in the API, RC does not
             # Have the RC scale down pods and delete itself
             self._scheduler.rc.scale(namespace, controller['metadata']['name'], 0, timeout)
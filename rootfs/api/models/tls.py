@@ -37,18 +37,8 @@ class TLS(UuidAuditedModel):
         app = str(self.app)
         https_enforced = bool(self.https_enforced)
 
-        # get config for the service
-        config = self._load_service_config(app, 'router')
-
-        # See if the ssl.enforce annotation is available
-        if 'ssl' not in config:
-            config['ssl'] = {}
-        if 'enforce' not in config['ssl']:
-            config['ssl']['enforce'] = 'false'
-
-        # convert from bool to string
-        config['ssl']['enforce'] = str(https_enforced)
-
+        # convert from bool to string, nothing else in the config has to be read
+        config = {'ssl': {'enforce': str(https_enforced)}}
         self._save_service_config(app, 'router', config)
 
         # Save to DB
@@ -0,0 +1,276 @@
+"""
+Reconciliation of the Kubernetes objects of applications with the database
+
+The database is the source of truth. What Kubernetes has is read with a handful of
+cluster wide list calls (see ClusterState) and compared with what the database says an
+application should have (see desired() and drift()), so only applications that drifted
+get anything written to Kubernetes for them (see repair()), instead of every application
+being redeployed.
+"""
+import base64
+
+from django.conf import settings
+
+from api.models import Release
+from scheduler import get_client
+
+# what Deis labels every object it creates with
+SELECTOR = {'heritage': 'deis'}
+
+
+class ClusterState(object):
+    """The Deis managed objects in Kubernetes as found by a few cluster wide list calls"""
+
+    def __init__(self, scheduler=None):
+        if scheduler is None:
+            scheduler = get_client(settings.SCHEDULER_URL, settings.SCHEDULER_MODULE)
+
+        self.namespaces = {
+            item['metadata']['name'] for item in scheduler.ns.all_items(labels=SELECTOR)
+        }
+        # (namespace, name) -> object
+        self.services = self._index(scheduler.svc.all_items(labels=SELECTOR))
+        self.deployments = self._index(scheduler.deployment.all_items(labels=SELECTOR))
+        self.autoscalers = self._index(scheduler.hpa.all_items(labels=SELECTOR))
+        # (namespace, name) -> data, base64 encoded as the API server hands it out
+        self.secrets = {
+            key: item.get('data') or {}
+            for key, item in self._index(scheduler.secret.all_items(labels=SELECTOR)).items()
+        }
+
+    @staticmethod
+    def _index(items):
+        return {
+            (item['metadata']['namespace'], item['metadata']['name']): item for item in items
+        }
+
+
+def desired(app, release=None):
+    """
+    Work out what the database says an application should have in Kubernetes, the way a
+    deploy of the release would write it but without writing anything
+
+    Returns the router annotations of the service and, if there is a release with a build,
+    the Deployment manifests, the name and data of the env secret and the autoscaling
+    rules, all by object name
+    """
+    app_settings = app.appsettings_set.latest()
+    domains = app.domain_set.all()
+    want = {
+        'annotations': {
+            'router.deis.io/domains': ','.join(sorted(domain.domain for domain in domains)),
+            'router.deis.io/certificates': ','.join(sorted(
+                '{}:{}'.format(domain.domain, domain.certificate.name)
+                for domain in domains if domain.certificate is not None
+            )),
+        },
+    }
+    if release is None or release.build is None:
+        return want
+
+    # only written by deploys of routable process types
+    if 'web' in app.structure or 'cmd' in app.structure:
+        whitelist = ','.join(app_settings.whitelist) if app_settings.whitelist else None
+        want['annotations']['router.deis.io/maintenance'] = str(app_settings.maintenance)
+        want['annotations']['router.deis.io/whitelist'] = whitelist
+
+    # use slugrunner image for app if buildpack app otherwise use normal image
+    image = settings.SLUGRUNNER_IMAGE if release.build.type == 'buildpack' else release.image
+    want['deployments'] = {}
+    for proc_type, replicas in app.structure.items():
+        kwargs = app._gather_app_settings(release, app_settings, proc_type, replicas, write=False)  # noqa
+        name = app._get_job_id(proc_type)
+        want['deployments'][name] = app._scheduler.deployment.manifest(
+            app.id, name, image,
+            app._get_entrypoint(proc_type), app._get_command(proc_type),
+            **kwargs
+        )
+
+    secret_name, secret_data, _ = app._env_secret(release)
+    want['env'] = (secret_name, dict(secret_data))
+    want['autoscale'] = {
+        app._get_job_id(proc_type): rule
+        for proc_type, rule in app_settings.autoscale.items() if rule
+    }
+
+    return want
+
+
+def drift(app, state):
+    """
+    Compare an application in the database with the cluster state, returning what differs
+    as a list of short descriptions, empty if the application is in sync
+    """
+    if app.id not in state.namespaces:
+        # nothing else can be there either
+        return ['namespace']
+
+    try:
+        release = app.release_set.filter(failed=False).latest()
+    except Release.DoesNotExist:
+        release = None
+
+    differences = []
+    if release is not None and release.build is not None and not app.structure:
+        # never deployed
+        differences.append('deployments')
+        release = None
+
+    want = desired(app, release)
+    service = state.services.get((app.id, app.id))
+    if service is None:
+        differences.append('service')
+    else:
+        differences.extend(_service_drift(app, state, service, want['annotations']))
+
+    if 'deployments' not in want:
+        return differences
+
+    secret_name, secret_data = want['env']
+    secret = state.secrets.get((app.id, secret_name))
+    if secret is None or _decode(secret) != secret_data:
+        differences.append('config')
+
+    differences.extend(_workload_drift(app, state, want))
+    return differences
+
+
+def cost(app, differences):
+    """Roughly how many writes to the API server repair() needs for the differences"""
+    if 'namespace' in differences or 'service' in differences or _redeploy(differences):
+        # a deploy writes the secrets, every Deployment and the service
+        return len(app.structure) + 3
+
+    total = 0
+    for item in differences:
+        if item == 'certificates':
+            total += app.domain_set.filter(certificate__isnull=False).count() + 1
+        elif item == 'router' or item.endswith(' replicas'):
+            # maintenance and whitelist, or the env secret and the Deployment
+            total += 2
+        else:
+            total += 1
+
+    return total
+
+
+def repair(app, differences):
+    """Write what drift() found to be different to Kubernetes, from the database"""
+    # a new namespace or service starts out empty
+    recreate = 'namespace' in differences or 'service' in differences
+    if recreate:
+        # makes sure the namespace and service exist
+        app.save()
+
+    if recreate or 'domains' in differences:
+        # saving one domain writes all of them
+        domain = app.domain_set.first()
+        if domain is not None:
+            domain.save()
+
+    if recreate or 'certificates' in differences:
+        for domain in app.domain_set.filter(certificate__isnull=False):
+            domain.certificate.attach_in_kubernetes(domain)
+
+    app_settings = app.appsettings_set.latest()
+    if recreate or _redeploy(differences):
+        release = app.release_set.filter(failed=False).latest()
+        if release.build is not None:
+            # also takes care of the router annotations and replicas
+            app.deploy(release)
+    else:
+        if 'router' in differences:
+            app.maintenance_mode(app_settings.maintenance)
+            app.whitelist(app_settings.whitelist)
+
+        scale = {
+            proc_type: app.structure[proc_type]
+            for proc_type in _proc_types(app, differences, 'deployment ')
+        }
+        if scale:
+            app._scale_pods(scale)
+
+    for proc_type in _proc_types(app, differences, 'autoscale '):
+        app.autoscale(proc_type, app_settings.autoscale.get(proc_type))
+
+
+def _service_drift(app, state, service, annotations):
+    differences = []
+    live = service['metadata'].get('annotations') or {}
+    for key in ['domains', 'certificates']:
+        name = 'router.deis.io/{}'.format(key)
+        if live.get(name, '') != annotations[name]:
+            differences.append(key)
+
+    if 'certificates' not in differences and any(
+        (app.id, '{}-cert'.format(domain.certificate.name)) not in state.secrets
+        for domain in app.domain_set.filter(certificate__isnull=False)
+    ):
+        differences.append('certificates')
+
+    if 'router.deis.io/maintenance' in annotations and (
+        # the API and deploys write the flag in different case
+        str(live.get('router.deis.io/maintenance')).lower() != annotations['router.deis.io/maintenance'].lower() or  # noqa
+        live.get('router.deis.io/whitelist') != annotations['router.deis.io/whitelist']
+    ):
+        differences.append('router')
+
+    return differences
+
+
+def _workload_drift(app, state, want):
+    """What differs about the Deployments and HorizontalPodAutoscalers of an application"""
+    differences = []
+    autoscaled = want['autoscale']
+    for name, manifest in sorted(want['deployments'].items()):
+        deployment = state.deployments.get((app.id, name))
+        if deployment is None:
+            differences.append('deployment {}'.format(name))
+        elif _template(deployment) != _template(manifest):
+            differences.append('deployment {} version'.format(name))
+        # replicas of autoscaled process types are up to the HorizontalPodAutoscaler
+        elif name not in autoscaled and deployment['spec'].get('replicas') != manifest['spec']['replicas']:  # noqa
+            differences.append('deployment {} replicas'.format(name))
+
+    existing = {name for namespace, name in state.autoscalers if namespace == app.id}
+    for name in sorted(set(autoscaled) | existing):
+        autoscaler = state.autoscalers.get((app.id, name))
+        rule = autoscaled.get(name)
+        if autoscaler is None or rule is None or (
+            autoscaler['spec'].get('minReplicas') != rule.get('min') or
+            autoscaler['spec'].get('maxReplicas') != rule.get('max')
+        ):
+            differences.append('autoscale {}'.format(name))
+
+    return differences
+
+
+def _template(deployment):
+    """What a change of release changes in the pod template of a Deployment"""
+    template = deployment['spec']['template']
+    container = template['spec']['containers'][0]
+    return (
+        template['metadata'].get('labels', {}).get('version'),
+        container.get('image'), container.get('command'), container.get('args'),
+    )
+
+
+def _redeploy(differences):
+    """Whether the differences take a deploy of the latest release to repair"""
+    return any(
+        item in ['config', 'deployments'] or
+        (item.startswith('deployment ') and not item.endswith(' replicas'))
+        for item in differences
+    )
+
+
+def _proc_types(app, differences, prefix):
+    """The process types of the differences about <prefix><app>-<proc type> objects"""
+    return [
+        item[len(prefix):].split()[0][len(app.id) + 1:]
+        for item in differences if item.startswith(prefix)
+    ]
+
+
+def _decode(data):
+    return {key: base64.b64decode(value).decode('utf-8') for key, value in data.items()}
@@ -381,6 +381,21 @@ class ReleaseSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class OperationSerializer(serializers.ModelSerializer):
+    """Serialize a :class:`~api.models.Operation` model."""
+
+    app = serializers.SlugRelatedField(slug_field='id', queryset=models.App.objects.all())
+    owner = serializers.ReadOnlyField(source='owner.username')
+    params = serializers.JSONField(required=False)
+    result = serializers.JSONField(required=False)
+
+    class Meta:
+        """Metadata options for a :class:`OperationSerializer`."""
+        model = models.Operation
+        fields = '__all__'
+        read_only_fields = ['uuid']
+
+
 class KeySerializer(serializers.ModelSerializer):
     """Serialize a :class:`~api.models.Key` model."""
 
@@ -102,7 +102,8 @@ INSTALLED_APPS = (
     'rest_framework',
     'rest_framework.authtoken',
     # Deis apps
-    'api'
+    'api',
+    'registry',
 )
 
 AUTHENTICATION_BACKENDS = (
@@ -292,11 +293,86 @@ DEIS_DEPLOY_BATCHES = int(os.environ.get('DEIS_DEPLOY_BATCHES', 0))
 # where it roughly goes BATCHES * TIMEOUT = global timeout
 DEIS_DEPLOY_TIMEOUT = int(os.environ.get('DEIS_DEPLOY_TIMEOUT', 120))
 
+# How many threads a controller process uses to run Kubernetes operations in parallel,
+# such as deploying all process types of an application at once
+DEIS_ASYNC_WORKERS = int(os.environ.get('DEIS_ASYNC_WORKERS', 20))
+
+# Seconds of silence after which a streamed rollout (Accept: application/x-ndjson or
+# text/event-stream) sends a heartbeat event, so proxies do not drop the connection
+DEIS_STREAM_HEARTBEAT = int(os.environ.get('DEIS_STREAM_HEARTBEAT', 15))
+
+# Run deploys, builds, scaling and restarts in the background for every request, as
+# opposed to only when the client sends "Prefer: respond-async". The endpoints then
+# answer 202 Accepted with an /operations/<uuid> resource to poll and the work is done
+# by the run_operations management command
+DEIS_ASYNC_OPERATIONS = bool(strtobool(os.environ.get('DEIS_ASYNC_OPERATIONS', 'false')))
+# Seconds to hold back rollouts of config changes and builds, recording their releases
+# right away but only rolling out the newest release of an application once no further
+# changes came in for this long. Such requests answer 202 Accepted like background
+# operations do. 0 rolls out every release as part of its request
+DEIS_DEPLOY_COALESCE_WINDOW = int(os.environ.get('DEIS_DEPLOY_COALESCE_WINDOW', 0))
+# How restarts of all pods, or of all pods of a process type, are done: "rolling" has the
+# Deployments replace the pods in batches like a deploy does, "delete" deletes them all at
+# once and waits for new ones. Restarting a single pod always deletes it
+DEIS_RESTART_STRATEGY = os.environ.get('DEIS_RESTART_STRATEGY', 'rolling')
+# seconds the run_operations worker waits before looking for new operations again
+DEIS_OPERATIONS_POLL_INTERVAL = float(os.environ.get('DEIS_OPERATIONS_POLL_INTERVAL', 1))
+# seconds a running operation is held for its worker, which renews it as it goes; after that
+# the worker is taken to be gone and the operation is queued again for another one
+DEIS_OPERATIONS_LEASE = int(os.environ.get('DEIS_OPERATIONS_LEASE', 300))
+
+# How many applications load_db_state_to_k8s compares with Kubernetes and repairs at once
+DEIS_RECONCILE_WORKERS = int(os.environ.get('DEIS_RECONCILE_WORKERS', 10))
+# Where load_db_state_to_k8s records the applications it got through, so a controller
+# restarting halfway resumes instead of starting over
+DEIS_RECONCILE_CHECKPOINT = os.environ.get('DEIS_RECONCILE_CHECKPOINT', '/app/data/load_db_state_to_k8s.json')  # noqa
+# Seconds between the passes of the reconcile command, which repairs Kubernetes objects of
+# applications that drifted from the database. 0 turns it off
+DEIS_RECONCILE_INTERVAL = int(os.environ.get('DEIS_RECONCILE_INTERVAL', 300))
+# Roughly how many writes to the API server one reconcile pass may spend on repairs, the
+# applications left over are repaired in the next pass
+DEIS_RECONCILE_BUDGET = int(os.environ.get('DEIS_RECONCILE_BUDGET', 50))
+
 KUBERNETES_DEPLOYMENTS_REVISION_HISTORY_LIMIT = os.environ.get('KUBERNETES_DEPLOYMENTS_REVISION_HISTORY_LIMIT', None)  # noqa
 
 # How long k8s waits for a pod to finish work after a SIGTERM before sending SIGKILL
 KUBERNETES_POD_TERMINATION_GRACE_PERIOD_SECONDS = int(os.environ.get('KUBERNETES_POD_TERMINATION_GRACE_PERIOD_SECONDS', 30))  # noqa
 
+# True, true, yes, y and more evaluate to True
+# False, false, no, n and more evaluate to False
+# https://docs.python.org/3/distutils/apiref.html?highlight=distutils.util#distutils.util.strtobool
+# see the above for all available options
+#
+# Keep an in-process list + watch cache of Deis managed Pods, Deployments and ReplicaSets
+# and serve label based reads (deis ps, cleanups) from it instead of the API server
+KUBERNETES_INFORMER_CACHE = bool(strtobool(os.environ.get('KUBERNETES_INFORMER_CACHE', 'false')))  # noqa
+
+# Connection pooling towards the Kubernetes API server
+# how many hosts to keep connection pools for
+KUBERNETES_POOL_CONNECTIONS = int(os.environ.get('KUBERNETES_POOL_CONNECTIONS', 10))
+# how many connections to keep open per host, shared by all threads of a process
+KUBERNETES_POOL_MAXSIZE = int(os.environ.get('KUBERNETES_POOL_MAXSIZE', 20))
+# True, true, yes, y and more evaluate to True
+# False, false, no, n and more evaluate to False
+# https://docs.python.org/3/distutils/apiref.html?highlight=distutils.util#distutils.util.strtobool
+# see the above for all available options
+#
+# wait for a free connection instead of going over KUBERNETES_POOL_MAXSIZE
+KUBERNETES_POOL_BLOCK = bool(strtobool(os.environ.get('KUBERNETES_POOL_BLOCK', 'true')))
+# seconds a pooled connection can idle before TCP keep-alive probes are sent
+KUBERNETES_POOL_KEEPALIVE = int(os.environ.get('KUBERNETES_POOL_KEEPALIVE', 60))
+# give every thread its own HTTP session (all sharing the same connection pools)
+KUBERNETES_THREAD_LOCAL_SESSIONS = bool(strtobool(os.environ.get('KUBERNETES_THREAD_LOCAL_SESSIONS', 'false')))  # noqa
+
+# How many objects to ask the Kubernetes API server for per list call, larger collections
+# are read in chunks. 0 reads whole collections in one go
+KUBERNETES_LIST_LIMIT = int(os.environ.get('KUBERNETES_LIST_LIMIT', 500))
+
+# How much output of a one-off command ("deis run") is kept to be returned in one response,
+# in bytes. Clients following the output as it is written (Accept: application/x-ndjson or
+# text/event-stream) get all of it
+KUBERNETES_RUN_LOG_LIMIT_BYTES = int(os.environ.get('KUBERNETES_RUN_LOG_LIMIT_BYTES', 10 * 1024 * 1024))  # noqa
+
 # registry settings
 REGISTRY_HOST = os.environ.get('DEIS_REGISTRY_SERVICE_HOST', '127.0.0.1')
 REGISTRY_PORT = os.environ.get('DEIS_REGISTRY_SERVICE_PORT', 5000)
@@ -304,6 +380,28 @@ REGISTRY_URL = '{}:{}'.format(REGISTRY_HOST, REGISTRY_PORT)
 REGISTRY_LOCATION = os.environ.get('DEIS_REGISTRY_LOCATION', 'on-cluster')
 REGISTRY_SECRET_PREFIX = os.environ.get('DEIS_REGISTRY_SECRET_PREFIX', 'private-registry')
 
+# Read image metadata (such as the exposed port) through the registry HTTP API instead
+# of pulling the whole image into the local Docker daemon, falling back to Docker if
+# the registry can not be inspected
+#
+# https://docs.python.org/3/distutils/apiref.html?highlight=distutils.util#distutils.util.strtobool
+# see the above for all available options
+REGISTRY_API_INSPECT = bool(strtobool(os.environ.get('DEIS_REGISTRY_API_INSPECT', 'true')))
+# Publish release images by copying manifests and mounting (or streaming) blobs through
+# the registry HTTP API instead of pulling and pushing them with the local Docker daemon,
+# falling back to Docker if that is not possible
+REGISTRY_API_PUBLISH = bool(strtobool(os.environ.get('DEIS_REGISTRY_API_PUBLISH', 'true')))
+# seconds to wait on the registry HTTP API
+REGISTRY_API_TIMEOUT = int(os.environ.get('DEIS_REGISTRY_API_TIMEOUT', 30))
+
+# Remove the images the controller pulled and tagged into the Docker graph of its node
+# again once they were pushed, least recently used first, keeping at most
+# DOCKER_IMAGE_RETENTION_COUNT images and removing more while they take up more than
+# DOCKER_IMAGE_RETENTION_BYTES
+DOCKER_IMAGE_RETENTION = bool(strtobool(os.environ.get('DEIS_DOCKER_IMAGE_RETENTION', 'true')))  # noqa
+DOCKER_IMAGE_RETENTION_COUNT = int(os.environ.get('DEIS_DOCKER_IMAGE_RETENTION_COUNT', 20))
+DOCKER_IMAGE_RETENTION_BYTES = int(os.environ.get('DEIS_DOCKER_IMAGE_RETENTION_BYTES', 10 * 1024 ** 3))  # noqa
+
 # logger settings
 LOGGER_HOST = os.environ.get('DEIS_LOGGER_SERVICE_HOST', '127.0.0.1')
 LOGGER_PORT = os.environ.get('DEIS_LOGGER_SERVICE_PORT_HTTP', 80)
@@ -15,6 +15,11 @@ DEBUG_PROPAGATE_EXCEPTIONS = True
 SCHEDULER_MODULE = 'scheduler.mock'
 SCHEDULER_URL = 'http://test-scheduler.example.com'
 
+# tests use the mocked Docker client to inspect and publish images
+REGISTRY_API_INSPECT = False
+REGISTRY_API_PUBLISH = False
+DOCKER_IMAGE_RETENTION = False
+
 # router information
 ROUTER_HOST = 'deis-router.example.com'
 ROUTER_PORT = 80
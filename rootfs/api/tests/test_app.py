@@ -292,6 +292,50 @@ class AppTest(DeisTestCase):
             response = self.client.post(url, body)
             self.assertEqual(response.status_code, 503, response.data)
 
+    @mock.patch('api.models.App.deploy', mock_none)
+    @mock.patch('api.models.Release.publish', mock_none)
+    def test_run_streaming(self, mock_requests):
+        """
+        A user should be able to follow the output of a one off command as it is written
+        """
+        app_id = self.create_app()
+
+        # create build
+        body = {'image': 'autotest/example'}
+        url = '/v2/apps/{app_id}/builds'.format(**locals())
+        response = self.client.post(url, body)
+        self.assertEqual(response.status_code, 201, response.data)
+
+        def run_stream(*args, **kwargs):
+            yield 'state', 'up'
+            yield 'output', 'migrating\n'
+            yield 'output', 'done\n'
+            yield 'exit', 1
+
+        with mock.patch('scheduler.KubeHTTPClient.run_stream', run_stream):
+            url = '/v2/apps/{}/run'.format(app_id)
+            body = {'command': 'rake db:migrate'}
+            response = self.client.post(url, body, HTTP_ACCEPT='application/x-ndjson')
+            self.assertEqual(response.status_code, 200)
+            content = b''.join(response.streaming_content).decode('utf-8')
+
+        events = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(events, [
+            {'event': 'state', 'state': 'up'},
+            {'event': 'output', 'output': 'migrating\n'},
+            {'event': 'output', 'output': 'done\n'},
+            {'event': 'exit', 'exit_code': 1},
+        ])
+
+        with mock.patch('scheduler.KubeHTTPClient.run_stream') as kube_run:
+            kube_run.side_effect = KubeException('boom!')
+            response = self.client.post(url, body, HTTP_ACCEPT='application/x-ndjson')
+            content = b''.join(response.streaming_content).decode('utf-8')
+
+        event = json.loads(content)
+        self.assertEqual(event['event'], 'error')
+        self.assertEqual(event['status'], 503)
+
     def test_unauthorized_user_cannot_see_app(self, mock_requests):
         """
         An unauthorized user should not be able to access an app's resources.
@@ -178,8 +178,8 @@ class TestAppSettings(DeisTransactionTestCase):
         """
         app_id = self.create_app()
 
-        # scheduler.svc.update exception
-        with mock.patch('scheduler.resources.service.Service.update') as mock_kube:
+        # scheduler.svc.patch exception
+        with mock.patch('scheduler.resources.service.Service.patch') as mock_kube:
             mock_kube.side_effect = KubeException('Boom!')
             addresses = ["2.3.4.5"]
             url = '/v2/apps/{}/whitelist'.format(app_id)
@@ -563,6 +563,70 @@ class BuildTest(DeisTransactionTestCase):
         release = build.app.release_set.latest()
         self.assertEqual(release.image, image)
 
+    def test_build_promote(self, mock_requests):
+        """Promoting a release of another app reuses its image without publishing it again"""
+        source_id = self.create_app()
+        url = "/v2/apps/{source_id}/builds".format(**locals())
+        response = self.client.post(url, {'image': 'autotest/example'})
+        self.assertEqual(response.status_code, 201, response.data)
+        source = App.objects.get(id=source_id).release_set.latest()
+
+        app_id = self.create_app()
+        url = "/v2/apps/{app_id}/builds/promote".format(**locals())
+        with mock.patch('api.models.release.publish_release') as mock_publish:
+            response = self.client.post(url, {'app': source_id, 'version': source.version})
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertFalse(mock_publish.called)
+
+        release = App.objects.get(id=app_id).release_set.latest()
+        self.assertEqual(release.version, 2)
+        self.assertEqual(release.build.image, source.image)
+        self.assertEqual(release.image, source.image)
+        self.assertEqual(response.data['uuid'], str(release.build.uuid))
+
+        # the source app is required
+        response = self.client.post(url, {})
+        self.assertEqual(response.status_code, 400, response.data)
+
+        # an app without builds has nothing to promote
+        empty_id = self.create_app()
+        response = self.client.post(url, {'app': empty_id})
+        self.assertEqual(response.status_code, 400, response.data)
+
+    @override_settings(REGISTRY_API_INSPECT=True)
+    def test_build_promote_pins_digest(self, mock_requests):
+        """The promoted image is pinned to the digest the source release published"""
+        source_id = self.create_app()
+        url = "/v2/apps/{source_id}/builds".format(**locals())
+        response = self.client.post(url, {'image': 'autotest/example'})
+        self.assertEqual(response.status_code, 201, response.data)
+
+        app_id = self.create_app()
+        url = "/v2/apps/{app_id}/builds/promote".format(**locals())
+        pinned = '{}/{}@sha256:abc'.format(settings.REGISTRY_URL, source_id)
+        with mock.patch('api.models.release.pin_image', return_value=pinned) as mock_pin:
+            response = self.client.post(url, {'app': source_id})
+            self.assertEqual(response.status_code, 201, response.data)
+            mock_pin.assert_called_once_with('{}/{}:v2'.format(settings.REGISTRY_URL, source_id), False)  # noqa
+
+        release = App.objects.get(id=app_id).release_set.latest()
+        self.assertEqual(release.image, pinned)
+
+    def test_unauthorized_user_cannot_promote_build(self, mock_requests):
+        """An app can only be promoted from apps the user has access to"""
+        source_id = self.create_app()
+        url = "/v2/apps/{source_id}/builds".format(**locals())
+        response = self.client.post(url, {'image': 'autotest/example'})
+        self.assertEqual(response.status_code, 201, response.data)
+
+        user = User.objects.get(username='autotest2')
+        token = Token.objects.get(user=user).key
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        app_id = self.create_app()
+        url = "/v2/apps/{app_id}/builds/promote".format(**locals())
+        response = self.client.post(url, {'app': source_id})
+        self.assertEqual(response.status_code, 403)
+
     def test_build_image_in_registry_with_auth(self, mock_requests):
         """add authentication to the build"""
         app_id = self.create_app()
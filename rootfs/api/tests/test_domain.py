@@ -325,16 +325,16 @@ class DomainTest(DeisTestCase):
         """
         app_id = self.create_app()
 
-        # scheduler.svc.get exception
-        with mock.patch('scheduler.resources.service.Service.get') as mock_kube:
+        # scheduler.svc.patch exception
+        with mock.patch('scheduler.resources.service.Service.patch') as mock_kube:
             mock_kube.side_effect = KubeException('Boom!')
             domain = 'foo.com'
             url = '/v2/apps/{}/domains'.format(app_id)
             response = self.client.post(url, {'domain': domain})
             self.assertEqual(response.status_code, 503, response.data)
 
-        # scheduler.svc.update exception
-        with mock.patch('scheduler.resources.service.Service.update') as mock_kube:
+        # scheduler.svc.patch exception
+        with mock.patch('scheduler.resources.service.Service.patch') as mock_kube:
             domain = 'foo.com'
             url = '/v2/apps/{}/domains'.format(app_id)
             response = self.client.post(url, {'domain': domain})
@@ -0,0 +1,236 @@
+"""
+Unit tests for the Deis api app.
+
+Run the tests with "./manage.py test api"
+"""
+from datetime import timedelta
+import json
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test.utils import override_settings
+from unittest import mock
+from rest_framework.authtoken.models import Token
+
+from api.models import App, Operation
+
+from api.tests import adapter, mock_port, DeisTransactionTestCase
+import requests_mock
+
+
+@requests_mock.Mocker(real_http=True, adapter=adapter)
+@mock.patch('api.models.release.publish_release', lambda *args: None)
+@mock.patch('api.models.release.docker_get_port', mock_port)
+class OperationTest(DeisTransactionTestCase):
+    """Tests deploys, scaling and restarts queued to run in the background"""
+
+    fixtures = ['tests.json']
+
+    def setUp(self):
+        self.user = User.objects.get(username='autotest')
+        self.token = Token.objects.get(user=self.user).key
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def tearDown(self):
+        # make sure every test has a clean slate for k8s mocking
+        cache.clear()
+
+    def create_build(self, app_id):
+        url = "/v2/apps/{app_id}/builds".format(**locals())
+        body = {
+            'image': 'autotest/example',
+            'sha': 'a'*40,
+            'procfile': {
+                'web': 'node server.js',
+                'worker': 'node worker.js'
+            }
+        }
+        response = self.client.post(url, body)
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def run_operations(self):
+        """Do what the run_operations worker does"""
+        while True:
+            operation = Operation.claim()
+            if operation is None:
+                break
+
+            operation.run()
+
+    def test_scale(self, mock_requests):
+        app_id = self.create_app()
+        self.create_build(app_id)
+
+        url = "/v2/apps/{app_id}/scale".format(**locals())
+        response = self.client.post(url, {'web': 4}, HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data['state'], 'queued')
+        location = response['Location']
+        self.assertEqual(location, '/v2/operations/{}'.format(response.data['uuid']))
+
+        # nothing happened yet, the build scaled web to 1
+        self.assertEqual(App.objects.get(id=app_id).structure['web'], 1)
+
+        self.run_operations()
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['state'], 'succeeded', response.data)
+        self.assertEqual(App.objects.get(id=app_id).structure['web'], 4)
+
+    def test_scale_invalid(self, mock_requests):
+        app_id = self.create_app()
+        self.create_build(app_id)
+
+        url = "/v2/apps/{app_id}/scale".format(**locals())
+        for body in [{'web': 'lots'}, {'web': -1}]:
+            response = self.client.post(url, body, HTTP_PREFER='respond-async')
+            self.assertEqual(response.status_code, 400, response.data)
+
+        response = self.client.post(url, {'bogus': 1}, HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 404, response.data)
+
+        # nothing was queued
+        self.assertFalse(Operation.objects.filter(app__id=app_id).exists())
+
+    @override_settings(DEIS_ASYNC_OPERATIONS=True)
+    def test_config(self, mock_requests):
+        app_id = self.create_app()
+        self.create_build(app_id)
+
+        url = '/v2/apps/{app_id}/config'.format(**locals())
+        body = {'values': json.dumps({'NEW_URL1': 'http://localhost:8080/'})}
+        response = self.client.post(url, body)
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(response.data['type'], 'deploy')
+
+        self.run_operations()
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.data['state'], 'succeeded', response.data)
+        self.assertEqual(response.data['result']['release']['version'], 3)
+
+    @override_settings(DEIS_DEPLOY_COALESCE_WINDOW=30)
+    def test_coalesce(self, mock_requests):
+        app_id = self.create_app()
+        url = "/v2/apps/{app_id}/builds".format(**locals())
+        response = self.client.post(url, {'image': 'autotest/example'})
+        self.assertEqual(response.status_code, 202, response.data)
+        first = response.data['uuid']
+
+        url = '/v2/apps/{app_id}/config'.format(**locals())
+        for key in ['FOO', 'BAR', 'BAZ']:
+            response = self.client.post(url, {'values': json.dumps({key: 'bar'})})
+            self.assertEqual(response.status_code, 202, response.data)
+
+        # every change got its release right away
+        app = App.objects.get(id=app_id)
+        self.assertEqual(app.release_set.latest().version, 5)
+
+        # only the newest release is waiting to be rolled out, after the window
+        operations = Operation.objects.filter(app=app)
+        self.assertEqual(operations.filter(state='superseded').count(), 3)
+        newest = operations.get(state='queued')
+        self.assertEqual(newest.params, {'release': 5})
+        # each superseded deploy points at the release that took its place
+        superseded = Operation.objects.get(uuid=first)
+        self.assertEqual(superseded.result['superseded_by']['version'], 3)
+        versions = [operation.result['superseded_by']['version']
+                    for operation in operations.filter(state='superseded')]
+        self.assertEqual(sorted(versions), [3, 4, 5])
+        self.assertIsNone(Operation.claim())
+
+        newest.run_after = None
+        newest.save()
+        self.run_operations()
+        newest = Operation.objects.get(uuid=newest.uuid)
+        self.assertEqual(newest.state, 'succeeded', newest.error)
+
+    def test_build_hook(self, mock_requests):
+        app_id = self.create_app()
+        url = '/v2/hooks/build'
+        body = {'receive_user': 'autotest',
+                'receive_repo': app_id,
+                'image': '{app_id}:v2'.format(**locals())}
+        response = self.client.post(url, body, HTTP_PREFER='respond-async',
+                                    HTTP_X_DEIS_BUILDER_AUTH=settings.BUILDER_KEY)
+        self.assertEqual(response.status_code, 202, response.data)
+        self.assertEqual(App.objects.get(id=app_id).release_set.latest().version, 1)
+
+        self.run_operations()
+        operation = Operation.objects.get(uuid=response.data['uuid'])
+        self.assertEqual(operation.state, 'succeeded', operation.error)
+        self.assertEqual(App.objects.get(id=app_id).release_set.latest().version, 2)
+
+    def test_restart(self, mock_requests):
+        app_id = self.create_app()
+        self.create_build(app_id)
+        url = "/v2/apps/{app_id}/scale".format(**locals())
+        response = self.client.post(url, {'web': 2, 'worker': 3})
+        self.assertEqual(response.status_code, 204, response.data)
+
+        url = '/v2/apps/{}/pods/worker/restart'.format(app_id)
+        response = self.client.post(url, HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 202, response.data)
+
+        self.run_operations()
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.data['state'], 'succeeded', response.data)
+        self.assertEqual(len(response.data['result']['pods']), 3)
+
+    def test_failure(self, mock_requests):
+        app_id = self.create_app()
+        self.create_build(app_id)
+
+        url = "/v2/apps/{app_id}/scale".format(**locals())
+        response = self.client.post(url, {'web': 4}, HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 202, response.data)
+
+        # the release with the build failed before the operation got to run
+        App.objects.get(id=app_id).release_set.filter(build__isnull=False).update(failed=True)
+        self.run_operations()
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.data['state'], 'failed', response.data)
+        self.assertIn('No build associated with this release', response.data['error'])
+
+    def test_one_operation_per_app(self, mock_requests):
+        app_id = self.create_app()
+        other_id = self.create_app()
+        app, other = App.objects.get(id=app_id), App.objects.get(id=other_id)
+        running = Operation.objects.create(owner=self.user, app=app, type='scale', state='running')  # noqa
+        Operation.objects.create(owner=self.user, app=app, type='scale')
+        queued = Operation.objects.create(owner=self.user, app=other, type='scale')
+
+        self.assertEqual(Operation.claim(), queued)
+        self.assertIsNone(Operation.claim())
+        running.delete()
+        self.assertIsNotNone(Operation.claim())
+
+    def test_abandoned_operation(self, mock_requests):
+        app = App.objects.get(id=self.create_app())
+        running = Operation.objects.create(owner=self.user, app=app, type='scale', state='running')  # noqa
+        queued = Operation.objects.create(owner=self.user, app=app, type='scale')
+        self.assertIsNone(Operation.claim())
+
+        # the worker running it went away without finishing it
+        expired = running.updated - timedelta(seconds=settings.DEIS_OPERATIONS_LEASE + 1)
+        Operation.objects.filter(pk=running.pk).update(updated=expired)
+        self.assertEqual(Operation.claim(), running)
+        self.assertEqual(Operation.objects.get(pk=queued.pk).state, 'queued')
+
+    def test_run_operations_survives_errors(self, mock_requests):
+        with mock.patch('api.models.Operation.claim', side_effect=Exception('boom')):
+            call_command('run_operations', once=True)
+
+    def test_unauthorized_user_cannot_see_operation(self, mock_requests):
+        app_id = self.create_app()
+        self.create_build(app_id)
+        url = "/v2/apps/{app_id}/scale".format(**locals())
+        response = self.client.post(url, {'web': 4}, HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 202, response.data)
+
+        unauthorized_user = User.objects.get(username='autotest2')
+        unauthorized_token = Token.objects.get(user=unauthorized_user).key
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + unauthorized_token)
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.status_code, 403)
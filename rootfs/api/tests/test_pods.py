@@ -7,6 +7,7 @@ import json
 
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.test.utils import override_settings
 from unittest import mock
 from rest_framework.authtoken.models import Token
 from test.support import EnvironmentVarGuard
@@ -785,6 +786,48 @@ class PodTest(DeisTransactionTestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['type'], 'web')
 
+    def test_restart_pods_rolling(self, mock_requests):
+        app_id = self.create_app()
+        build_url = "/v2/apps/{app_id}/builds".format(**locals())
+        body = {
+            'image': 'autotest/example',
+            'sha': 'a'*40,
+            'procfile': {
+                'web': 'node server.js',
+                'worker': 'node worker.js'
+            }
+        }
+        response = self.client.post(build_url, body)
+        self.assertEqual(response.status_code, 201, response.data)
+
+        url = "/v2/apps/{app_id}/scale".format(**locals())
+        response = self.client.post(url, {'web': 2, 'worker': 3})
+        self.assertEqual(response.status_code, 204, response.data)
+
+        application = App.objects.get(id=app_id)
+        with mock.patch('scheduler.resources.pod.Pod.delete') as delete:
+            response = self.client.post('/v2/apps/{}/pods/worker/restart'.format(app_id))
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual(len(response.data), 3)
+            # the Deployment replaced the pods, none were deleted one by one
+            self.assertFalse(delete.called)
+
+        name = '{}-worker'.format(app_id)
+        deployment = application._scheduler.deployment.get(app_id, name).json()
+        self.assertIn('deis.io/restartedAt', deployment['spec']['template']['metadata']['annotations'])  # noqa
+        # other process types are left alone
+        name = '{}-web'.format(app_id)
+        deployment = application._scheduler.deployment.get(app_id, name).json()
+        self.assertNotIn('deis.io/restartedAt', deployment['spec']['template']['metadata'].get('annotations', {}))  # noqa
+
+        # deleting every pod is still available
+        with override_settings(DEIS_RESTART_STRATEGY='delete'):
+            with mock.patch('scheduler.resources.deployment.Deployment.restart') as restart:
+                response = self.client.post('/v2/apps/{}/pods/web/restart'.format(app_id))
+                self.assertEqual(response.status_code, 200, response.data)
+                self.assertEqual(len(response.data), 2)
+                self.assertFalse(restart.called)
+
     def test_list_pods_failure(self, mock_requests):
         """
         Listing all available pods exceptions
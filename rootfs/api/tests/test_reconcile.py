@@ -0,0 +1,195 @@
+"""
+Unit tests for the Deis api app.
+
+Run the tests with "./manage.py test api"
+"""
+import json
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from unittest import mock
+from rest_framework.authtoken.models import Token
+
+from api.models import App
+from api.reconcile import ClusterState, drift, repair
+
+from api.tests import adapter, mock_port, DeisTransactionTestCase
+import requests_mock
+
+
+@requests_mock.Mocker(real_http=True, adapter=adapter)
+@mock.patch('api.models.release.publish_release', lambda *args: None)
+@mock.patch('api.models.release.docker_get_port', mock_port)
+class ReconcileTest(DeisTransactionTestCase):
+    """Tests comparing applications with Kubernetes and repairing what drifted"""
+
+    fixtures = ['tests.json']
+
+    def setUp(self):
+        self.user = User.objects.get(username='autotest')
+        self.token = Token.objects.get(user=self.user).key
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        fd, self.checkpoint = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.checkpoint)
+
+    def tearDown(self):
+        # make sure every test has a clean slate for k8s mocking
+        cache.clear()
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def create_deployed_app(self):
+        app_id = self.create_app()
+        url = "/v2/apps/{app_id}/builds".format(**locals())
+        response = self.client.post(url, {'image': 'autotest/example'})
+        self.assertEqual(response.status_code, 201, response.data)
+        return App.objects.get(id=app_id)
+
+    def test_in_sync(self, mock_requests):
+        app = self.create_deployed_app()
+        self.assertEqual(drift(app, ClusterState()), [])
+
+    def test_drift(self, mock_requests):
+        app = self.create_deployed_app()
+        scheduler = app._scheduler
+        scheduler.deployment.delete(app.id, '{}-cmd'.format(app.id))
+        scheduler.secret.delete(app.id, app._env_secret(app.release_set.latest())[0])
+        scheduler.svc.patch(app.id, app.id, {'metadata': {'annotations': {
+            'router.deis.io/domains': 'example.com'
+        }}})
+
+        self.assertEqual(
+            drift(app, ClusterState()),
+            ['domains', 'config', 'deployment {}-cmd'.format(app.id)]
+        )
+
+        scheduler.ns.delete(app.id)
+        self.assertEqual(drift(app, ClusterState()), ['namespace'])
+
+    def test_command(self, mock_requests):
+        app = self.create_deployed_app()
+        other = self.create_deployed_app()
+        app._scheduler.deployment.delete(app.id, '{}-cmd'.format(app.id))
+
+        with mock.patch('api.models.App.deploy') as deploy:
+            call_command('load_db_state_to_k8s', checkpoint=self.checkpoint)
+
+        # only the application that drifted was deployed
+        self.assertEqual(deploy.call_count, 1)
+        self.assertEqual(deploy.call_args[0][0].app, app)
+        self.assertNotEqual(deploy.call_args[0][0].app, other)
+        # the run finished
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resume(self, mock_requests):
+        app = self.create_deployed_app()
+        other = self.create_deployed_app()
+        for each in [app, other]:
+            each._scheduler.deployment.delete(each.id, '{}-cmd'.format(each.id))
+
+        # an interrupted run got through one application
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'updated': time.time(), 'done': [app.id]}, f)
+
+        with mock.patch('api.models.App.deploy') as deploy:
+            call_command('load_db_state_to_k8s', checkpoint=self.checkpoint)
+
+        self.assertEqual(deploy.call_count, 1)
+        self.assertEqual(deploy.call_args[0][0].app, other)
+
+        # a stale checkpoint is not trusted
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'updated': time.time() - 7200, 'done': [app.id, other.id]}, f)
+
+        with mock.patch('api.models.App.deploy') as deploy:
+            call_command('load_db_state_to_k8s', checkpoint=self.checkpoint)
+
+        self.assertEqual(deploy.call_count, 2)
+
+    def test_repair(self, mock_requests):
+        app = self.create_deployed_app()
+        scheduler = app._scheduler
+        name = '{}-cmd'.format(app.id)
+
+        # scaled in the database behind the back of Kubernetes
+        App.objects.filter(id=app.id).update(structure={'cmd': 3})
+        scheduler.svc.patch(app.id, app.id, {'metadata': {'annotations': {
+            'router.deis.io/maintenance': 'true'
+        }}})
+        app = App.objects.get(id=app.id)
+        differences = drift(app, ClusterState())
+        self.assertEqual(differences, ['router', 'deployment {} replicas'.format(name)])
+
+        with mock.patch('api.models.App.deploy') as deploy:
+            repair(app, differences)
+            # nothing took a whole deploy
+            self.assertFalse(deploy.called)
+
+        self.assertEqual(drift(app, ClusterState()), [])
+        self.assertEqual(scheduler.deployment.get(app.id, name).json()['spec']['replicas'], 3)
+
+    def test_config_drift(self, mock_requests):
+        app = self.create_deployed_app()
+        secret = app._env_secret(app.release_set.latest())[0]
+        app._scheduler.secret.update(app.id, secret, {'deis-app': 'someone-else'})
+        self.assertEqual(drift(app, ClusterState()), ['config'])
+
+    def test_autoscale_drift(self, mock_requests):
+        app = self.create_deployed_app()
+        url = '/v2/apps/{}/settings'.format(app.id)
+        body = {'autoscale': json.dumps({'cmd': {'min': 2, 'max': 5, 'cpu_percent': 45}})}
+        response = self.client.post(url, body)
+        self.assertEqual(response.status_code, 201, response.data)
+
+        name = '{}-cmd'.format(app.id)
+        self.assertEqual(drift(app, ClusterState()), [])
+        app._scheduler.hpa.delete(app.id, name)
+        differences = drift(app, ClusterState())
+        self.assertEqual(differences, ['autoscale {}'.format(name)])
+
+        repair(app, differences)
+        self.assertEqual(drift(app, ClusterState()), [])
+
+    @mock.patch('api.management.commands.reconcile.GRACE', 0)
+    def test_reconcile_budget(self, mock_requests):
+        apps = [self.create_deployed_app() for _ in range(2)]
+        for app in apps:
+            App.objects.filter(id=app.id).update(structure={'cmd': 2})
+
+        # scaling one application takes two writes
+        call_command('reconcile', once=True, budget=2)
+        drifted = [app for app in apps if drift(App.objects.get(id=app.id), ClusterState())]
+        self.assertEqual(len(drifted), 1)
+
+        call_command('reconcile', once=True, budget=2)
+        drifted = [app for app in apps if drift(App.objects.get(id=app.id), ClusterState())]
+        self.assertEqual(drifted, [])
+
+    def test_reconcile_leaves_busy_apps_alone(self, mock_requests):
+        app = self.create_deployed_app()
+        App.objects.filter(id=app.id).update(structure={'cmd': 2})
+
+        # the application just changed
+        with mock.patch('api.management.commands.reconcile.repair') as fix:
+            call_command('reconcile', once=True)
+            self.assertFalse(fix.called)
+
+    @mock.patch('api.management.commands.reconcile.GRACE', 0)
+    def test_reconcile_one_replica_at_a_time(self, mock_requests):
+        app = self.create_deployed_app()
+        App.objects.filter(id=app.id).update(structure={'cmd': 2})
+
+        # another controller replica holds the lock
+        with mock.patch('api.management.commands.reconcile.advisory_lock') as lock, \
+                mock.patch('api.management.commands.reconcile.repair') as fix:
+            lock.return_value.__enter__.return_value = False
+            call_command('reconcile', once=True)
+            self.assertFalse(fix.called)
+
+        call_command('reconcile', once=True)
+        self.assertEqual(drift(App.objects.get(id=app.id), ClusterState()), [])
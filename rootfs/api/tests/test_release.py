@@ -354,6 +354,66 @@ class ReleaseTest(DeisTransactionTestCase):
         response = self.client.post(url, body)
         self.assertEqual(response.status_code, 409, response.data)
 
+    def test_release_env_secret(self, mock_requests):
+        """
+        Test that releases with the same config share one env secret and that secrets
+        no ReplicaSet refers to are cleaned up
+        """
+        app_id = self.create_app()
+        app = App.objects.get(id=app_id)
+        url = '/v2/apps/{app_id}/builds'.format(**locals())
+        # builds of the same type, so only the release details differ
+        response = self.client.post(url, {'image': 'autotest/example', 'sha': 'c' * 40})
+        self.assertEqual(response.status_code, 201, response.data)
+        first = app._env_secret(app.release_set.latest())[0]
+
+        # a new build leaves the config alone
+        body = {'image': 'autotest/example', 'sha': 'a' * 40}
+        response = self.client.post(url, body)
+        self.assertEqual(response.status_code, 201, response.data)
+        release = app.release_set.latest()
+        self.assertEqual(app._env_secret(release)[0], first)
+
+        # and leaves the secret as it was, neither written nor replaced
+        metadata = app._scheduler.secret.get(app_id, first).json()['metadata']
+        response = self.client.post(url, {'image': 'autotest/example', 'sha': 'b' * 40})
+        self.assertEqual(response.status_code, 201, response.data)
+        secret = app._scheduler.secret.get(app_id, first).json()
+        self.assertEqual(secret['metadata']['resourceVersion'], metadata['resourceVersion'])
+        self.assertEqual(secret['metadata']['uid'], metadata['uid'])
+
+        # the secret is immutable and the release details are set on the pods by value
+        secret = app._scheduler.secret.get(app_id, first).json()
+        self.assertTrue(secret['immutable'])
+        self.assertNotIn('workflow-release', secret['data'])
+        self.assertNotIn('source-version', secret['data'])
+        deployment = app._scheduler.deployment.get(app_id, '{}-web'.format(app_id)).json()
+        env = deployment['spec']['template']['spec']['containers'][0]['env']
+        env = {item['name']: item for item in env}
+        version = app.release_set.latest().version
+        self.assertEqual(env['WORKFLOW_RELEASE']['value'], 'v{}'.format(version))
+        self.assertEqual(env['DEIS_APP']['valueFrom']['secretKeyRef']['name'], first)
+
+        # a config change gets a secret of its own
+        url = '/v2/apps/{app_id}/config'.format(**locals())
+        body = {'values': json.dumps({'NEW_URL1': 'http://localhost:8080/'})}
+        response = self.client.post(url, body)
+        self.assertEqual(response.status_code, 201, response.data)
+        second = app._env_secret(app.release_set.latest())[0]
+        self.assertNotEqual(second, first)
+
+        # the ReplicaSet of the previous release still refers to the first secret
+        labels = {'heritage': 'deis', 'type': 'env'}
+        names = [item['metadata']['name'] for item in app._scheduler.secret.items(app_id, labels=labels)]  # noqa
+        self.assertEqual(sorted(names), sorted([first, second]))
+
+        # once no ReplicaSet refers to it anymore it is cleaned up
+        with mock.patch.object(app._scheduler.rs, 'items', lambda *args, **kwargs: []):
+            app.release_set.latest()._cleanup_deployment_secrets_and_configs(app_id)
+
+        names = [item['metadata']['name'] for item in app._scheduler.secret.items(app_id, labels=labels)]  # noqa
+        self.assertEqual(names, [second])
+
     def test_release_get_port(self, mock_requests):
         """
         Test that get_port always returns the proper value.
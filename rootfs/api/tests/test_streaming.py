@@ -0,0 +1,110 @@
+"""
+Unit tests for the Deis api app.
+
+Run the tests with "./manage.py test api"
+"""
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from unittest import mock
+from rest_framework.authtoken.models import Token
+
+from api.models import App
+from scheduler import progress
+
+from api.tests import adapter, mock_port, DeisTransactionTestCase
+import requests_mock
+
+
+@requests_mock.Mocker(real_http=True, adapter=adapter)
+@mock.patch('api.models.release.publish_release', lambda *args: None)
+@mock.patch('api.models.release.docker_get_port', mock_port)
+class StreamingTest(DeisTransactionTestCase):
+    """Tests following the progress of rollouts as they happen"""
+
+    fixtures = ['tests.json']
+
+    def setUp(self):
+        self.user = User.objects.get(username='autotest')
+        self.token = Token.objects.get(user=self.user).key
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def tearDown(self):
+        # make sure every test has a clean slate for k8s mocking
+        cache.clear()
+
+    def create_build(self, app_id):
+        url = "/v2/apps/{app_id}/builds".format(**locals())
+        body = {'image': 'autotest/example', 'sha': 'a'*40, 'procfile': {'web': 'node server.js'}}
+        response = self.client.post(url, body)
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def events(self, response):
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_scale(self, mock_requests):
+        app_id = self.create_app()
+        self.create_build(app_id)
+
+        scale = App.scale
+
+        def scale_with_progress(app, *args, **kwargs):
+            progress.emit(app.id, 'pods', waited=10, ready=1, desired=4)
+            return scale(app, *args, **kwargs)
+
+        url = "/v2/apps/{app_id}/scale".format(**locals())
+        with mock.patch.object(App, 'scale', scale_with_progress):
+            response = self.client.post(url, {'web': 4}, HTTP_ACCEPT='application/x-ndjson')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            events = self.events(response)
+
+        self.assertEqual(events[0]['event'], 'started')
+        pods = [event for event in events if event['event'] == 'pods']
+        self.assertEqual(pods[0]['ready'], 1)
+        self.assertEqual(pods[0]['namespace'], app_id)
+        self.assertEqual(events[-1], {'event': 'done', 'status': 204, 'data': None})
+        self.assertEqual(App.objects.get(id=app_id).structure['web'], 4)
+        # nobody is left listening
+        self.assertNotIn(app_id, progress.subscribers)
+
+    def test_config(self, mock_requests):
+        app_id = self.create_app()
+        self.create_build(app_id)
+
+        url = '/v2/apps/{app_id}/config'.format(**locals())
+        body = {'values': json.dumps({'FOO': 'bar'})}
+        response = self.client.post(url, body, HTTP_ACCEPT='application/x-ndjson')
+        events = self.events(response)
+        self.assertEqual(events[-1]['event'], 'done')
+        self.assertEqual(events[-1]['status'], 201)
+        self.assertEqual(events[-1]['data']['values'], {'FOO': 'bar'})
+
+    def test_error(self, mock_requests):
+        app_id = self.create_app()
+
+        # there is no build to scale
+        url = "/v2/apps/{app_id}/scale".format(**locals())
+        response = self.client.post(url, {'web': 4}, HTTP_ACCEPT='application/x-ndjson')
+        events = self.events(response)
+        self.assertEqual(events[-1]['event'], 'error')
+        self.assertEqual(events[-1]['status'], 400)
+        self.assertIn('No build associated with this release', events[-1]['detail'])
+
+    def test_server_sent_events(self, mock_requests):
+        app_id = self.create_app()
+        self.create_build(app_id)
+        url = '/v2/apps/{app_id}/config'.format(**locals())
+        response = self.client.post(url, {'values': json.dumps({'FOO': 'bar'})})
+        self.assertEqual(response.status_code, 201, response.data)
+
+        url = "/v2/apps/{app_id}/releases/rollback/".format(**locals())
+        response = self.client.post(url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        messages = [message.splitlines() for message in content.strip().split('\n\n')]
+        self.assertEqual(messages[0][0], 'event: started')
+        self.assertEqual(messages[-1][0], 'event: done')
+        self.assertEqual(json.loads(messages[-1][1][len('data: '):])['data'], {'version': 4})
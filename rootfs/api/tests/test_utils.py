@@ -1,3 +1,5 @@
+import functools
+import threading
 import unittest
 from api import utils
 
@@ -93,3 +95,57 @@ class TestUtils(unittest.TestCase):
 
         c = utils.dict_merge(a, b)
         self.assertEqual(c, b)
+
+    def test_async_run(self):
+        """Runs every task on the shared executor"""
+        results = []
+        tasks = [functools.partial(results.append, n) for n in range(12)]
+        utils.async_run(tasks)
+        self.assertEqual(sorted(results), list(range(12)))
+        self.assertEqual(utils.executor_stats()['running'], 0)
+        self.assertEqual(utils.executor_stats()['queued'], 0)
+
+    def test_async_run_limit(self):
+        """Never has more than limit tasks in flight"""
+        lock = threading.Lock()
+        counts = {'running': 0, 'max': 0}
+
+        def task():
+            with lock:
+                counts['running'] += 1
+                counts['max'] = max(counts['max'], counts['running'])
+            threading.Event().wait(0.05)
+            with lock:
+                counts['running'] -= 1
+
+        utils.async_run([task for _ in range(6)], limit=2)
+        self.assertLessEqual(counts['max'], 2)
+
+    def test_async_run_errors(self):
+        """Raises the first error and stops handing out tasks when failing fast"""
+        ran = []
+
+        def fail(n):
+            ran.append(n)
+            raise ValueError('task {} failed'.format(n))
+
+        tasks = [functools.partial(fail, n) for n in range(5)]
+        with self.assertRaises(ValueError):
+            utils.async_run(tasks, limit=1)
+        self.assertEqual(ran, [0])
+
+        ran = []
+        with self.assertRaises(ValueError):
+            utils.async_run(tasks, limit=1, fail_fast=False)
+        self.assertEqual(ran, [0, 1, 2, 3, 4])
+        self.assertEqual(utils.executor_stats()['queued'], 0)
+
+    def test_async_run_nested(self):
+        """Tasks can use async_run themselves without waiting on their own workers"""
+        results = []
+
+        def outer(n):
+            utils.async_run([functools.partial(results.append, (n, m)) for m in range(3)])
+
+        utils.async_run([functools.partial(outer, n) for n in range(utils.settings.DEIS_ASYNC_WORKERS * 2)])  # noqa
+        self.assertEqual(len(results), utils.settings.DEIS_ASYNC_WORKERS * 6)
@@ -19,6 +19,8 @@ urlpatterns = [
     # application release components
     url(r"^apps/(?P<id>{})/config/?$".format(settings.APP_URL_REGEX),
         views.ConfigViewSet.as_view({'get': 'retrieve', 'post': 'create'})),
+    url(r"^apps/(?P<id>{})/builds/promote/?$".format(settings.APP_URL_REGEX),
+        views.BuildViewSet.as_view({'post': 'promote'})),
     url(r"^apps/(?P<id>{})/builds/(?P<uuid>[-_\w]+)/?$".format(settings.APP_URL_REGEX),
         views.BuildViewSet.as_view({'get': 'retrieve'})),
     url(r"^apps/(?P<id>{})/builds/?$".format(settings.APP_URL_REGEX),
@@ -57,6 +59,9 @@ urlpatterns = [
         views.AppViewSet.as_view({'get': 'logs'})),
     url(r"^apps/(?P<id>{})/run/?$".format(settings.APP_URL_REGEX),
         views.AppViewSet.as_view({'post': 'run'})),
+    # background operations
+    url(r"^operations/(?P<uuid>[-_\w]+)/?$",
+        views.OperationViewSet.as_view({'get': 'retrieve'})),
     # application settings
     url(r"^apps/(?P<id>{})/settings/?$".format(settings.APP_URL_REGEX),
         views.AppSettingsViewSet.as_view({'get': 'retrieve', 'post': 'create'})),
@@ -1,16 +1,28 @@
 """
 Helper functions used by the Deis server.
 """
-import asyncio
 import base64
-import concurrent
+import concurrent.futures
+from contextlib import contextmanager
 import hashlib
 import logging
 import random
+import threading
+import zlib
 from copy import deepcopy
 
+from django.conf import settings
+from django.db import connection
+
 logger = logging.getLogger(__name__)
 
+# shared by all async_run calls in the process, see get_executor()
+executor = None
+executor_lock = threading.Lock()
+executor_counts = {'running': 0, 'queued': 0}
+# marks executor threads so nested async_run calls do not deadlock
+executor_local = threading.local()
+
 
 def generate_app_name():
     """Return a randomly-generated memorable name."""
@@ -145,42 +157,161 @@ def dict_merge(origin, merge):
     return result
 
 
-def async_run(tasks):
+def get_executor():
+    """
+    Get the process wide executor that async_run hands tasks to, sized by DEIS_ASYNC_WORKERS
+    """
+    global executor
+    if executor is None:
+        with executor_lock:
+            if executor is None:
+                executor = concurrent.futures.ThreadPoolExecutor(settings.DEIS_ASYNC_WORKERS)
+
+    return executor
+
+
+def executor_stats():
+    """Size, busy workers and queue depth of the async_run executor"""
+    with executor_lock:
+        stats = {
+            'workers': settings.DEIS_ASYNC_WORKERS,
+            'running': executor_counts['running'],
+            'queued': executor_counts['queued'],
+        }
+
+    return stats
+
+
+def _count(state, value):
+    with executor_lock:
+        executor_counts[state] += value
+
+
+def _worker(task):
+    """Runs a task in an executor thread, keeping track of what the executor is busy with"""
+    _count('queued', -1)
+    _count('running', 1)
+    executor_local.worker = True
+    try:
+        logger.debug('Running {}'.format(task))
+        result = task()
+        logger.debug('Finished running {}'.format(task))
+        return result
+    finally:
+        executor_local.worker = False
+        _count('running', -1)
+        # executor threads live on and would each hold on to a connection of their own
+        connection.close()
+
+
+def _submit(pool, task):
+    """Hand a task to the executor, or run it right away in this thread if there is none"""
+    if pool is not None:
+        _count('queued', 1)
+        return pool.submit(_worker, task)
+
+    future = concurrent.futures.Future()
+    try:
+        future.set_result(task())
+    except Exception as e:
+        future.set_exception(e)
+
+    return future
+
+
+def _cancel(tasks, pending):
+    """Drop tasks that were not handed out yet and cancel the ones still in the queue"""
+    cancelled = len(tasks)
+    del tasks[:]
+    for future in pending:
+        if future.cancel():
+            _count('queued', -1)
+            cancelled += 1
+
+    if cancelled:
+        logger.debug('cancelled {} tasks that did not start yet'.format(cancelled))
+
+
+def async_run(tasks, limit=None, fail_fast=True):
     """
     run a group of tasks async
     Requires the tasks arg to be a list of functools.partial()
+
+    Tasks run on a shared executor with at most limit of them in flight at once (defaults to
+    all of them, bounded by the executor size). If a task fails and fail_fast is set then
+    tasks that have not started yet are cancelled. All errors are logged and the first one
+    is raised once the tasks that did start are done.
     """
     if not tasks:
         return
 
-    # start a new async event loop
-    loop = asyncio.get_event_loop()
-    # https://github.com/python/asyncio/issues/258
-    executor = concurrent.futures.ThreadPoolExecutor(5)
-    loop.set_default_executor(executor)
+    # a task calling async_run would wait on workers it may itself be occupying
+    if getattr(executor_local, 'worker', False):
+        limit = 1
+        pool = None
+    else:
+        pool = get_executor()
+
+    tasks = list(tasks)
+    total = len(tasks)
+    limit = limit or total
+    errors = []
+    pending = set()
+    while tasks or pending:
+        if errors and fail_fast:
+            _cancel(tasks, pending)
+
+        # keep up to limit tasks in flight
+        while tasks and len(pending) < limit:
+            pending.add(_submit(pool, tasks.pop(0)))
 
-    async_tasks = [asyncio.ensure_future(async_task(task, loop)) for task in tasks]
-    # run tasks in parallel
-    loop.run_until_complete(asyncio.wait(async_tasks))
-    # deal with errors (exceptions, etc)
-    for task in async_tasks:
-        error = task.exception()
-        if error is not None:
-            raise error
+        done, pending = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            if not future.cancelled() and future.exception() is not None:
+                errors.append(future.exception())
 
-    executor.shutdown(wait=True)
+    logger.debug('async_run finished {} tasks, executor: {}'.format(total, executor_stats()))
 
+    if errors:
+        if len(errors) > 1:
+            logger.error('{} out of {} tasks failed:\n{}'.format(
+                len(errors), total, '\n'.join([str(error) for error in errors])
+            ))
 
-@asyncio.coroutine
-def async_task(params, loop):
+        raise errors[0]
+
+
+def advisory_lock_key(name):
+    """The Postgres advisory lock key for a lock name"""
+    return zlib.crc32(name.encode('utf-8'))
+
+
+@contextmanager
+def advisory_lock(name, wait=True):
     """
-    performs an async task
+    Hold the Postgres advisory lock of the given name for the duration of the block, shared
+    by every process using the database. Yields whether the lock was taken, which can only
+    be False when wait is unset and another session holds it
+
+    The lock belongs to the database session, so a process that dies lets go of it
     """
-    # get the calling function
-    logger.debug('Running {}'.format(params))
-    # This executes a task in its own thread (in parallel)
-    yield from loop.run_in_executor(None, params)
-    logger.debug('Finished running {}'.format(params))
+    key = advisory_lock_key(name)
+    with connection.cursor() as cursor:
+        if wait:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [key])
+            locked = True
+        else:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+            locked = cursor.fetchone()[0]
+
+    try:
+        yield locked
+    finally:
+        if locked:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
 
 
 if __name__ == "__main__":
@@ -1,16 +1,22 @@
 """
 RESTful view classes for presenting Deis API objects.
 """
-from django.http import Http404, HttpResponse
+import json
+import queue
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import connection
 from django.shortcuts import get_object_or_404
 from guardian.shortcuts import assign_perm, get_objects_for_user, \
     get_users_with_perms, remove_perm
 from django.views.generic import View
 from django.db.models.deletion import ProtectedError
 from rest_framework import mixins, renderers, status
-from rest_framework.exceptions import PermissionDenied, NotFound, AuthenticationFailed
+from rest_framework.exceptions import APIException, PermissionDenied, NotFound, AuthenticationFailed  # noqa
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
@@ -18,6 +24,7 @@ from rest_framework.authtoken.models import Token
 
 from api import authentication, models, permissions, serializers, viewsets
 from api.models import AlreadyExists, ServiceUnavailable, DeisException, UnprocessableEntity
+from scheduler import progress
 
 import logging
 
@@ -164,6 +171,115 @@ class BaseDeisViewSet(viewsets.OwnerViewSet):
     permission_classes = [IsAuthenticated, permissions.IsAppUser]
     renderer_classes = [renderers.JSONRenderer]
 
+    def respond_async(self):
+        """Check if the client asked for the work to be done in the background"""
+        prefer = self.request.META.get('HTTP_PREFER', '')
+        return settings.DEIS_ASYNC_OPERATIONS or 'respond-async' in prefer
+
+    def coalesce_deploys(self):
+        """Check if rollouts are held back to be collapsed with the changes that follow"""
+        return settings.DEIS_DEPLOY_COALESCE_WINDOW > 0
+
+    def enqueue(self, app, action, **params):
+        """Queue an operation for the run_operations worker"""
+        operation = models.Operation.objects.create(
+            owner=self.request.user, app=app, type=action, params=params
+        )
+        return self.accepted(operation)
+
+    def enqueue_deploy(self, release):
+        """Queue the rollout of a release, see :meth:`~api.models.Operation.deploy`"""
+        return self.accepted(models.Operation.deploy(self.request.user, release))
+
+    def perform_content_negotiation(self, request, force=False):
+        # streamed responses are not rendered by REST framework
+        force = force or self.respond_streaming()
+        return super(BaseDeisViewSet, self).perform_content_negotiation(request, force)
+
+    def respond_streaming(self):
+        """Check if the client asked to follow along as the work happens"""
+        accept = self.request.META.get('HTTP_ACCEPT', '')
+        return 'application/x-ndjson' in accept or 'text/event-stream' in accept
+
+    def stream(self, namespace, action):
+        """
+        Run action (returning the usual Response) in the background and stream the progress
+        events of the namespace as newline delimited JSON, or server-sent events if asked
+        for, ending with a done or error event carrying the status and data of the response
+
+        A heartbeat event goes out when there was nothing to tell for a while so proxies do
+        not drop the connection
+        """
+        # parse the body while the request is still being handled
+        self.request.data
+        events = progress.subscribe(namespace)
+        outcome = {}
+
+        def run():
+            try:
+                response = action()
+                outcome.update({'event': 'done', 'status': response.status_code, 'data': response.data})  # noqa
+            except APIException as e:
+                outcome.update({'event': 'error', 'status': e.status_code, 'detail': e.detail})
+            except Http404 as e:
+                outcome.update({'event': 'error', 'status': 404, 'detail': str(e)})
+            except Exception as e:
+                logger.exception('streamed request for {} failed'.format(namespace))
+                outcome.update({'event': 'error', 'status': 500, 'detail': str(e)})
+            finally:
+                # the thread got its own database connection
+                connection.close()
+                events.put(None)
+
+        def generate():
+            try:
+                yield {'event': 'started', 'namespace': namespace}
+                while True:
+                    try:
+                        event = events.get(timeout=settings.DEIS_STREAM_HEARTBEAT)
+                    except queue.Empty:
+                        event = {'event': 'heartbeat'}
+
+                    if event is None:
+                        break
+
+                    yield event
+
+                yield outcome
+            finally:
+                progress.unsubscribe(namespace, events)
+
+        threading.Thread(target=run, daemon=True).start()
+        return self.streaming_response(generate())
+
+    def streaming_response(self, events):
+        """
+        Stream events (dicts with an event key) as newline delimited JSON, or as server-sent
+        events if the client asked for those
+        """
+        sse = 'text/event-stream' in self.request.META.get('HTTP_ACCEPT', '')
+
+        def render():
+            for event in events:
+                data = json.dumps(event, cls=DjangoJSONEncoder)
+                if sse:
+                    yield 'event: {}\ndata: {}\n\n'.format(event['event'], data)
+                else:
+                    yield data + '\n'
+
+        content_type = 'text/event-stream' if sse else 'application/x-ndjson'
+        response = StreamingHttpResponse(render(), content_type=content_type)
+        response['Cache-Control'] = 'no-cache'
+        # keep nginx from holding back the events
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def accepted(self, operation):
+        """Respond with 202 Accepted and where a queued operation can be followed"""
+        data = serializers.OperationSerializer(operation).data
+        location = '/v2/operations/{}'.format(operation.uuid)
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
 
 class AppResourceViewSet(BaseDeisViewSet):
     """A viewset for objects which are attached to an application."""
@@ -218,8 +334,21 @@ class AppViewSet(BaseDeisViewSet):
         return Response(serializer.data)
 
     def scale(self, request, **kwargs):
-        self.get_object().scale(request.user, request.data)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        app = self.get_object()
+        if self.respond_async():
+            # answer a bad structure right away, as the synchronous path does
+            structure = dict(request.data.items())
+            app.validate_structure(structure)
+            return self.enqueue(app, 'scale', structure=structure)
+
+        def scale():
+            app.scale(request.user, request.data)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if self.respond_streaming():
+            return self.stream(app.id, scale)
+
+        return scale()
 
     def logs(self, request, **kwargs):
         app = self.get_object()
@@ -238,9 +367,27 @@ class AppViewSet(BaseDeisViewSet):
         app = self.get_object()
         if not request.data.get('command'):
             raise DeisException("command is a required field")
+        if self.respond_streaming():
+            output = app.run_stream(self.request.user, request.data['command'])
+            return self.streaming_response(self._run_events(output))
+
         rc, output = app.run(self.request.user, request.data['command'])
         return Response({'exit_code': rc, 'output': str(output)})
 
+    def _run_events(self, output):
+        """Turn what App.run_stream generates into events, the exit code coming last"""
+        try:
+            for kind, data in output:
+                if kind == 'exit':
+                    yield {'event': 'exit', 'exit_code': data}
+                else:
+                    yield {'event': kind, kind: data}
+        except APIException as e:
+            yield {'event': 'error', 'status': e.status_code, 'detail': e.detail}
+        finally:
+            # removes the run pod when the client went away halfway
+            output.close()
+
     def update(self, request, **kwargs):
         app = self.get_object()
         old_owner = app.owner
@@ -264,16 +411,69 @@ class BuildViewSet(ReleasableViewSet):
     model = models.Build
     serializer_class = serializers.BuildSerializer
 
+    def create(self, request, **kwargs):
+        if self.respond_streaming() and not self.respond_async():
+            return self.stream(self.get_app().id, lambda: self._create(request, **kwargs))
+
+        return self._create(request, **kwargs)
+
+    def _create(self, request, **kwargs):
+        response = super(BuildViewSet, self).create(request, **kwargs)
+        if hasattr(self, 'operation'):
+            return self.operation
+
+        return response
+
     def post_save(self, build):
-        self.release = build.create(self.request.user)
+        if self.coalesce_deploys():
+            # record the release right away, roll it out once changes settle down
+            self.release = build.create(self.request.user, deploy=False)
+            self.operation = self.enqueue_deploy(self.release)
+        else:
+            self.release = build.create(self.request.user)
+
         super(BuildViewSet, self).post_save(build)
 
+    def promote(self, request, **kwargs):
+        """
+        Create a build out of the image a release of another application has published
+        and deploy it
+        """
+        app = self.get_app()
+        if 'app' not in request.data:
+            raise DeisException("app is a required field")
+
+        source = get_object_or_404(models.App, id=request.data['app'])
+        self.check_object_permissions(request, source)
+        releases = source.release_set.filter(failed=False)
+        if request.data.get('version', None) is None:
+            release = releases.latest()
+        else:
+            release = get_object_or_404(releases, version=request.data['version'])
+
+        new_release = release.promote(request.user, app)
+        serializer = self.get_serializer(new_release.build)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class ConfigViewSet(ReleasableViewSet):
     """A viewset for interacting with Config objects."""
     model = models.Config
     serializer_class = serializers.ConfigSerializer
 
+    def create(self, request, **kwargs):
+        if self.respond_streaming() and not self.respond_async():
+            return self.stream(self.get_app().id, lambda: self._create(request, **kwargs))
+
+        return self._create(request, **kwargs)
+
+    def _create(self, request, **kwargs):
+        response = super(ConfigViewSet, self).create(request, **kwargs)
+        if hasattr(self, 'operation'):
+            return self.operation
+
+        return response
+
     def post_save(self, config):
         release = config.app.release_set.filter(failed=False).latest()
         latest_version = config.app.release_set.latest().version
@@ -281,6 +481,10 @@ class ConfigViewSet(ReleasableViewSet):
             self.release = release.new(self.request.user, config=config, build=release.build)
             # It's possible to set config values before a build
             if self.release.build is not None:
+                if self.respond_async() or self.coalesce_deploys():
+                    self.operation = self.enqueue_deploy(self.release)
+                    return
+
                 config.app.deploy(self.release)
         except Exception as e:
             if (not hasattr(self, 'release') and
@@ -309,7 +513,12 @@ class PodViewSet(AppResourceViewSet):
         return Response(pagination, status=status.HTTP_200_OK)
 
     def restart(self, *args, **kwargs):
-        pods = self.get_app().restart(**kwargs)
+        app = self.get_app()
+        if self.respond_async():
+            params = {key: value for key, value in kwargs.items() if key in ['type', 'name']}
+            return self.enqueue(app, 'restart', **params)
+
+        pods = app.restart(**kwargs)
         data = self.get_serializer(pods, many=True).data
         # fake out pagination for now
         # pagination = {'results': data, 'count': len(data)}
@@ -424,10 +633,29 @@ class ReleaseViewSet(AppResourceViewSet):
         Create a new release as a copy of the state of the compiled slug and config vars of a
         previous release.
         """
-        release = self.get_app().release_set.filter(failed=False).latest()
-        new_release = release.rollback(request.user, request.data.get('version', None))
-        response = {'version': new_release.version}
-        return Response(response, status=status.HTTP_201_CREATED)
+        app = self.get_app()
+
+        def rollback():
+            release = app.release_set.filter(failed=False).latest()
+            new_release = release.rollback(request.user, request.data.get('version', None))
+            response = {'version': new_release.version}
+            return Response(response, status=status.HTTP_201_CREATED)
+
+        if self.respond_streaming():
+            return self.stream(app.id, rollback)
+
+        return rollback()
+
+
+class OperationViewSet(BaseDeisViewSet):
+    """A viewset for following operations queued in the background."""
+    model = models.Operation
+    serializer_class = serializers.OperationSerializer
+
+    def get_object(self, **kwargs):
+        operation = get_object_or_404(self.model, uuid=self.kwargs['uuid'])
+        self.check_object_permissions(self.request, operation.app)
+        return operation
 
 
 class TLSViewSet(AppResourceViewSet):
@@ -525,12 +753,21 @@ class BuildHookViewSet(BaseHookViewSet):
         request.data['app'] = app
         request.data['owner'] = self.user
         super(BuildHookViewSet, self).create(request, *args, **kwargs)
+        if hasattr(self, 'operation'):
+            return self.operation
+
         # return the application databag
         response = {'release': {'version': app.release_set.filter(failed=False).latest().version}}
         return Response(response, status=status.HTTP_200_OK)
 
     def post_save(self, build):
-        build.create(self.user)
+        if self.coalesce_deploys():
+            # record the release right away, roll it out once changes settle down
+            self.operation = self.enqueue_deploy(build.create(self.user, deploy=False))
+        elif self.respond_async():
+            self.operation = self.enqueue(build.app, 'build', build=str(build.uuid))
+        else:
+            build.create(self.user)
 
 
 class ConfigHookViewSet(BaseHookViewSet):
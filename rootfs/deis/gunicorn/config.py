@@ -22,6 +22,12 @@ accesslog = '-'
 access_log_format = '%(h)s "%(r)s" %(s)s %(b)s "%(a)s"'
 
 
+def post_fork(server, worker):
+    """Make sure a worker does not share Kubernetes connections with the master process."""
+    from scheduler import reset_client
+    reset_client()
+
+
 def worker_int(worker):
     """Print a stack trace when a worker receives a SIGINT or SIGQUIT signal."""
     worker.log.warning('worker terminated')
@@ -1 +1,3 @@
 from .dockerclient import publish_release, get_port, RegistryException  # noqa
+from .registryclient import RegistryClient  # noqa
+from .metadata import pin as pin_image  # noqa
@@ -14,6 +14,8 @@ from docker.auth import auth
 from docker.errors import APIError
 import requests
 
+from . import retention
+
 logger = logging.getLogger(__name__)
 
 
@@ -115,6 +117,18 @@ class DockerClient(object):
         except APIError as e:
             raise RegistryException(str(e))
 
+        # what was pulled and tagged along the way is of no further use to the controller
+        self.collect()
+
+    def collect(self):
+        """Remove images the controller no longer needs from the local Docker graph."""
+        try:
+            removed, freed = retention.collect(self.client)
+            if removed:
+                logger.info('Removed {} Docker images, freeing {} bytes'.format(removed, freed))
+        except APIError as e:
+            logger.warning('Could not clean up Docker images: {}'.format(e))
+
     @backoff.on_exception(backoff.expo, Exception, max_tries=3)
     def pull(self, repo, tag):
         """Pull a Docker image into the local storage graph."""
@@ -122,6 +136,7 @@ class DockerClient(object):
         logger.info("Pulling Docker image {}:{}".format(repo, tag))
         stream = self.client.pull(repo, tag=tag, stream=True, decode=True)
         log_output(stream, 'pull', repo, tag)
+        retention.track('{}:{}'.format(repo, tag))
 
     @backoff.on_exception(backoff.expo, Exception, max_tries=3)
     def push(self, repo, tag):
@@ -138,6 +153,8 @@ class DockerClient(object):
         if not self.client.tag(image, repo, tag=tag, force=True):
             raise RegistryException('Tagging {} as {}:{} failed'.format(image, repo, tag))
 
+        retention.track('{}:{}'.format(repo, tag))
+
     @backoff.on_exception(backoff.expo, Exception, max_tries=3)
     def inspect_image(self, target):
         """
@@ -192,8 +209,30 @@ def stream_error(chunk, operation, repo, tag):
 
 
 def publish_release(source, target, deis_registry, creds=None):
+    if settings.REGISTRY_API_PUBLISH:
+        # lazy load, registryclient imports this module
+        from .registryclient import publish_release as registry_publish_release
+        check_blacklist(source)
+        check_blacklist(target)
+        try:
+            # copy manifests (and only missing blobs) instead of pulling and pushing layers
+            return registry_publish_release(source, target, deis_registry, creds)
+        except RegistryException as e:
+            logger.info('Could not publish {} through the registry API, falling back to docker: {}'.format(source, e))  # noqa
+
     return DockerClient().publish_release(source, target, deis_registry, creds)
 
 
 def get_port(target, deis_registry, creds=None):
+    if settings.REGISTRY_API_INSPECT:
+        # lazy load, metadata imports this module
+        from .metadata import image_metadata
+        check_blacklist(target)
+        try:
+            # read the image config from the registry (or the metadata cache) instead of
+            # pulling the whole image
+            return image_metadata(target, deis_registry, creds).port
+        except RegistryException as e:
+            logger.info('Could not inspect {} through the registry API, falling back to docker: {}'.format(target, e))  # noqa
+
     return DockerClient().get_port(target, deis_registry, creds)
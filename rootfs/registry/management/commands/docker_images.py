@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from registry import retention
+from registry.dockerclient import DockerClient
+
+
+class Command(BaseCommand):
+    """Management command for the images the controller keeps in its local Docker graph"""
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collect', action='store_true', default=False,
+            help='Remove least recently used images beyond the retention limits'
+        )
+
+    def handle(self, *args, **options):
+        """Show how much space tracked images take up, and optionally clean them up"""
+        client = DockerClient()
+        if options['collect']:
+            removed, freed = retention.collect(client.client)
+            print('Removed {} images, freeing {} bytes'.format(removed, freed))
+
+        stats = retention.usage(client.client)
+        for image in stats['images']:
+            print('{}\t{}\t{}'.format(image['image'], image['size'], image['last_used']))
+
+        print('Tracked images: {} ({} bytes)'.format(stats['tracked'], stats['tracked_size']))
+        print('All images: {} bytes'.format(stats['total_size']))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of image metadata (exposed ports, entrypoint, size and the rest of the config)
+
+Metadata is stored in the database per image reference and resolved digest, so an image
+is only ever inspected once per digest. On top of that a small in-memory LRU remembers
+which metadata a reference resolved to for TTL seconds, so the many port lookups of a
+single deploy do not even have to ask the registry what a tag points at. Once that
+expires the tag is resolved again and a new digest means the image is inspected anew.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+from .registryclient import RegistryClient
+
+# how many image references to remember in memory
+SIZE = 256
+# how long a tag is trusted to point at the same digest, in seconds
+TTL = 60
+
+# image reference -> (ImageMetadata, time it was resolved)
+lru = OrderedDict()
+lock = threading.Lock()
+
+
+def _remembered(target):
+    with lock:
+        entry = lru.get(target)
+        if entry is None:
+            return None
+
+        metadata, resolved = entry
+        # references pinned to a digest never change
+        if '@' not in target and resolved + TTL <= time.time():
+            return None
+
+        lru.move_to_end(target)
+        return metadata
+
+
+def _remember(target, metadata):
+    with lock:
+        lru[target] = (metadata, time.time())
+        lru.move_to_end(target)
+        while len(lru) > SIZE:
+            lru.popitem(last=False)
+
+
+def image_metadata(target, deis_registry=False, creds=None):
+    """
+    Get the ImageMetadata of an image, inspecting it through the registry HTTP API
+    only if the digest its reference resolves to has not been seen before
+
+    Raises RegistryException if the registry can not be asked
+    """
+    from .models import ImageMetadata  # lazy load, needs the app registry to be ready
+
+    metadata = _remembered(target)
+    if metadata is not None:
+        return metadata
+
+    client, repo, reference = RegistryClient.for_image(target, deis_registry, creds)
+    digest = client.digest(repo, reference)
+    metadata = ImageMetadata.objects.filter(image=target, digest=digest).first()
+    if metadata is None:
+        # inspect by digest so the config matches what was resolved even if the tag moves
+        info = client.inspect(repo, digest)
+        config = info['config']
+        ports = [int(port.split('/')[0]) for port in (config.get('ExposedPorts') or {})]
+        metadata, _ = ImageMetadata.objects.update_or_create(
+            image=target, digest=digest,
+            defaults={
+                'ports': ports,
+                'entrypoint': config.get('Entrypoint') or [],
+                'cmd': config.get('Cmd') or [],
+                'env': config.get('Env') or [],
+                'size': info['size'],
+                'config': config,
+            }
+        )
+
+        # the tag moved on, what it pointed at before is of no use anymore
+        ImageMetadata.objects.filter(image=target).exclude(digest=digest).delete()
+
+    _remember(target, metadata)
+    return metadata
+
+
+def pin(target, deis_registry=False, creds=None):
+    """
+    Get a reference to the exact image a reference points at right now, such as
+    127.0.0.1:5000/ozzy/embryo@sha256:..., with the known metadata carried over to it
+
+    Raises RegistryException if the registry can not be asked
+    """
+    from .models import ImageMetadata  # lazy load, needs the app registry to be ready
+
+    metadata = image_metadata(target, deis_registry, creds)
+    name = target.split('@', 1)[0]
+    # drop the tag, a colon before the last slash belongs to the registry port
+    if ':' in name.rsplit('/', 1)[-1]:
+        name = name.rsplit(':', 1)[0]
+
+    pinned = '{}@{}'.format(name, metadata.digest)
+    ImageMetadata.objects.get_or_create(
+        image=pinned, digest=metadata.digest,
+        defaults={
+            field: getattr(metadata, field)
+            for field in ['ports', 'entrypoint', 'cmd', 'env', 'size', 'config']
+        }
+    )
+
+    return pinned
+
+
+def forget(target=None):
+    """Drop an image reference, or all of them, from memory"""
+    with lock:
+        if target is None:
+            lru.clear()
+        else:
+            lru.pop(target, None)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.3 on 2016-12-05 18:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageMetadata',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('image', models.TextField()),
+                ('digest', models.TextField()),
+                ('ports', jsonfield.fields.JSONField(blank=True, default=[])),
+                ('entrypoint', jsonfield.fields.JSONField(blank=True, default=[])),
+                ('cmd', jsonfield.fields.JSONField(blank=True, default=[])),
+                ('env', jsonfield.fields.JSONField(blank=True, default=[])),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('config', jsonfield.fields.JSONField(blank=True, default={})),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='imagemetadata',
+            unique_together=set([('image', 'digest')]),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Data models for the Deis registry app.
+"""
+from django.db import models
+from django.utils import timezone
+from jsonfield import JSONField
+
+
+class ImageMetadata(models.Model):
+    """
+    What an image looked like at a given digest, as read from its registry
+
+    Digests are immutable so a record never goes stale, a tag moving on to a new
+    digest gets a new record
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    # image reference as used in a release, such as quay.io/ozzy/embryo:v4
+    image = models.TextField()
+    # digest of the manifest the reference resolved to
+    digest = models.TextField()
+    ports = JSONField(default=[], blank=True)
+    entrypoint = JSONField(default=[], blank=True)
+    cmd = JSONField(default=[], blank=True)
+    env = JSONField(default=[], blank=True)
+    # total size of config and layers in bytes, if the manifest tells
+    size = models.BigIntegerField(null=True, blank=True)
+    config = JSONField(default={}, blank=True)
+
+    class Meta:
+        unique_together = (('image', 'digest'),)
+
+    @property
+    def port(self):
+        """The first port the image exposes, None if it exposes nothing"""
+        if not self.ports:
+            return None
+
+        return self.ports[0]
+
+    def __str__(self):
+        return '{}@{}'.format(self.image, self.digest)
+
+
+class LocalImage(models.Model):
+    """
+    An image the controller pulled or tagged into the Docker graph it shares with the node
+
+    Tracked so they can be removed again once they are no longer of use, see
+    registry.retention
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    # when the controller last pulled or tagged the image
+    last_used = models.DateTimeField(default=timezone.now)
+    # image reference with its tag, such as quay.io/ozzy/embryo:v4
+    image = models.TextField(unique=True)
+
+    class Meta:
+        ordering = ['last_used']
+
+    def __str__(self):
+        return self.image
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""Inspect and promote Docker images through the Docker Registry v2 HTTP API, without pulls."""
+
+import hashlib
+import json
+import logging
+import re
+from urllib.parse import urljoin
+
+from django.conf import settings
+import requests
+
+from .dockerclient import RegistryException
+
+logger = logging.getLogger(__name__)
+
+# Docker Hub images have no registry in their name and are served from here
+DOCKER_HUB = 'registry-1.docker.io'
+DOCKER_HUB_NAMES = ['docker.io', 'index.docker.io', DOCKER_HUB]
+
+MANIFEST_LIST = 'application/vnd.docker.distribution.manifest.list.v2+json'
+MANIFEST_V2 = 'application/vnd.docker.distribution.manifest.v2+json'
+MANIFEST_V1 = 'application/vnd.docker.distribution.manifest.v1+json'
+MANIFEST_V1_SIGNED = 'application/vnd.docker.distribution.manifest.v1+prettyjws'
+OCI_INDEX = 'application/vnd.oci.image.index.v1+json'
+OCI_MANIFEST = 'application/vnd.oci.image.manifest.v1+json'
+
+# bytes of a layer held in memory at once while streaming it between registries
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_image(target):
+    """
+    Split an image name into registry host, repository and reference (tag or digest)
+
+    ozzy/embryo:v4 -> (registry-1.docker.io, ozzy/embryo, v4)
+    """
+    reference = 'latest'
+    name = target
+    if '@' in name:
+        name, reference = name.rsplit('@', 1)
+    else:
+        parts = name.rsplit(':', 1)
+        if len(parts) == 2 and '/' not in parts[1]:
+            name, reference = parts
+
+    registry = DOCKER_HUB
+    parts = name.split('/', 1)
+    # the first component is a registry if it looks like a host name
+    if len(parts) == 2 and ('.' in parts[0] or ':' in parts[0] or parts[0] == 'localhost'):
+        registry, name = parts
+
+    if registry in DOCKER_HUB_NAMES:
+        registry = DOCKER_HUB
+        # official images live under library/
+        if '/' not in name:
+            name = 'library/' + name
+
+    return registry, name, reference
+
+
+def parse_challenge(header):
+    """Parse a WWW-Authenticate header into its scheme and parameters"""
+    scheme, _, params = header.partition(' ')
+    return scheme.lower(), dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+
+class RegistryClient(object):
+    """
+    Read manifests and image configs from a Docker Registry v2 HTTP API
+
+    Handles Basic and Bearer token auth as well as manifest lists, schema 2 (and OCI)
+    and schema 1 manifests. Only manifests and the small config blob are downloaded,
+    never layers.
+    """
+
+    def __init__(self, registry, creds=None, insecure=False, session=None):
+        self.registry = registry
+        self.creds = creds or {}
+        self.url = '{}://{}'.format('http' if insecure else 'https', registry)
+        self.session = session or requests.Session()
+        # scope -> bearer token
+        self.tokens = {}
+
+    @classmethod
+    def for_image(cls, target, deis_registry=False, creds=None):
+        """Build a client for the registry an image lives in, returning it with repo and ref"""
+        registry, repo, reference = parse_image(target)
+        # the Deis registry is only reachable inside the cluster and does not do TLS
+        insecure = deis_registry or registry == settings.REGISTRY_URL
+        return cls(registry, creds, insecure), repo, reference
+
+    def _auth(self):
+        if self.creds.get('username') and self.creds.get('password'):
+            return (self.creds['username'], self.creds['password'])
+
+        return None
+
+    def _token(self, challenge):
+        scope = challenge.get('scope', '')
+        if scope not in self.tokens:
+            params = {k: v for k, v in challenge.items() if k in ['service', 'scope']}
+            response = self.session.get(
+                challenge['realm'], params=params, auth=self._auth(),
+                timeout=settings.REGISTRY_API_TIMEOUT
+            )
+            if response.status_code != 200:
+                raise RegistryException('Could not authenticate with registry {}: {} {}'.format(
+                    self.registry, response.status_code, response.reason))
+
+            data = response.json()
+            self.tokens[scope] = data.get('token') or data.get('access_token')
+
+        return self.tokens[scope]
+
+    def _request(self, path, method='GET', expect=(200,), **kwargs):
+        """Request a registry path, answering Basic and Bearer auth challenges as needed"""
+        # upload locations handed out by the registry may be absolute
+        url = urljoin(self.url, path)
+        kwargs.setdefault('timeout', settings.REGISTRY_API_TIMEOUT)
+        headers = kwargs.pop('headers', {})
+        try:
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            if response.status_code == 401 and 'WWW-Authenticate' in response.headers:
+                scheme, challenge = parse_challenge(response.headers['WWW-Authenticate'])
+                if scheme == 'bearer':
+                    headers['Authorization'] = 'Bearer {}'.format(self._token(challenge))
+                    response = self.session.request(method, url, headers=headers, **kwargs)
+                elif scheme == 'basic' and self._auth():
+                    response = self.session.request(method, url, headers=headers, auth=self._auth(), **kwargs)  # noqa
+        except requests.exceptions.RequestException as e:
+            raise RegistryException('Could not reach registry {}: {}'.format(self.registry, e)) from e  # noqa
+
+        if response.status_code not in expect:
+            raise RegistryException('Registry {} returned {} {} for {}'.format(
+                self.registry, response.status_code, response.reason, path))
+
+        return response
+
+    def _manifest(self, repo, reference, method='GET', **kwargs):
+        accept = [MANIFEST_LIST, OCI_INDEX, MANIFEST_V2, OCI_MANIFEST, MANIFEST_V1_SIGNED, MANIFEST_V1]  # noqa
+        return self._request(
+            '/v2/{}/manifests/{}'.format(repo, reference),
+            method=method,
+            headers={'Accept': ', '.join(accept)},
+            **kwargs
+        )
+
+    def digest(self, repo, reference):
+        """Resolve a tag to the digest of the manifest it currently points at"""
+        if reference.startswith('sha256:'):
+            return reference
+
+        digest = self._manifest(repo, reference, method='HEAD').headers.get('Docker-Content-Digest')  # noqa
+        if digest:
+            return digest
+
+        # not every registry sends the digest along, it is the hash of the manifest
+        response = self._manifest(repo, reference)
+        return 'sha256:' + hashlib.sha256(response.content).hexdigest()
+
+    def tagged(self, repo, tag):
+        """Get the digest a tag points at, None if the tag does not exist"""
+        response = self._manifest(repo, tag, method='HEAD', expect=(200, 404))
+        if response.status_code == 404:
+            return None
+
+        return response.headers.get('Docker-Content-Digest')
+
+    def raw_manifest(self, repo, reference):
+        """
+        Fetch a manifest exactly as the registry serves it, returning the body along with
+        its media type and digest. Pushing the very same bytes elsewhere keeps the digest
+        """
+        response = self._manifest(repo, reference)
+        manifest = response.json()
+        media_type = manifest.get('mediaType') or response.headers.get('Content-Type', '').split(';')[0]  # noqa
+        # schema 1 manifests do not carry a media type in the body
+        if manifest.get('schemaVersion') == 1:
+            media_type = MANIFEST_V1
+
+        digest = response.headers.get('Docker-Content-Digest')
+        if not digest:
+            digest = 'sha256:' + hashlib.sha256(response.content).hexdigest()
+
+        return response.content, media_type, digest
+
+    def manifest(self, repo, reference):
+        """Fetch a manifest, returning it along with its media type and digest"""
+        body, media_type, digest = self.raw_manifest(repo, reference)
+        return json.loads(body.decode('utf-8')), media_type, digest
+
+    def blob(self, repo, digest):
+        """Fetch a (small) blob such as an image config"""
+        return self._request('/v2/{}/blobs/{}'.format(repo, digest)).json()
+
+    def has_blob(self, repo, digest):
+        """Check if a repository already holds a blob"""
+        path = '/v2/{}/blobs/{}'.format(repo, digest)
+        return self._request(path, method='HEAD', expect=(200, 404)).status_code == 200
+
+    def stream_blob(self, repo, digest):
+        """Iterate over the content of a blob, such as a layer, without holding it in memory"""
+        response = self._request('/v2/{}/blobs/{}'.format(repo, digest), stream=True)
+        return response.iter_content(BLOB_CHUNK_SIZE)
+
+    def mount(self, repo, digest, source):
+        """
+        Make a blob of another repository in this registry available in repo without
+        copying it. Returns None when mounted, otherwise the location of the upload the
+        registry started instead
+        """
+        response = self._request(
+            '/v2/{}/blobs/uploads/'.format(repo), method='POST',
+            params={'mount': digest, 'from': source}, expect=(201, 202)
+        )
+        if response.status_code == 201:
+            return None
+
+        return response.headers['Location']
+
+    def upload(self, repo, digest, data, location=None):
+        """Upload a blob in one go, data may be an iterator to stream it"""
+        if location is None:
+            response = self._request(
+                '/v2/{}/blobs/uploads/'.format(repo), method='POST', expect=(202,))
+            location = response.headers['Location']
+
+        self._request(
+            location, method='PUT', params={'digest': digest}, data=data,
+            headers={'Content-Type': 'application/octet-stream'}, expect=(201,)
+        )
+
+    def put_manifest(self, repo, tag, body, media_type):
+        """Point a tag at a manifest"""
+        self._request(
+            '/v2/{}/manifests/{}'.format(repo, tag), method='PUT', data=body,
+            headers={'Content-Type': media_type}, expect=(201,)
+        )
+
+    def inspect(self, repo, reference):
+        """
+        Get the config of an image (the part of docker inspect with ExposedPorts, Env and
+        such) along with the digest the reference resolved to and the image size in bytes
+        if the manifest tells
+        """
+        manifest, media_type, digest = self.manifest(repo, reference)
+        if media_type in [MANIFEST_LIST, OCI_INDEX]:
+            manifest, media_type, _ = self.manifest(repo, self._platform(manifest))
+
+        if media_type in [MANIFEST_V2, OCI_MANIFEST]:
+            config = self.blob(repo, manifest['config']['digest']).get('config') or {}
+            blobs = [manifest['config']] + manifest.get('layers', [])
+            size = sum(blob.get('size', 0) for blob in blobs)
+        elif media_type == MANIFEST_V1:
+            # the newest layer describes the image
+            config = json.loads(manifest['history'][0]['v1Compatibility']).get('config') or {}
+            size = None
+        else:
+            raise RegistryException('Unsupported manifest type {} for {}:{}'.format(
+                media_type, repo, reference))
+
+        return {'digest': digest, 'config': config, 'size': size}
+
+    def image_config(self, repo, reference):
+        """Get the config of an image"""
+        return self.inspect(repo, reference)['config']
+
+    def _platform(self, manifest_list):
+        """Pick the linux/amd64 image out of a manifest list"""
+        for item in manifest_list.get('manifests', []):
+            platform = item.get('platform', {})
+            if platform.get('os') == 'linux' and platform.get('architecture') == 'amd64':
+                return item['digest']
+
+        raise RegistryException('No linux/amd64 image in manifest list')
+
+    def get_port(self, repo, reference):
+        """Get the first port an image exposes, None if it exposes nothing"""
+        config = self.image_config(repo, reference)
+        if not config.get('ExposedPorts'):
+            return None
+
+        return int(list(config['ExposedPorts'].keys())[0].split('/')[0])
+
+
+def publish_release(source, target, deis_registry=False, creds=None):
+    """
+    Publish a source image to deis-registry as target through the registry HTTP API
+
+    Nothing is copied when the target tag already points at the source image. Blobs the
+    target repository lacks are mounted from the source repository when both live in
+    deis-registry, and streamed from one registry to the other otherwise, so layers never
+    land on the controller's disk. Tagging is a manifest upload.
+
+    Raises RegistryException if the image can not be promoted this way
+    """
+    # NOTE: this relies on an implementation detail of deis-builder, that
+    # the image has been uploaded already to deis-registry
+    if deis_registry:
+        source = '{}/{}'.format(settings.REGISTRY_URL, source)
+
+    src, src_repo, reference = RegistryClient.for_image(source, deis_registry, creds)
+    # we always publish to the Deis registry
+    dst = RegistryClient(settings.REGISTRY_URL, insecure=True)
+    _, repo, tag = parse_image(target)
+
+    body, media_type, digest = src.raw_manifest(src_repo, reference)
+    if media_type in [MANIFEST_LIST, OCI_INDEX]:
+        body, media_type, digest = src.raw_manifest(src_repo, src._platform(json.loads(body.decode('utf-8'))))  # noqa
+
+    # schema 1 manifests are signed for their original name and tag
+    if media_type not in [MANIFEST_V2, OCI_MANIFEST]:
+        raise RegistryException('Can not promote {} manifests through the registry API'.format(media_type))  # noqa
+
+    if dst.tagged(repo, tag) == digest:
+        logger.info('{} already points at {}, nothing to publish'.format(target, digest))
+        return
+
+    manifest = json.loads(body.decode('utf-8'))
+    same_registry = src.registry == dst.registry
+    for blob in [manifest['config']] + manifest.get('layers', []):
+        if dst.has_blob(repo, blob['digest']):
+            continue
+
+        location = None
+        if same_registry:
+            location = dst.mount(repo, blob['digest'], src_repo)
+            if location is None:
+                continue
+
+        logger.info('Copying blob {} of {} to {}'.format(blob['digest'], source, target))
+        dst.upload(repo, blob['digest'], src.stream_blob(src_repo, blob['digest']), location)
+
+    logger.info('Publishing {} as {}'.format(source, target))
+    dst.put_manifest(repo, tag, body, media_type)
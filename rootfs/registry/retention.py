@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Retention of the images the controller leaves in the Docker graph of its node
+
+Pulling and tagging images to publish or inspect them fills up the Docker graph behind
+/var/run/docker.sock. Every image the controller pulls or tags is tracked in the database
+(which all controller processes share, as they share the Docker daemon) and once an image
+has been pushed the least recently used ones are removed again, keeping at most
+DOCKER_IMAGE_RETENTION_COUNT of them and removing more while the images in the graph
+take up more than DOCKER_IMAGE_RETENTION_BYTES.
+"""
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+from docker.errors import APIError
+
+logger = logging.getLogger(__name__)
+
+# seconds an image is left alone after it was pulled or tagged, so a publish in progress
+# in another controller process does not lose its image halfway
+GRACE = 600
+
+
+def track(image):
+    """Remember that the controller pulled or tagged an image"""
+    if not settings.DOCKER_IMAGE_RETENTION:
+        return
+
+    from .models import LocalImage  # lazy load, needs the app registry to be ready
+    LocalImage.objects.update_or_create(image=image, defaults={'last_used': timezone.now()})
+
+
+def _sizes(client):
+    """Map every tag in the Docker graph to the size of its image"""
+    sizes = {}
+    for image in client.images():
+        for tag in image.get('RepoTags') or []:
+            sizes[tag] = image.get('Size') or 0
+
+    return sizes
+
+
+def usage(client):
+    """
+    Describe the tracked images and the Docker graph, sizes are in bytes
+
+    Images sharing layers are counted in full each, as Docker reports them
+    """
+    from .models import LocalImage  # lazy load, needs the app registry to be ready
+
+    sizes = _sizes(client)
+    tracked = list(LocalImage.objects.all())
+    return {
+        'images': [
+            {'image': local.image, 'size': sizes.get(local.image), 'last_used': local.last_used}
+            for local in tracked
+        ],
+        'tracked': len(tracked),
+        'tracked_size': sum(sizes.get(local.image, 0) for local in tracked),
+        'total_size': sum(sizes.values()),
+    }
+
+
+def collect(client):
+    """
+    Remove the least recently used tracked images from the Docker graph, returning how
+    many images were removed and how many bytes that freed
+    """
+    if not settings.DOCKER_IMAGE_RETENTION:
+        return 0, 0
+
+    from .models import LocalImage  # lazy load, needs the app registry to be ready
+
+    sizes = _sizes(client)
+    total = sum(sizes.values())
+    tracked = list(LocalImage.objects.all())
+    remaining = len(tracked)
+    # images another controller process may be about to tag or push
+    recent = timezone.now() - timedelta(seconds=GRACE)
+    removed, freed = 0, 0
+    for local in tracked:
+        if remaining <= settings.DOCKER_IMAGE_RETENTION_COUNT and total <= settings.DOCKER_IMAGE_RETENTION_BYTES:  # noqa
+            break
+
+        if local.image not in sizes:
+            # gone from the graph already, someone else cleaned up
+            local.delete()
+            remaining -= 1
+            continue
+
+        if local.last_used > recent:
+            break
+
+        try:
+            logger.info('Removing Docker image {} ({} bytes)'.format(local.image, sizes[local.image]))  # noqa
+            client.remove_image(local.image)
+        except APIError as e:
+            # most likely still used by a container, try again next time
+            logger.info('Could not remove Docker image {}: {}'.format(local.image, e))
+            continue
+
+        local.delete()
+        remaining -= 1
+        removed += 1
+        total -= sizes[local.image]
+        freed += sizes[local.image]
+
+    return removed, freed
@@ -4,13 +4,27 @@ Unit tests for the Deis registry app.
 Run the tests with "./manage.py test registry"
 """
 
+from datetime import timedelta
+import json
 import unittest
 from unittest import mock
 
 from django.conf import settings
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from docker.errors import APIError
+import requests_mock
 from rest_framework.exceptions import PermissionDenied
 from registry import publish_release, get_port, RegistryException
 from registry.dockerclient import DockerClient
+from registry.metadata import image_metadata, forget
+from registry import retention
+from registry.models import ImageMetadata, LocalImage
+from registry.registryclient import (
+    RegistryClient, parse_image, MANIFEST_LIST, MANIFEST_V2, MANIFEST_V1_SIGNED
+)
+from registry.registryclient import publish_release as registry_publish_release
 
 
 @mock.patch('docker.Client')
@@ -204,3 +218,354 @@ class DockerClientTest(unittest.TestCase):
 
         with self.assertRaises(PermissionDenied):
             self.client.tag('localhost:5000/deis/controller:v1.11.1', 'deis/controller', 'v1.11.1')
+
+
+class StandInRegistry(object):
+    """Serves manifests and blobs like a Docker Registry v2 with token auth would"""
+    url = 'https://quay.io'
+
+    def __init__(self, mocker):
+        self.mocker = mocker
+        mocker.get('https://auth.quay.io/token', json={'token': 'sekrit'})
+
+    def challenge(self, request, context):
+        if request.headers.get('Authorization') != 'Bearer sekrit':
+            context.status_code = 401
+            context.headers['WWW-Authenticate'] = 'Bearer realm="https://auth.quay.io/token",service="quay.io",scope="repository:ozzy/embryo:pull"'  # noqa
+            return False
+
+        return True
+
+    def add(self, path, body, media_type=None, digest=None):
+        def respond(request, context):
+            if not self.challenge(request, context):
+                return {}
+
+            if media_type:
+                context.headers['Content-Type'] = media_type
+
+            if digest:
+                context.headers['Docker-Content-Digest'] = digest
+
+            return body
+
+        self.mocker.get(self.url + path, json=respond)
+        self.mocker.head(self.url + path, json=respond)
+
+
+@requests_mock.Mocker()
+class RegistryClientTest(unittest.TestCase):
+    """Test that image metadata is read from the registry HTTP API without pulling layers"""
+
+    def setUp(self):
+        self.config = {'config': {'ExposedPorts': {'5000/tcp': {}}}}
+
+    def test_parse_image(self, mocker):
+        self.assertEqual(parse_image('ozzy/embryo:v4'), ('registry-1.docker.io', 'ozzy/embryo', 'v4'))  # noqa
+        self.assertEqual(parse_image('alpine'), ('registry-1.docker.io', 'library/alpine', 'latest'))  # noqa
+        self.assertEqual(parse_image('quay.io/ozzy/embryo'), ('quay.io', 'ozzy/embryo', 'latest'))  # noqa
+        self.assertEqual(parse_image('localhost:5000/embryo:git-f2a8020'), ('localhost:5000', 'embryo', 'git-f2a8020'))  # noqa
+        self.assertEqual(parse_image('embryo@sha256:abc'), ('registry-1.docker.io', 'library/embryo', 'sha256:abc'))  # noqa
+
+    def test_schema2(self, mocker):
+        registry = StandInRegistry(mocker)
+        registry.add('/v2/ozzy/embryo/manifests/v4', {
+            'schemaVersion': 2,
+            'mediaType': MANIFEST_V2,
+            'config': {'digest': 'sha256:config'},
+            'layers': [{'digest': 'sha256:layer'}],
+        })
+        registry.add('/v2/ozzy/embryo/blobs/sha256:config', self.config)
+
+        client = RegistryClient('quay.io', {'username': 'ozzy', 'password': 'osbourne'})
+        self.assertEqual(client.get_port('ozzy/embryo', 'v4'), 5000)
+        # the token was requested with the credentials and then reused
+        token_requests = [r for r in mocker.request_history if r.netloc == 'auth.quay.io']
+        self.assertEqual(len(token_requests), 1)
+        self.assertIn('Authorization', token_requests[0].headers)
+        # no layers were downloaded
+        self.assertFalse([r for r in mocker.request_history if 'sha256:layer' in r.url])
+
+    def test_manifest_list(self, mocker):
+        registry = StandInRegistry(mocker)
+        registry.add('/v2/ozzy/embryo/manifests/v4', {
+            'schemaVersion': 2,
+            'mediaType': MANIFEST_LIST,
+            'manifests': [
+                {'digest': 'sha256:arm', 'platform': {'os': 'linux', 'architecture': 'arm'}},
+                {'digest': 'sha256:amd', 'platform': {'os': 'linux', 'architecture': 'amd64'}},
+            ],
+        })
+        registry.add('/v2/ozzy/embryo/manifests/sha256:amd', {
+            'schemaVersion': 2,
+            'config': {'digest': 'sha256:config'},
+        }, media_type=MANIFEST_V2)
+        registry.add('/v2/ozzy/embryo/blobs/sha256:config', self.config)
+
+        client = RegistryClient('quay.io')
+        self.assertEqual(client.get_port('ozzy/embryo', 'v4'), 5000)
+
+    def test_schema1(self, mocker):
+        registry = StandInRegistry(mocker)
+        registry.add('/v2/ozzy/embryo/manifests/v4', {
+            'schemaVersion': 1,
+            'history': [{'v1Compatibility': json.dumps(self.config)}],
+        }, media_type=MANIFEST_V1_SIGNED)
+
+        client = RegistryClient('quay.io')
+        self.assertEqual(client.get_port('ozzy/embryo', 'v4'), 5000)
+
+    def test_no_port(self, mocker):
+        registry = StandInRegistry(mocker)
+        registry.add('/v2/ozzy/embryo/manifests/v4', {
+            'schemaVersion': 2,
+            'mediaType': MANIFEST_V2,
+            'config': {'digest': 'sha256:config'},
+        })
+        registry.add('/v2/ozzy/embryo/blobs/sha256:config', {'config': {}})
+
+        client = RegistryClient('quay.io')
+        self.assertIsNone(client.get_port('ozzy/embryo', 'v4'))
+
+    def test_failure(self, mocker):
+        mocker.get('https://quay.io/v2/ozzy/embryo/manifests/v4', status_code=404)
+        client = RegistryClient('quay.io')
+        with self.assertRaises(RegistryException):
+            client.get_port('ozzy/embryo', 'v4')
+
+    @mock.patch('registry.dockerclient.DockerClient')
+    def test_get_port_falls_back_to_docker(self, mocker, mock_docker):
+        forget()
+        settings.REGISTRY_API_INSPECT = True
+        mock_docker.return_value.get_port.return_value = 8000
+        try:
+            # the Deis registry is spoken to over plain HTTP
+            # the tag is resolved with a HEAD request before anything is read
+            mocker.head('http://localhost:5000/v2/embryo/manifests/git-f2a8020', status_code=500)  # noqa
+            self.assertEqual(get_port('localhost:5000/embryo:git-f2a8020', True), 8000)
+            self.assertTrue(mock_docker.return_value.get_port.called)
+        finally:
+            settings.REGISTRY_API_INSPECT = False
+
+
+@requests_mock.Mocker()
+class ImageMetadataTest(TestCase):
+    """Test that image metadata is cached per digest"""
+
+    def setUp(self):
+        forget()
+
+    def publish(self, registry, digest, port):
+        """Point ozzy/embryo:v4 at an image with the given digest exposing a port"""
+        registry.add('/v2/ozzy/embryo/manifests/v4', {
+            'schemaVersion': 2,
+            'mediaType': MANIFEST_V2,
+            'config': {'digest': 'sha256:config-' + digest, 'size': 10},
+            'layers': [{'digest': 'sha256:layer', 'size': 100}],
+        }, digest=digest)
+        registry.add('/v2/ozzy/embryo/manifests/' + digest, {
+            'schemaVersion': 2,
+            'mediaType': MANIFEST_V2,
+            'config': {'digest': 'sha256:config-' + digest, 'size': 10},
+            'layers': [{'digest': 'sha256:layer', 'size': 100}],
+        }, digest=digest)
+        registry.add('/v2/ozzy/embryo/blobs/sha256:config-' + digest, {
+            'config': {
+                'ExposedPorts': {'{}/tcp'.format(port): {}},
+                'Entrypoint': ['/bin/boot'],
+            }
+        })
+
+    def test_image_metadata(self, mocker):
+        registry = StandInRegistry(mocker)
+        self.publish(registry, 'sha256:one', 5000)
+
+        metadata = image_metadata('quay.io/ozzy/embryo:v4')
+        self.assertEqual(metadata.port, 5000)
+        self.assertEqual(metadata.entrypoint, ['/bin/boot'])
+        self.assertEqual(metadata.size, 110)
+        self.assertEqual(metadata.digest, 'sha256:one')
+
+        # remembered in memory, the registry is not asked again
+        count = mocker.call_count
+        self.assertEqual(image_metadata('quay.io/ozzy/embryo:v4').port, 5000)
+        self.assertEqual(mocker.call_count, count)
+
+        # once forgotten the tag is resolved again but the image is not inspected again
+        forget()
+        count = mocker.call_count
+        self.assertEqual(image_metadata('quay.io/ozzy/embryo:v4').port, 5000)
+        # a new client authenticates again first
+        requests = [r for r in mocker.request_history[count:] if r.netloc == 'quay.io']
+        self.assertEqual({r.method for r in requests}, {'HEAD'})
+
+    def test_tag_moved(self, mocker):
+        registry = StandInRegistry(mocker)
+        self.publish(registry, 'sha256:one', 5000)
+        self.assertEqual(image_metadata('quay.io/ozzy/embryo:v4').port, 5000)
+
+        # the tag now points at a new image
+        self.publish(registry, 'sha256:two', 8000)
+        forget('quay.io/ozzy/embryo:v4')
+        self.assertEqual(image_metadata('quay.io/ozzy/embryo:v4').port, 8000)
+
+        # the old digest is gone
+        digests = ImageMetadata.objects.filter(image='quay.io/ozzy/embryo:v4').values_list('digest', flat=True)  # noqa
+        self.assertEqual(list(digests), ['sha256:two'])
+
+
+@requests_mock.Mocker()
+class RegistryPublishTest(unittest.TestCase):
+    """Test that images are promoted to deis-registry without pulling or pushing layers"""
+
+    def setUp(self):
+        self.deis = 'http://' + settings.REGISTRY_URL
+        self.manifest = {
+            'schemaVersion': 2,
+            'mediaType': MANIFEST_V2,
+            'config': {'digest': 'sha256:config', 'size': 10},
+            'layers': [{'digest': 'sha256:layer', 'size': 100}],
+        }
+
+    def uploads(self, mocker):
+        return [r for r in mocker.request_history if r.method in ['POST', 'PUT']]
+
+    def test_already_published(self, mocker):
+        registry = StandInRegistry(mocker)
+        registry.add('/v2/ozzy/embryo/manifests/v4', self.manifest, digest='sha256:one')
+        mocker.head(self.deis + '/v2/embryo/manifests/v4', headers={'Docker-Content-Digest': 'sha256:one'})  # noqa
+
+        target = '{}/embryo:v4'.format(settings.REGISTRY_URL)
+        registry_publish_release('quay.io/ozzy/embryo:v4', target)
+        self.assertEqual(self.uploads(mocker), [])
+
+    def test_stream_blobs(self, mocker):
+        registry = StandInRegistry(mocker)
+        registry.add('/v2/ozzy/embryo/manifests/v4', self.manifest, digest='sha256:one')
+        mocker.get(registry.url + '/v2/ozzy/embryo/blobs/sha256:layer', content=b'layer')
+        mocker.head(self.deis + '/v2/embryo/manifests/v4', status_code=404)
+        # the config was published before, the layer was not
+        mocker.head(self.deis + '/v2/embryo/blobs/sha256:config')
+        mocker.head(self.deis + '/v2/embryo/blobs/sha256:layer', status_code=404)
+        mocker.post(self.deis + '/v2/embryo/blobs/uploads/', status_code=202,
+                    headers={'Location': '/v2/embryo/blobs/uploads/1234'})
+        mocker.put(self.deis + '/v2/embryo/blobs/uploads/1234', status_code=201)
+        mocker.put(self.deis + '/v2/embryo/manifests/v4', status_code=201)
+
+        target = '{}/embryo:v4'.format(settings.REGISTRY_URL)
+        registry_publish_release('quay.io/ozzy/embryo:v4', target)
+        uploads = self.uploads(mocker)
+        self.assertEqual([r.method for r in uploads], ['POST', 'PUT', 'PUT'])
+        self.assertEqual(uploads[1].qs['digest'], ['sha256:layer'])
+        # the manifest is pushed as is, keeping its digest
+        self.assertEqual(json.loads(uploads[2].body.decode('utf-8')), self.manifest)
+        self.assertEqual(uploads[2].headers['Content-Type'], MANIFEST_V2)
+
+    def test_mount_blobs(self, mocker):
+        source = self.deis + '/v2/embryo/manifests/git-f2a8020'
+        mocker.get(source, json=self.manifest, headers={'Docker-Content-Digest': 'sha256:one'})  # noqa
+        mocker.head(self.deis + '/v2/myapp/manifests/v2', status_code=404)
+        mocker.head(self.deis + '/v2/myapp/blobs/sha256:config', status_code=404)
+        mocker.head(self.deis + '/v2/myapp/blobs/sha256:layer', status_code=404)
+        mocker.post(self.deis + '/v2/myapp/blobs/uploads/', status_code=201)
+        mocker.put(self.deis + '/v2/myapp/manifests/v2', status_code=201)
+
+        target = '{}/myapp:v2'.format(settings.REGISTRY_URL)
+        registry_publish_release('embryo:git-f2a8020', target, True)
+        mounts = [r for r in mocker.request_history if r.method == 'POST']
+        self.assertEqual([r.qs['mount'] for r in mounts], [['sha256:config'], ['sha256:layer']])  # noqa
+        self.assertEqual(mounts[0].qs['from'], ['embryo'])
+        # no blob travelled through the controller
+        self.assertFalse([r for r in mocker.request_history if '/blobs/sha256' in r.url and r.method == 'GET'])  # noqa
+
+    @mock.patch('registry.dockerclient.DockerClient')
+    def test_publish_falls_back_to_docker(self, mocker, mock_docker):
+        registry = StandInRegistry(mocker)
+        # schema 1 manifests are signed for their tag and can not be copied
+        registry.add('/v2/ozzy/embryo/manifests/v4', {
+            'schemaVersion': 1,
+            'history': [],
+        }, media_type=MANIFEST_V1_SIGNED)
+        settings.REGISTRY_API_PUBLISH = True
+        try:
+            publish_release('quay.io/ozzy/embryo:v4', 'ozzy/embryo:v4', False)
+            self.assertTrue(mock_docker.return_value.publish_release.called)
+        finally:
+            settings.REGISTRY_API_PUBLISH = False
+
+
+@override_settings(DOCKER_IMAGE_RETENTION=True, DOCKER_IMAGE_RETENTION_COUNT=2,
+                   DOCKER_IMAGE_RETENTION_BYTES=1000)
+class RetentionTest(TestCase):
+    """Test that images the controller pulled and tagged are removed from Docker again"""
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.graph = {}
+        self.client.images.side_effect = lambda: [
+            {'RepoTags': [tag], 'Size': size} for tag, size in self.graph.items()
+        ]
+        self.client.remove_image.side_effect = lambda image: self.graph.pop(image)
+
+    def add(self, image, size, age):
+        """Put an image in the graph which the controller last used age seconds ago"""
+        self.graph[image] = size
+        retention.track(image)
+        last_used = timezone.now() - timedelta(seconds=age)
+        LocalImage.objects.filter(image=image).update(last_used=last_used)
+
+    def test_count(self):
+        self.add('ozzy/embryo:v1', 100, 3000)
+        self.add('ozzy/embryo:v2', 100, 2000)
+        self.add('ozzy/embryo:v3', 100, 1000)
+        # not tracked, never touched
+        self.graph['postgres:9.6'] = 100
+
+        self.assertEqual(retention.collect(self.client), (1, 100))
+        self.client.remove_image.assert_called_once_with('ozzy/embryo:v1')
+        self.assertEqual(retention.usage(self.client)['tracked'], 2)
+
+    def test_watermark(self):
+        self.add('ozzy/embryo:v1', 600, 3000)
+        self.add('ozzy/embryo:v2', 600, 2000)
+        self.assertEqual(retention.collect(self.client), (1, 600))
+        self.assertEqual(list(self.graph.keys()), ['ozzy/embryo:v2'])
+
+    def test_recently_used(self):
+        self.add('ozzy/embryo:v1', 100, 3000)
+        self.add('ozzy/embryo:v2', 100, 10)
+        self.add('ozzy/embryo:v3', 100, 0)
+        self.add('ozzy/embryo:v4', 100, 0)
+        # images still being published are left alone
+        self.assertEqual(retention.collect(self.client), (1, 100))
+        self.assertEqual(LocalImage.objects.count(), 3)
+
+    def test_in_use(self):
+        self.add('ozzy/embryo:v1', 100, 3000)
+        self.add('ozzy/embryo:v2', 100, 2000)
+        self.add('ozzy/embryo:v3', 100, 1000)
+        self.client.remove_image.side_effect = APIError('conflict', mock.Mock(status_code=409))
+        self.assertEqual(retention.collect(self.client), (0, 0))
+        # kept around to be removed next time
+        self.assertEqual(LocalImage.objects.count(), 3)
+
+    def test_already_gone(self):
+        self.add('ozzy/embryo:v1', 100, 3000)
+        self.add('ozzy/embryo:v2', 100, 2000)
+        self.add('ozzy/embryo:v3', 100, 1000)
+        del self.graph['ozzy/embryo:v1']
+        self.assertEqual(retention.collect(self.client), (0, 0))
+        self.assertFalse(self.client.remove_image.called)
+        self.assertEqual(LocalImage.objects.count(), 2)
+
+    @mock.patch('docker.Client')
+    def test_publish_collects(self, mock_client):
+        client = DockerClient()
+        client.client.images.return_value = []
+        publish_release('ozzy/embryo:git-f2a8020', 'ozzy/embryo:v4', False)
+        # the pulled source and the tagged target
+        images = LocalImage.objects.values_list('image', flat=True)
+        self.assertIn('ozzy/embryo:git-f2a8020', images)
+        self.assertEqual(len(images), 2)
+        # what the push left behind was looked at
+        self.assertTrue(client.client.images.called)
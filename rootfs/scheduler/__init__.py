@@ -1,13 +1,21 @@
+import codecs
 from collections import OrderedDict
 from datetime import datetime
+import importlib
+import json
 import logging
+import math
 import requests
 import requests.exceptions
 from requests_toolbelt import user_agent
+import threading
 import time
 from urllib.parse import urljoin
 
+from django.conf import settings
+
 from api import __version__ as deis_version
+from scheduler import discovery, transport
 from scheduler.exceptions import KubeException, KubeHTTPException   # noqa
 from scheduler.states import PodState
 
@@ -15,6 +23,11 @@ from scheduler.states import PodState
 logger = logging.getLogger(__name__)
 session = None
 resource_mapping = OrderedDict()
+# process wide client, see get_client()
+client = None
+client_lock = threading.Lock()
+# optional callable(url) building a client on every get_client() call, used by scheduler.mock
+client_factory = None
 
 
 def get_session():
@@ -22,16 +35,61 @@ def get_session():
     if session is None:
         with open('/var/run/secrets/kubernetes.io/serviceaccount/token') as token_file:
             token = token_file.read()
-        session = requests.Session()
-        session.headers = {
-            'Authorization': 'Bearer ' + token,
-            'Content-Type': 'application/json',
-            'User-Agent': user_agent('Deis Controller', deis_version)
-        }
-        session.verify = '/var/run/secrets/kubernetes.io/serviceaccount/ca.crt'
+        session = transport.session(
+            headers={
+                'Authorization': 'Bearer ' + token,
+                'Content-Type': 'application/json',
+                'User-Agent': user_agent('Deis Controller', deis_version)
+            },
+            verify='/var/run/secrets/kubernetes.io/serviceaccount/ca.crt'
+        )
     return session
 
 
+def get_client(url, module=__name__):
+    """
+    Get the process wide SchedulerClient for the Kubernetes API server at url
+
+    The client is built once (from the SchedulerClient of the given module) and then
+    shared by all threads. If a client_factory has been registered then it is used
+    to build a new client on every call instead.
+    """
+    global client
+    if client_factory is not None:
+        return client_factory(url)
+
+    if client is not None and client.url == url:
+        return client
+
+    with client_lock:
+        if client is None or client.url != url:
+            mod = importlib.import_module(module)
+            # the module may have registered a factory while being imported
+            if client_factory is not None:
+                return client_factory(url)
+
+            client = mod.SchedulerClient(url)
+
+    return client
+
+
+def reset_client():
+    """
+    Drop the process wide client, its resources and the HTTP session
+
+    Meant to be called in a freshly forked process (gunicorn post_fork) so connections,
+    locks and informer threads of the parent process are not reused
+    """
+    global client, session
+    from scheduler import informers  # lazy load
+    with client_lock:
+        informers.stop()
+        transport.reset()
+        client = None
+        session = None
+        resource_mapping.clear()
+
+
 class KubeHTTPClient(object):
     # ISO-8601 which is used by kubernetes
     DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
@@ -74,13 +132,20 @@ class KubeHTTPClient(object):
         return object.__getattribute__(self, name)
 
     def version(self):
-        """Get Kubernetes version as a float"""
-        response = self.http_get('/version')
-        if self.unhealthy(response.status_code):
-            raise KubeHTTPException(response, 'fetching Kubernetes version')
+        """Get Kubernetes version as a float, cached per API server"""
+        return discovery.version(self)
 
-        data = response.json()
-        return float('{}.{}'.format(data['major'], data['minor']))
+    def preferred_version(self, candidates):
+        """
+        Pick the first API group version out of candidates that the API server serves,
+        using cached discovery information. None if that can not be determined
+        """
+        return discovery.preferred_version(self, candidates)
+
+    @staticmethod
+    def pool_stats():
+        """Connection pool statistics of the transport used to reach the API server"""
+        return transport.pool_stats()
 
     @staticmethod
     def parse_date(date):
@@ -91,7 +156,8 @@ class KubeHTTPClient(object):
         return not 200 <= status_code <= 299
 
     @staticmethod
-    def query_params(labels=None, fields=None, resource_version=None, pretty=False):
+    def query_params(labels=None, fields=None, resource_version=None, pretty=False,
+                     limit=None, continue_token=None):
         query = {}
 
         # labels and fields are encoded slightly differently than python-requests can do
@@ -127,8 +193,36 @@ class KubeHTTPClient(object):
         if pretty:
             query['pretty'] = pretty
 
+        # chunked lists, the API server hands back a continue token when there is more
+        if limit:
+            query['limit'] = limit
+
+        if continue_token:
+            query['continue'] = continue_token
+
         return query
 
+    def pages(self, fetch, *args, limit=None, **kwargs):
+        """
+        Read a collection in chunks by calling a list function (such as Pod.get) with
+        limit and continue until the API server has nothing more, yielding each page
+
+        Only one page is in memory at a time. API servers that do not support chunking
+        return the whole collection as a single page. limit defaults to
+        KUBERNETES_LIST_LIMIT, 0 turns chunking off
+        """
+        if limit is None:
+            limit = settings.KUBERNETES_LIST_LIMIT
+
+        token = None
+        while True:
+            page = fetch(*args, limit=limit, continue_token=token, **kwargs).json()
+            yield page
+
+            token = page.get('metadata', {}).get('continue')
+            if not token:
+                return
+
     @staticmethod
     def log(namespace, message, level='INFO'):
         """Logs a message in the context of this application.
@@ -208,6 +302,32 @@ class KubeHTTPClient(object):
 
         return response
 
+    def http_patch(self, path, data=None, json=None, strategic=False, **kwargs):
+        """
+        Make a PATCH request to the k8s server.
+
+        Sends a JSON merge patch (RFC 7386) unless strategic is set, in which case it is
+        a Kubernetes strategic merge patch where lists of objects are merged by key
+        """
+        headers = kwargs.pop('headers', {})
+        if strategic:
+            headers['Content-Type'] = 'application/strategic-merge-patch+json'
+        else:
+            headers['Content-Type'] = 'application/merge-patch+json'
+
+        try:
+            url = urljoin(self.url, path)
+            response = self.session.patch(url, data=data, json=json, headers=headers, **kwargs)
+        except requests.exceptions.ConnectionError as err:
+            # reraise as KubeException, but log stacktrace.
+            message = "There was a problem patching data on " \
+                      "the Kubernetes API server. URL: {}, " \
+                      "data: {}, json: {}".format(url, data, json)
+            logger.error(message)
+            raise KubeException(message) from err
+
+        return response
+
     def http_delete(self, path, **kwargs):
         """
         Make a DELETE request to the k8s server.
@@ -224,6 +344,134 @@ class KubeHTTPClient(object):
 
         return response
 
+    def watch(self, path, resource_version=None, timeout=60, **kwargs):
+        """
+        Watch a collection on the k8s server, starting after resource_version
+
+        Yields (event type, object) tuples as the server reports ADDED, MODIFIED and
+        DELETED changes, until the server closes the stream after timeout seconds.
+        Raises KubeException if the stream can not be used so callers can fall back to polling
+        """
+        params = self.query_params(resource_version=resource_version, **kwargs)
+        params['watch'] = 'true'
+        params['timeoutSeconds'] = int(timeout)
+
+        # give the server a chance to close the stream before the client gives up on it
+        response = self.http_get(path, params=params, stream=True, timeout=int(timeout) + 10)
+        if self.unhealthy(response.status_code):
+            raise KubeHTTPException(response, 'watch "{}"', path)
+
+        try:
+            for line in response.iter_lines():
+                # keep-alive new lines
+                if not line:
+                    continue
+
+                try:
+                    event = json.loads(line.decode('utf-8'))
+                except ValueError as err:
+                    raise KubeException('Could not decode watch event from {}'.format(path)) from err  # noqa
+
+                if not isinstance(event, dict) or 'type' not in event or 'object' not in event:
+                    raise KubeException('{} did not return a watch stream'.format(path))
+
+                # usually a 410 Gone when the resourceVersion is too old
+                if event['type'] == 'ERROR':
+                    raise KubeException('watch on {} failed: {}'.format(
+                        path, event['object'].get('message', 'unknown error'))
+                    )
+
+                yield event['type'], event['object']
+        except requests.exceptions.RequestException as err:
+            raise KubeException('watch on {} was interrupted'.format(path)) from err
+        finally:
+            response.close()
+
+    def wait_until(self, path, condition, timeout, tick=None, interval=10, **kwargs):
+        """
+        Wait until condition returns True for the objects of a collection or timeout is reached
+
+        The collection is listed once and then kept up to date with a watch stream, with
+        condition being evaluated against a {name: object} dict whenever something changes.
+        tick is called every interval seconds with the seconds waited so far and the objects,
+        and can return a number of seconds to extend the timeout by.
+
+        Falls back to listing the collection every second if the watch can not be used.
+
+        Returns True if condition was met and False if it timed out
+        """
+        start = time.time()
+        next_tick = interval
+        objects, resource_version = self._list_objects(path, **kwargs)
+        # no resourceVersion to start a watch from means polling is the only option
+        polling = resource_version is None
+        while True:
+            if condition(objects):
+                return True
+
+            waited = time.time() - start
+            if tick is not None and waited >= next_tick:
+                timeout += tick(int(waited), objects) or 0
+                next_tick += interval
+
+            if waited >= timeout:
+                return False
+
+            if polling:
+                time.sleep(1)
+                objects, _ = self._list_objects(path, **kwargs)
+                continue
+
+            # stay on the stream until the next tick or the deadline, whichever comes first
+            window = max(1, math.ceil(min(timeout, next_tick) - waited))
+            try:
+                resource_version = self._watch_objects(
+                    path, objects, resource_version, window, condition, **kwargs
+                )
+                if resource_version is None:
+                    return True
+            except KubeException as e:
+                logger.debug('falling back to polling {}: {}'.format(path, str(e)))
+                polling = True
+
+    def _list_objects(self, path, **kwargs):
+        """
+        List a collection and return it as a {name: object} dict along with the
+        resourceVersion the list was taken at
+        """
+        objects = {}
+        resource_version = None
+        for page in self.pages(self._get_collection, path, **kwargs):
+            objects.update({item['metadata']['name']: item for item in page['items']})
+            resource_version = page.get('metadata', {}).get('resourceVersion')
+
+        return objects, resource_version
+
+    def _get_collection(self, path, **kwargs):
+        response = self.http_get(path, params=self.query_params(**kwargs))
+        if self.unhealthy(response.status_code):
+            raise KubeHTTPException(response, 'get "{}"', path)
+
+        return response
+
+    def _watch_objects(self, path, objects, resource_version, timeout, condition, **kwargs):
+        """
+        Apply watch events to objects in place until condition is met or the stream ends
+
+        Returns None if the condition was met, otherwise the last seen resourceVersion
+        """
+        for event, item in self.watch(path, resource_version, timeout, **kwargs):
+            resource_version = item['metadata'].get('resourceVersion', resource_version)
+            if event == 'DELETED':
+                objects.pop(item['metadata']['name'], None)
+            else:
+                objects[item['metadata']['name']] = item
+
+            if condition(objects):
+                return None
+
+        return resource_version
+
     def deploy(self, namespace, name, image, entrypoint, command, **kwargs):  # noqa
         """Deploy Deployment depending on what's requested"""
         app_type = kwargs.get('app_type')
@@ -263,7 +511,8 @@ class KubeHTTPClient(object):
             try:
                 # kick off a new revision of the deployment
                 self.deployment.update(
-                    namespace, name, image, entrypoint, command, **kwargs
+                    namespace, name, image, entrypoint, command,
+                    current=deployment, **kwargs
                 )
             except KubeException as e:
                 raise KubeException(
@@ -294,7 +543,35 @@ class KubeHTTPClient(object):
         self.deployment.scale(namespace, name, image, entrypoint, command, **kwargs)
 
     def run(self, namespace, name, image, entrypoint, command, **kwargs):
-        """Run a one-off command."""
+        """
+        Run a one-off command, returning its exit code and output
+
+        At most KUBERNETES_RUN_LOG_LIMIT_BYTES of output are kept, see run_stream() to
+        follow the output as it is written instead
+        """
+        output = []
+        exit_code = 0
+        runner = self.run_stream(namespace, name, image, entrypoint, command,
+                                 limit_bytes=settings.KUBERNETES_RUN_LOG_LIMIT_BYTES, **kwargs)
+        for kind, data in runner:
+            if kind == 'output':
+                output.append(data)
+            elif kind == 'exit':
+                exit_code = data
+
+        return exit_code, ''.join(output)
+
+    def run_stream(self, namespace, name, image, entrypoint, command, limit_bytes=None,
+                   **kwargs):
+        """
+        Run a one-off command, generating (kind, data) tuples as it goes:
+
+        - ('state', state) when the pod moves along while starting up or shutting down
+        - ('output', text) for the output of the command as it is written
+        - ('exit', exit_code) once the pod terminated, always last
+
+        The pod is removed again when the generator is done or closed
+        """
         self.log(namespace, 'run {}, img {}, entrypoint {}, cmd "{}"'.format(
             name, image, entrypoint, command)
         )
@@ -311,42 +588,76 @@ class KubeHTTPClient(object):
             # this is a fairly arbitrary limit but the gunicorn worker / LBs
             # will make this timeout around 20 anyway.
             # TODO: Revisit in the future so it can run longer
-            state = 'up'  # pod is still running
-            waited = 0
-            timeout = 1200  # 20 minutes
-            while (state == 'up' and waited < timeout):
-                pod = self.pod.get(namespace, name).json()
-                state = str(self.pod.state(pod))
-                # default data
-                exit_code = 0
-
-                waited += 1
-                time.sleep(1)
-
-            if state == 'down':  # run finished successfully
-                exit_code = 0  # successful run
-            elif state == 'crashed':  # run failed
-                pod_state = pod['status']['containerStatuses'][0]['state']
-                exit_code = pod_state['terminated']['exitCode']
+            deadline = time.time() + 1200  # 20 minutes
 
-            # timed out!
-            if waited == timeout:
-                raise KubeException('Timed out (20 mins) while running')
-
-            # check if it is possible to get logs
-            state = self.pod.state(self.pod.get(namespace, name).json())
+            # there are no logs before the container started
+            pod, state = yield from self._run_wait(
+                namespace, name, deadline, lambda state: state < PodState.up
+            )
             # States below up do not have logs
             if not isinstance(state, PodState) or state < PodState.up:
-                return exit_code, 'Could not get logs. Pod is in state {}'.format(str(state))
+                yield 'output', 'Could not get logs. Pod is in state {}'.format(str(state))
+            else:
+                yield from self._run_output(namespace, name, deadline, limit_bytes)
 
-            # grab log information
-            log = self.pod.logs(namespace, name)
-            log.encoding = 'utf-8'  # defaults to "ISO-8859-1" otherwise...
-
-            return exit_code, log.text
+            # the log ends when the container terminates, the pod may take a moment longer
+            pod, state = yield from self._run_wait(
+                namespace, name, deadline, lambda state: state in [PodState.up, PodState.terminating]  # noqa
+            )
+            if state == PodState.crashed:  # run failed
+                pod_state = pod['status']['containerStatuses'][0]['state']
+                yield 'exit', pod_state['terminated']['exitCode']
+            else:
+                yield 'exit', 0
         finally:
             # cleanup
             self.pod.delete(namespace, name)
 
+    def _run_wait(self, namespace, name, deadline, waiting):
+        """
+        Poll the pod of a run every second for as long as waiting(state) holds, returning the
+        pod and its state. States that are not a PodState are never waited on
+        """
+        seen = None
+        while True:
+            pod = self.pod.get(namespace, name).json()
+            state = self.pod.state(pod)
+            if state != seen:
+                seen = state
+                yield 'state', str(state)
+
+            if not isinstance(state, PodState) or not waiting(state):
+                return pod, state
+
+            if time.time() >= deadline:
+                raise KubeException('Timed out (20 mins) while running')
+
+            time.sleep(1)
+
+    def _run_output(self, namespace, name, deadline, limit_bytes=None):
+        """Follow the log of a run pod, decoding it as it comes in"""
+        log = self.pod.logs(namespace, name, follow=True, limit_bytes=limit_bytes,
+                            timeout=max(deadline - time.time(), 1))
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            # the log of a followed pod comes chunked, each chunk is handed on as it arrives
+            for chunk in log.iter_content(chunk_size=1024):
+                text = decoder.decode(chunk)
+                if text:
+                    yield 'output', text
+
+                # a chatty command never lets the read timeout fire
+                if time.time() >= deadline:
+                    raise KubeException('Timed out (20 mins) while running')
+        except requests.exceptions.ConnectionError as err:
+            # a silent command outlasting the deadline shows up as a read timeout
+            raise KubeException('Timed out (20 mins) while running') from err
+        finally:
+            log.close()
+
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield 'output', text
+
 
 SchedulerClient = KubeHTTPClient
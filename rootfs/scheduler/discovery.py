@@ -0,0 +1,105 @@
+"""
+Cache of what a Kubernetes API server offers
+
+The server version and the API group versions it serves are fetched once per API server
+and kept for a while, so resources can pick URLs and manifest formats without a round trip.
+Entries expire after TTL seconds or when invalidated, for example after a 404.
+"""
+import threading
+import time
+
+from scheduler.exceptions import KubeHTTPException
+
+# how long discovery information is trusted, in seconds
+TTL = 600
+
+# API server URL -> {'version': float, 'groups': set of group versions or None, 'expires': ts}
+cache = {}
+lock = threading.Lock()
+
+
+def _entry(client):
+    entry = cache.get(client.url)
+    if entry is not None and entry['expires'] > time.time():
+        return entry
+
+    with lock:
+        entry = cache.get(client.url)
+        if entry is None or entry['expires'] <= time.time():
+            entry = {
+                'version': _fetch_version(client),
+                'groups': _fetch_groups(client),
+                'expires': time.time() + TTL,
+            }
+            cache[client.url] = entry
+
+    return entry
+
+
+def _fetch_version(client):
+    response = client.http_get('/version')
+    if client.unhealthy(response.status_code):
+        raise KubeHTTPException(response, 'fetching Kubernetes version')
+
+    data = response.json()
+    # some providers append a + to the minor version, such as 1.4+
+    minor = data['minor'].rstrip('+')
+    return float('{}.{}'.format(data['major'], minor))
+
+
+def _fetch_groups(client):
+    """
+    Fetch all group versions (such as autoscaling/v1) from /apis
+
+    Returns None if the server does not support discovery
+    """
+    response = client.http_get('/apis')
+    if client.unhealthy(response.status_code):
+        return None
+
+    groups = set()
+    for group in response.json().get('groups', []):
+        for version in group.get('versions', []):
+            groups.add(version['groupVersion'])
+
+    return groups
+
+
+def version(client):
+    """Get the Kubernetes version of the API server the client talks to as a float"""
+    return _entry(client)['version']
+
+
+def group_versions(client):
+    """
+    Get the set of API group versions the API server serves
+
+    None means the server could not tell
+    """
+    return _entry(client)['groups']
+
+
+def preferred_version(client, candidates):
+    """
+    Pick the first of the candidate group versions the API server serves
+
+    Returns None if none of them are served or the server could not tell
+    """
+    groups = group_versions(client)
+    if groups is None:
+        return None
+
+    for candidate in candidates:
+        if candidate in groups:
+            return candidate
+
+    return None
+
+
+def invalidate(url=None):
+    """Forget what is known about an API server, or all of them"""
+    with lock:
+        if url is None:
+            cache.clear()
+        else:
+            cache.pop(url, None)
@@ -0,0 +1,42 @@
+"""
+Namespace wide index of Kubernetes events
+
+Looking into why pods are pending or not ready means reading the events of each pod.
+Instead of a field selector query per pod, an EventIndex reads all Pod events of a
+namespace once and groups them by the uid of the object they are about, so any
+number of pods can be inspected for the price of one (chunked) list call.
+"""
+from collections import defaultdict
+
+
+class EventIndex(object):
+    """
+    Events of one namespace grouped by involvedObject.uid
+
+    Events are fetched the first time they are asked for, so an index that is never
+    used costs nothing. Create a new index to get a fresh view of the events
+    """
+    def __init__(self, client, namespace):
+        self.client = client
+        self.namespace = namespace
+        self._events = None
+
+    def _load(self):
+        events = defaultdict(list)
+        fields = {'involvedObject.kind': 'Pod'}
+        for page in self.client.pages(self.client.ns.events, self.namespace, fields=fields):
+            for event in page['items']:
+                events[event['involvedObject'].get('uid')].append(event)
+
+        # make sure that events are sorted
+        for items in events.values():
+            items.sort(key=lambda x: x['lastTimestamp'])
+
+        return events
+
+    def get(self, obj):
+        """Events about an object, oldest first"""
+        if self._events is None:
+            self._events = self._load()
+
+        return list(self._events.get(obj['metadata']['uid'], []))
@@ -0,0 +1,206 @@
+"""
+In-process list + watch caches of Deis managed Kubernetes objects
+
+An Informer lists every heritage=deis object of a kind across all namespaces once and
+then follows a watch stream from the resourceVersion of that list to stay up to date.
+Objects are kept per namespace with a label index so the usual label selector reads
+can be answered from memory instead of the API server.
+
+Informers are opt-in, see start()
+"""
+from collections import defaultdict
+import copy
+import logging
+import threading
+
+from scheduler.exceptions import KubeHTTPException
+
+logger = logging.getLogger(__name__)
+# resource name (plural) -> Informer
+informers = {}
+lock = threading.Lock()
+
+# what all informers select on, anything else is not cached
+SELECTOR = {'heritage': 'deis'}
+# default kinds to keep caches for
+KINDS = ('pods', 'deployments', 'replicasets')
+
+
+def match_labels(selector, labels):
+    """
+    Check if a set of object labels satisfy a label selector dict in the format
+    KubeHTTPClient.query_params accepts
+    """
+    for key, value in selector.items():
+        if '__notin' in key:
+            key = key.replace('__notin', '')
+            if key in labels and labels[key] in value:
+                return False
+        elif '__in' in key or isinstance(value, list):
+            key = key.replace('__in', '')
+            if key not in labels or labels[key] not in value:
+                return False
+        elif value is None:
+            if key not in labels:
+                return False
+        elif labels.get(key) != value:
+            return False
+
+    return True
+
+
+class Informer(object):
+    """
+    Keeps a cache of all heritage=deis objects of one kind in sync with Kubernetes
+    """
+    # how long the API server should keep each watch request open
+    watch_timeout = 300
+    # how long to wait before starting over after a failure
+    backoff = 5
+
+    def __init__(self, resource, name):
+        self.resource = resource
+        self.name = name
+        self.path = resource.api('/{}'.format(name))
+        self.resource_version = None
+        # namespace -> name -> object
+        self._objects = defaultdict(dict)
+        # namespace -> (label, value) -> names
+        self._index = defaultdict(lambda: defaultdict(set))
+        self._lock = threading.RLock()
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def synced(self):
+        """Whether the cache reflects a complete list of the kind"""
+        return self._synced.is_set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='informer-{}'.format(self.name))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._synced.clear()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                if self.resource_version is None:
+                    self._relist()
+
+                for event, item in self.resource.watch(
+                    self.path, self.resource_version, self.watch_timeout, labels=SELECTOR
+                ):
+                    self._apply(event, item)
+            except Exception as e:
+                # serve reads from the API server until the cache is rebuilt
+                logger.warning('informer for {} failed, starting over: {}'.format(self.name, str(e)))  # noqa
+                self._synced.clear()
+                self.resource_version = None
+                self._stopped.wait(self.backoff)
+
+    def list(self, namespace, labels=None):
+        """Return copies of all cached objects in a namespace that match the label selector"""
+        labels = labels or {}
+        with self._lock:
+            objects = self._objects.get(namespace, {})
+            index = self._index.get(namespace, {})
+
+            # narrow down the candidates with the equality based requirements first
+            names = None
+            for key, value in labels.items():
+                if isinstance(value, str) and '__' not in key:
+                    matches = index.get((key, value), set())
+                    names = matches if names is None else names & matches
+
+            if names is None:
+                names = objects.keys()
+
+            items = [
+                objects[name] for name in names
+                if match_labels(labels, objects[name]['metadata'].get('labels', {}))
+            ]
+
+            return copy.deepcopy(items)
+
+    def _relist(self):
+        response = self.resource.http_get(
+            self.path,
+            params=self.resource.query_params(labels=SELECTOR)
+        )
+        if self.resource.unhealthy(response.status_code):
+            raise KubeHTTPException(response, 'list {}', self.name)
+
+        data = response.json()
+        with self._lock:
+            self._objects.clear()
+            self._index.clear()
+            for item in data['items']:
+                self._store(item)
+
+        self.resource_version = data['metadata']['resourceVersion']
+        self._synced.set()
+
+    def _apply(self, event, item):
+        with self._lock:
+            self._remove(item)
+            if event != 'DELETED':
+                self._store(item)
+
+        self.resource_version = item['metadata']['resourceVersion']
+
+    def _store(self, item):
+        namespace = item['metadata']['namespace']
+        name = item['metadata']['name']
+        self._objects[namespace][name] = item
+        for label in item['metadata'].get('labels', {}).items():
+            self._index[namespace][label].add(name)
+
+    def _remove(self, item):
+        namespace = item['metadata']['namespace']
+        name = item['metadata']['name']
+        old = self._objects[namespace].pop(name, None)
+        if old is None:
+            return
+
+        for label in old['metadata'].get('labels', {}).items():
+            self._index[namespace][label].discard(name)
+
+
+def start(client, kinds=KINDS):
+    """
+    Start informers for the given kinds (resource names in plural) if not already running
+    """
+    if all(kind in informers for kind in kinds):
+        return
+
+    with lock:
+        for kind in kinds:
+            if kind in informers:
+                continue
+
+            informer = Informer(getattr(client, kind), kind)
+            informer.start()
+            informers[kind] = informer
+
+
+def stop():
+    """Stop all running informers and drop their caches"""
+    with lock:
+        for informer in informers.values():
+            informer.stop()
+
+        informers.clear()
+
+
+def get(kind):
+    """Get an informer for a kind that is in sync, None otherwise"""
+    informer = informers.get(kind)
+    if informer is not None and informer.synced:
+        return informer
+
+    return None
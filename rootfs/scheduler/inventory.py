@@ -0,0 +1,80 @@
+"""
+Cache of the nodes in a Kubernetes cluster, indexed by label
+
+Deploy batching and tag validation only need to know how many nodes carry a set of
+labels. The node list is fetched once per API server and kept for TTL seconds, with
+every label pointing to the names of the nodes that have it, so those questions are
+answered with a few set lookups instead of a node list each time.
+
+When no cached node matches, the API server is asked directly in case the node is
+new, and the cache is dropped if it turns out to be stale.
+"""
+from collections import defaultdict
+import threading
+import time
+
+# how long the node inventory is trusted, in seconds
+TTL = 60
+
+# API server URL -> {'nodes': set of names, 'index': {(label, value): names}, 'expires': ts}
+cache = {}
+lock = threading.Lock()
+
+
+def _entry(client):
+    entry = cache.get(client.url)
+    if entry is not None and entry['expires'] > time.time():
+        return entry
+
+    with lock:
+        entry = cache.get(client.url)
+        if entry is None or entry['expires'] <= time.time():
+            entry = _fetch(client)
+            cache[client.url] = entry
+
+    return entry
+
+
+def _fetch(client):
+    nodes = set()
+    index = defaultdict(set)
+    for page in client.pages(client.node.get):
+        for node in page['items']:
+            name = node['metadata']['name']
+            nodes.add(name)
+            for label in node['metadata'].get('labels', {}).items():
+                index[label].add(name)
+
+    return {'nodes': nodes, 'index': index, 'expires': time.time() + TTL}
+
+
+def _match(entry, labels):
+    names = entry['nodes']
+    for key, value in labels.items():
+        names = names & entry['index'].get((key, str(value)), set())
+
+    return names
+
+
+def count(client, labels=None):
+    """Get how many nodes have all of the given labels"""
+    labels = labels or {}
+    matches = len(_match(_entry(client), labels))
+    if matches:
+        return matches
+
+    # cache miss, a matching node may have joined since the inventory was taken
+    matches = len(client.node.get(labels=labels).json()['items'])
+    if matches:
+        invalidate(client.url)
+
+    return matches
+
+
+def invalidate(url=None):
+    """Forget the nodes of an API server, or all of them"""
+    with lock:
+        if url is None:
+            cache.clear()
+        else:
+            cache.pop(url, None)
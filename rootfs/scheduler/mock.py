@@ -575,9 +575,10 @@ def filter_data(filters, path):
                         add = False
                         continue
 
+            # a value of None only asks for the label to exist
             elif (
                 label not in item['metadata']['labels'] or
-                item['metadata']['labels'][label] != value
+                (value is not None and item['metadata']['labels'][label] != value)
             ):
                 add = False
                 continue
@@ -589,7 +590,8 @@ def filter_data(filters, path):
 
 
 def fetch_single(request, context):
-    url = cache_key(request.url)
+    # query parameters, such as those of a followed log, are not part of the key
+    url = cache_key(request.url.split('?')[0])
     data = cache.get(url)
     if data is None:
         context.status_code = 404
@@ -604,7 +606,23 @@ def fetch_all(request, context):
     url = urlparse(request.url)
     filters = prepare_query_filters(url.query)
     cache_path = cache_key(request.path)
+    # lists across all namespaces, such as /api/v1/pods, use the resource type wide scope
+    resource_type = get_type(url.path)
+    if resource_type not in ['namespaces', 'nodes'] and '_namespaces_' not in cache_path:
+        cache_path = resource_type
     data = filter_data(filters, cache_path)
+
+    # chunked list, the continue token is simply the offset into the list
+    query = parse_qs(url.query)
+    if 'limit' in query:
+        start = int(query.get('continue', [0])[0])
+        end = start + int(query['limit'][0])
+        response = {'items': data[start:end], 'metadata': {}}
+        if end < len(data):
+            response['metadata']['continue'] = str(end)
+
+        return response
+
     return {'items': data}
 
 
@@ -624,6 +642,9 @@ def prepare_query_filters(query):
                         # equal based requirement
                         key, value = item.split('=')
                         filters['labels'][key] = value
+                    elif re.match(r'^[\w./-]+$', item):
+                        # the label only has to exist
+                        filters['labels'][item] = None
                     else:
                         # set based requirement
                         matches = labelRegex.match(item)
@@ -683,9 +704,8 @@ def post(request, context):
 
     # don't bother adding it to those two resources since they live outside namespace
     if resource_type not in ['nodes', 'namespaces']:
-        namespace = request.url.replace(settings.SCHEDULER_URL + '/api/v1/namespaces/',  '')
-        namespace = namespace.replace(settings.SCHEDULER_URL + '/apis/extensions/v1beta1/namespaces/',  '')  # noqa
-        namespace = namespace.split('/')[0]
+        # the same for every API group, autoscaling included
+        namespace = urlparse(request.url).path.split('/namespaces/', 1)[1].split('/')[0]
         data['metadata']['namespace'] = namespace
 
     # Handle RC / RS / Deployments
@@ -784,16 +804,99 @@ def put(request, context):
     return request.json()
 
 
+def merge_patch(target, patch):
+    """
+    Apply a JSON merge patch (RFC 7386), keys set to None are removed
+
+    Strategic merge patches are treated the same, lists are replaced as a whole
+    """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+
+    if not isinstance(target, dict):
+        target = {}
+
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = merge_patch(target.get(key), value)
+
+    return target
+
+
+def patch(request, context):
+    """Process a PATCH request to the kubernetes API"""
+    url = cache_key(request.url)
+    resource_type = get_type(request.url)
+    item = cache.get(url)
+    if item is None:
+        context.status_code = 404
+        context.reason = 'Not Found'
+        return {}
+
+    data = merge_patch(copy.deepcopy(item), request.json())
+    if resource_type in ['replicationcontrollers', 'replicasets', 'deployments']:
+        data['metadata']['resourceVersion'] += 1
+        if data['spec'] != item['spec']:
+            data['metadata']['generation'] += 1
+            data['status']['observedGeneration'] += 1
+
+        cache.set(url, data, None)
+
+        if resource_type in ['replicationcontrollers', 'replicasets']:
+            upsert_pods(data, url)
+        elif resource_type == 'deployments':
+            manage_replicasets(data, url)
+    else:
+        cache.set(url, data, None)
+
+    context.status_code = 200
+    context.reason = 'OK'
+    return data
+
+
+def delete_collection(request, context):
+    """Process a DELETE request for all objects in a collection matching the label selector"""
+    url = urlparse(request.url)
+    resource_type = get_type(url.path)
+    cache_path = cache_key(request.path)
+    names = {
+        item['metadata']['name']
+        for item in filter_data(prepare_query_filters(url.query), cache_path)
+    }
+    for row in cache.get(cache_path, []):
+        item = cache.get(row)
+        if item is None or item['metadata']['name'] not in names:
+            continue
+
+        if resource_type == 'pods':
+            # pods have a graceful termination period
+            if 'deletionTimestamp' not in item['metadata']:
+                add_cleanup_pod(row)
+        else:
+            remove_cache_item(row, resource_type)
+
+    context.status_code = 200
+    context.reason = 'OK'
+    return {'kind': 'Status', 'status': 'Success'}
+
+
 def delete(request, context):
     """Process a DELETE request to the kubernetes API"""
     url = cache_key(request.url)
+    resource_type = get_type(request.url)
+    # the type is lost behind the query string of a label selector
+    path = urlparse(request.url).path
+    if path.strip('/').split('/')[-1] == get_type(path):
+        return delete_collection(request, context)
+
     data = cache.get(url)
     if data is None:
         context.status_code = 404
         context.reason = 'Not Found'
         return {}
 
-    resource_type = get_type(request.url)
     # clean everything from a namespace
     if resource_type == 'namespaces':
         for resource in resources:
@@ -877,6 +980,8 @@ def mock_kubernetes(request, context):
         response = get(request, context)
     elif request.method == 'PUT':
         response = put(request, context)
+    elif request.method == 'PATCH':
+        response = patch(request, context)
     elif request.method == 'DELETE':
         response = delete(request, context)
 
@@ -1029,6 +1134,8 @@ class MockSchedulerClient(KubeHTTPClient):
 
 scheduler.session = session()
 SchedulerClient = MockSchedulerClient
+# every test starts with an empty cache, build a freshly seeded client each time
+scheduler.client_factory = MockSchedulerClient
 
 
 # List of currently used resources in the client
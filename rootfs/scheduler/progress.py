@@ -0,0 +1,46 @@
+"""
+Structured progress events of rollouts, for clients following along while they happen
+
+The scheduler emits events for a namespace (see emit()) next to the log lines it writes
+while waiting on Deployments and pods. Anyone interested in a namespace subscribes a
+queue for as long as they care, see subscribe(). Nothing is kept when nobody listens.
+"""
+from collections import defaultdict
+import queue
+import threading
+import time
+
+# namespace -> subscribed queues
+subscribers = defaultdict(list)
+lock = threading.Lock()
+
+
+def emit(namespace, event, **data):
+    """Hand an event, such as pods or image_pull, to everyone following the namespace"""
+    with lock:
+        queues = list(subscribers.get(namespace, []))
+
+    if not queues:
+        return
+
+    data.update({'event': event, 'namespace': namespace, 'time': time.time()})
+    for events in queues:
+        events.put(data)
+
+
+def subscribe(namespace):
+    """Get a queue receiving the events of a namespace, until unsubscribed"""
+    events = queue.Queue()
+    with lock:
+        subscribers[namespace].append(events)
+
+    return events
+
+
+def unsubscribe(namespace, events):
+    with lock:
+        if events in subscribers.get(namespace, []):
+            subscribers[namespace].remove(events)
+
+        if not subscribers.get(namespace):
+            subscribers.pop(namespace, None)
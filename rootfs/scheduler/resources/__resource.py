@@ -1,4 +1,8 @@
-from .. import KubeHTTPClient
+import time
+
+from .. import KubeHTTPClient, informers
+from ..exceptions import KubeHTTPException
+from ..utils import manifest_hash
 
 
 class ResourceRegistry(type):
@@ -23,6 +27,106 @@ class Resource(KubeHTTPClient, metaclass=ResourceRegistry):
     api_prefix = 'api'
     short_name = None
 
+    # annotation holding a hash of the manifest an object was last written from
+    hash_annotation = 'deis.io/manifest-hash'
+
     def api(self, tmpl, *args):
         """Return a fully-qualified Kubernetes API URL from a string template with args."""
         return "/{}/{}".format(self.api_prefix, self.api_version) + tmpl.format(*args)
+
+    def stamp(self, manifest):
+        """
+        Annotate a manifest with a hash of its content, so the next write of the object can
+        tell if it would change anything, see unchanged()
+        """
+        annotations = manifest['metadata'].setdefault('annotations', {})
+        annotations.pop(self.hash_annotation, None)
+        annotations[self.hash_annotation] = manifest_hash(self.hashed(manifest))
+        return manifest
+
+    def hashed(self, manifest):
+        """The part of a manifest that goes into its hash, all of it unless overridden"""
+        return manifest
+
+    def unchanged(self, current, manifest):
+        """
+        Whether an object as fetched from the API server was written from the same stamped
+        manifest, in which case writing the manifest again would only bump its resourceVersion
+        and wake every watcher of the kind
+        """
+        if not current:
+            return False
+
+        annotations = current['metadata'].get('annotations') or {}
+        return annotations.get(self.hash_annotation) == manifest['metadata']['annotations'][self.hash_annotation]  # noqa
+
+    def items(self, namespace, **kwargs):
+        """
+        Iterate over the objects of this kind in a namespace
+
+        Served from an informer cache when one is running and in sync and the query only
+        covers Deis managed objects by label, otherwise read from the API server in
+        chunks of KUBERNETES_LIST_LIMIT objects so large collections are never held in
+        memory all at once
+        """
+        labels = kwargs.get('labels') or {}
+        informer = informers.get(type(self).__name__.lower() + 's')
+        if (
+            informer is not None and
+            not kwargs.get('fields') and
+            labels.get('heritage') == informers.SELECTOR['heritage']
+        ):
+            yield from informer.list(namespace, labels)
+            return
+
+        for page in self.pages(self.get, namespace, **kwargs):
+            yield from page['items']
+
+    def all_items(self, **kwargs):
+        """
+        Iterate over the objects of this kind across all namespaces, read from the API server
+        in chunks like items()
+        """
+        for page in self.pages(self._list_all, **kwargs):
+            yield from page['items']
+
+    def _list_all(self, **kwargs):
+        kind = type(self).__name__.lower() + 's'
+        url = self.api('/{}'.format(kind))
+        response = self.http_get(url, params=self.query_params(**kwargs))
+        if self.unhealthy(response.status_code):
+            raise KubeHTTPException(response, 'list {}', kind)
+
+        return response
+
+    def delete_collection(self, namespace, wait=False, timeout=30, **kwargs):
+        """
+        Delete all objects of this kind in a namespace matching the label selector with a
+        single request, instead of fetching and deleting them one at a time
+
+        The API server removes them in the background; pods linger for their termination
+        grace period. With wait set this waits up to timeout seconds for them to be gone
+        """
+        kind = type(self).__name__.lower() + 's'
+        url = self.api('/namespaces/{}/{}', namespace, kind)
+        response = self.http_delete(url, params=self.query_params(**kwargs))
+        if self.unhealthy(response.status_code):
+            raise KubeHTTPException(response, 'delete {} in Namespace "{}"', kind, namespace)
+
+        if wait:
+            self.wait_until_deleted(namespace, timeout, **kwargs)
+
+        return response
+
+    def wait_until_deleted(self, namespace, timeout=30, **kwargs):
+        """
+        Wait up to timeout seconds for no object of this kind matching the label selector
+        to be left in a namespace. Returns whether they all went away in time
+        """
+        for _ in range(timeout):
+            if next(self.items(namespace, **kwargs), None) is None:
+                return True
+
+            time.sleep(1)
+
+        return False
@@ -1,8 +1,10 @@
+import copy
 from datetime import datetime, timedelta
 import json
-import time
+from scheduler import progress
 from scheduler.resources import Resource
 from scheduler.exceptions import KubeException, KubeHTTPException
+from scheduler.utils import dict_merge
 
 
 class Deployment(Resource):
@@ -43,7 +45,7 @@ class Deployment(Resource):
 
         manifest = {
             'kind': 'Deployment',
-            'apiVersion': 'extensions/v1beta1',
+            'apiVersion': self.api_version,
             'metadata': {
                 'name': name,
                 'labels': labels,
@@ -104,8 +106,21 @@ class Deployment(Resource):
         # pod manifest spec
         manifest['spec']['template'] = self.pod.manifest(namespace, name, image, **kwargs)
 
+        return self.stamp(manifest)
+
+    def hashed(self, manifest):
+        # replicas are changed through the scale subresource and by autoscalers
+        manifest = copy.deepcopy(manifest)
+        manifest['spec'].pop('replicas', None)
         return manifest
 
+    def unchanged(self, current, manifest):
+        # replicas are left out of the hash
+        return (
+            super().unchanged(current, manifest) and
+            current['spec'].get('replicas') == manifest['spec']['replicas']
+        )
+
     def create(self, namespace, name, image, entrypoint, command, **kwargs):
         manifest = self.manifest(namespace, name, image,
                                  entrypoint, command, **kwargs)
@@ -124,9 +139,16 @@ class Deployment(Resource):
 
         return response
 
-    def update(self, namespace, name, image, entrypoint, command, **kwargs):
+    def update(self, namespace, name, image, entrypoint, command, current=None, **kwargs):
+        """
+        Replace a Deployment and wait for the rollout, unless current (the Deployment as
+        fetched) shows it was already written from the same manifest
+        """
         manifest = self.manifest(namespace, name, image,
                                  entrypoint, command, **kwargs)
+        if self.unchanged(current, manifest):
+            self.log(namespace, 'Deployment {} is up to date, not updating it'.format(name))
+            return
 
         url = self.api("/namespaces/{}/deployments/{}", namespace, name)
         response = self.http_put(url, json=manifest)
@@ -139,6 +161,45 @@ class Deployment(Resource):
 
         return response
 
+    def patch(self, namespace, name, data, strategic=False):
+        """
+        Change only the parts of a Deployment given in data, without fetching it first
+
+        Keys set to None are removed. Does not wait for a rollout the change may start
+        """
+        # the hash of what was last written no longer holds
+        data = dict_merge(data, {'metadata': {'annotations': {self.hash_annotation: None}}})
+        url = self.api("/namespaces/{}/deployments/{}", namespace, name)
+        response = self.http_patch(url, json=data, strategic=strategic)
+        if self.unhealthy(response.status_code):
+            self.log(namespace, 'patch: {}'.format(json.dumps(data, indent=4)), 'DEBUG')
+            raise KubeHTTPException(
+                response,
+                'patch Deployment "{}" in Namespace "{}"', name, namespace
+            )
+
+        return response
+
+    def restart(self, namespace, name, **kwargs):
+        """
+        Replace all pods of a Deployment by stamping its pod template with the time of the
+        restart, so they are rolled over in batches like in a deploy rather than all deleted
+        at once. Waits for the rollout like update() does, unless wait is unset
+        """
+        data = {'spec': {'template': {'metadata': {'annotations': {
+            'deis.io/restartedAt': datetime.utcnow().strftime(self.DATETIME_FORMAT)
+        }}}}}
+        response = self.patch(namespace, name, data)
+        if not kwargs.get('wait', True):
+            return response
+
+        # autoscalers may have the Deployment at other replicas than asked for last
+        kwargs['replicas'] = response.json()['spec']['replicas']
+        self.wait_until_updated(namespace, name)
+        self.wait_until_ready(namespace, name, **kwargs)
+
+        return response
+
     def delete(self, namespace, name):
         url = self.api("/namespaces/{}/deployments/{}", namespace, name)
         response = self.http_delete(url)
@@ -244,6 +305,13 @@ class Deployment(Resource):
         Verify the status of a Deployment and if it is fully deployed
         """
         deployment = self.get(namespace, name).json()
+        return self._replicas_ready(deployment)
+
+    @staticmethod
+    def _replicas_ready(deployment):
+        """
+        Verify the status of a given Deployment object and if it is fully deployed
+        """
         desired = deployment['spec']['replicas']
         status = deployment['status']
 
@@ -275,20 +343,18 @@ class Deployment(Resource):
         https://github.com/kubernetes/kubernetes/blob/master/docs/devel/api-conventions.md#metadata
         """
         self.log(namespace, "waiting for Deployment {} to get a newer generation (30s timeout)".format(name), 'DEBUG')  # noqa
-        for _ in range(30):
-            try:
-                deploy = self.deployment.get(namespace, name).json()
-                if (
-                    'observedGeneration' in deploy['status'] and
-                    deploy['status']['observedGeneration'] >= deploy['metadata']['generation']
-                ):
-                    self.log(namespace, "A newer generation was found for Deployment {}".format(name), 'DEBUG')  # noqa
-                    break
-
-                time.sleep(1)
-            except KubeHTTPException as e:
-                if e.response.status_code == 404:
-                    time.sleep(1)
+
+        def updated(deployments):
+            deploy = deployments.get(name)
+            return (
+                deploy is not None and
+                'observedGeneration' in deploy['status'] and
+                deploy['status']['observedGeneration'] >= deploy['metadata']['generation']
+            )
+
+        url = self.api('/namespaces/{}/deployments', namespace)
+        if self.wait_until(url, updated, 30, fields={'metadata.name': name}):
+            self.log(namespace, "A newer generation was found for Deployment {}".format(name), 'DEBUG')  # noqa
 
     def wait_until_ready(self, namespace, name, **kwargs):
         """
@@ -325,27 +391,32 @@ class Deployment(Resource):
         # a rough calculation that figures out an overall timeout
         timeout = len(batches) * deploy_timeout
         self.log(namespace, 'This deployments overall timeout is {}s - batch timout is {}s and there are {} batches to deploy with a total of {} pods'.format(timeout, deploy_timeout, len(batches), replicas))  # noqa
+        progress.emit(namespace, 'batches', name=name, timeout=timeout, batch_timeout=deploy_timeout, batches=batches, desired=replicas)  # noqa
 
-        waited = 0
-        while waited < timeout:
-            ready, availablePods = self.are_replicas_ready(namespace, name)
-            if ready:
-                break
+        def ready(deployments):
+            return name in deployments and self._replicas_ready(deployments[name])[0]
+
+        # check every 10 seconds for pod failures.
+        # Depend on Deployment checks for ready pods
+        def handle_pending_pods(waited, deployments):
+            additional_timeout = self.pod._handle_pending_pods(namespace, labels)
+            if additional_timeout:
+                # add 10 minutes to timeout to allow a pull image operation to finish
+                self.log(namespace, 'Kubernetes has been pulling the image for {}s'.format(waited))  # noqa
+                self.log(namespace, 'Increasing timeout by {}s to allow a pull image operation to finish for pods'.format(additional_timeout))  # noqa
+                progress.emit(namespace, 'image_pull', name=name, waited=waited, additional_timeout=additional_timeout)  # noqa
 
-            # check every 10 seconds for pod failures.
-            # Depend on Deployment checks for ready pods
-            if waited > 0 and (waited % 10) == 0:
-                additional_timeout = self.pod._handle_pending_pods(namespace, labels)
-                if additional_timeout:
-                    timeout += additional_timeout
-                    # add 10 minutes to timeout to allow a pull image operation to finish
-                    self.log(namespace, 'Kubernetes has been pulling the image for {}s'.format(waited))  # noqa
-                    self.log(namespace, 'Increasing timeout by {}s to allow a pull image operation to finish for pods'.format(additional_timeout))  # noqa
+            availablePods = 0
+            if name in deployments:
+                _, availablePods = self._replicas_ready(deployments[name])
+            self.log(namespace, "waited {}s and {} pods are in service".format(waited, availablePods))  # noqa
+            progress.emit(namespace, 'pods', name=name, waited=waited, ready=availablePods, desired=replicas)  # noqa
 
-                self.log(namespace, "waited {}s and {} pods are in service".format(waited, availablePods))  # noqa
+            return additional_timeout
 
-            waited += 1
-            time.sleep(1)
+        url = self.api('/namespaces/{}/deployments', namespace)
+        self.wait_until(url, ready, timeout, tick=handle_pending_pods,
+                        fields={'metadata.name': name})
 
         # check if the replicas are still not ready because of healthcheck failures
         ready, _ = self.are_replicas_ready(namespace, name)
@@ -356,7 +427,7 @@ class Deployment(Resource):
         # if there is no batch information available default to available nodes for app
         if not batches:
             # figure out how many nodes the application can go on
-            steps = len(self.node.get(labels=tags).json()['items'])
+            steps = self.node.count(labels=tags)
         else:
             steps = int(batches)
 
@@ -1,4 +1,5 @@
 import json
+from scheduler import discovery
 from scheduler.resources import Resource
 from scheduler.exceptions import KubeException, KubeHTTPException
 
@@ -7,10 +8,18 @@ class HorizontalPodAutoscaler(Resource):
     api_prefix = 'apis'
     short_name = 'hpa'
 
+    # in order of preference
+    api_versions = ['autoscaling/v1', 'extensions/v1beta1']
+
     @property
     def api_version(self):
         # API location changes between versions
         # http://kubernetes.io/docs/user-guide/horizontal-pod-autoscaling/#api-object
+        api_version = self.preferred_version(self.api_versions)
+        if api_version is not None:
+            return api_version
+
+        # the server did not say what it supports, go by the version
         if self.version() >= 1.3:
             return 'autoscaling/v1'
 
@@ -55,9 +64,10 @@ class HorizontalPodAutoscaler(Resource):
             'heritage': 'deis',
         }
 
+        api_version = self.api_version
         manifest = {
             'kind': 'HorizontalPodAutoscaler',
-            'apiVersion': self.api_version,
+            'apiVersion': api_version,
             'metadata': {
                 'name': name,
                 'namespace': namespace,
@@ -69,7 +79,7 @@ class HorizontalPodAutoscaler(Resource):
             }
         }
 
-        if self.version() >= 1.3:
+        if api_version == 'autoscaling/v1':
             manifest['spec']['targetCPUUtilizationPercentage'] = cpu_percent
 
             manifest['spec']['scaleTargetRef'] = {
@@ -77,7 +87,7 @@ class HorizontalPodAutoscaler(Resource):
                 'kind': target['kind'],
                 'name': target['metadata']['name'],
             }
-        elif self.version() <= 1.2:
+        else:
             # api changed between version
             manifest['spec']['cpuUtilization'] = {
                 'targetPercentage': cpu_percent
@@ -91,7 +101,7 @@ class HorizontalPodAutoscaler(Resource):
                 'subresource': 'scale',
             }
 
-        return manifest
+        return self.stamp(manifest)
 
     def create(self, namespace, name, app_type, target, **kwargs):
         manifest = self.manifest(namespace, name, app_type, target, **kwargs)
@@ -99,6 +109,10 @@ class HorizontalPodAutoscaler(Resource):
         url = self.api("/namespaces/{}/horizontalpodautoscalers", namespace)
         response = self.http_post(url, json=manifest)
         if self.unhealthy(response.status_code):
+            if response.status_code == 404:
+                # the API group may have moved, rediscover next time around
+                discovery.invalidate(self.url)
+
             self.log(namespace, 'template used: {}'.format(json.dumps(manifest, indent=4)), 'DEBUG')  # noqa
             raise KubeHTTPException(
                 response,
@@ -111,12 +125,23 @@ class HorizontalPodAutoscaler(Resource):
 
         return response
 
-    def update(self, namespace, name, app_type, target, **kwargs):
+    def update(self, namespace, name, app_type, target, current=None, **kwargs):
+        """
+        Replace a HorizontalPodAutoscaler, unless current (the HorizontalPodAutoscaler as
+        fetched) shows it already has the rules
+        """
         manifest = self.manifest(namespace, name, app_type, target, **kwargs)
+        if self.unchanged(current, manifest):
+            self.log(namespace, 'HorizontalPodAutoscaler {} is up to date, not updating it'.format(name), 'DEBUG')  # noqa
+            return
 
         url = self.api("/namespaces/{}/horizontalpodautoscalers/{}", namespace, name)
         response = self.http_put(url, json=manifest)
         if self.unhealthy(response.status_code):
+            if response.status_code == 404:
+                # the API group may have moved, rediscover next time around
+                discovery.invalidate(self.url)
+
             self.log(namespace, 'template used: {}'.format(json.dumps(manifest, indent=4)), 'DEBUG')  # noqa
             raise KubeHTTPException(response, 'update HorizontalPodAutoscaler "{}"', name)
 
@@ -145,17 +170,18 @@ class HorizontalPodAutoscaler(Resource):
         # when https://github.com/kubernetes/kubernetes/issues/29739 is fixed
         # until then we have to query things ourselves
 
+        # the reference to the scaled resource moved between API versions
+        if 'scaleTargetRef' in hpa['spec']:
+            resource_kind = hpa['spec']['scaleTargetRef']['kind'].lower()
+            resource_name = hpa['spec']['scaleTargetRef']['name']
+        else:
+            resource_kind = hpa['spec']['scaleRef']['kind'].lower()
+            resource_name = hpa['spec']['scaleRef']['name']
+
         # only wait 30 seconds / attempts - this is not optimal
         # ideally it would use the resources wait commands but they vary
         for _ in range(30):
             # fetch resource attached to it
-            if self.version() >= 1.3:
-                resource_kind = hpa['spec']['scaleTargetRef']['kind'].lower()
-                resource_name = hpa['spec']['scaleTargetRef']['name']
-            elif self.version() <= 1.2:
-                resource_kind = hpa['spec']['scaleRef']['kind'].lower()
-                resource_name = hpa['spec']['scaleRef']['name']
-
             resource = getattr(self, resource_kind)
             resource = getattr(resource, 'get')(namespace, resource_name).json()
 
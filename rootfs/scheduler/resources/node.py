@@ -1,3 +1,4 @@
+from scheduler import inventory
 from scheduler.resources import Resource
 from scheduler.exceptions import KubeHTTPException
 
@@ -25,3 +26,9 @@ class Node(Resource):
             raise KubeHTTPException(response, message, *args)
 
         return response
+
+    def count(self, labels=None):
+        """
+        Count the Nodes that have all of the given labels, answered from the node inventory
+        """
+        return inventory.count(self, labels)
@@ -4,6 +4,8 @@ import operator
 import os
 import time
 
+from scheduler import progress
+from scheduler.events import EventIndex
 from scheduler.exceptions import KubeException, KubeHTTPException
 from scheduler.resources import Resource
 from scheduler.states import PodState
@@ -174,6 +176,8 @@ class Pod(Resource):
     def _set_container(self, namespace, container_name, data, **kwargs):
         """Set app container information (env, healthcheck, etc) on a Pod"""
         env = kwargs.get('envs', {})
+        # env vars set by value rather than from the env secret
+        values = kwargs.get('env_values', {})
 
         # container name
         data['name'] = container_name
@@ -190,18 +194,25 @@ class Pod(Resource):
 
         if env:
             # map application configuration (env secret) to env vars
-            secret_name = "{}-{}-env".format(namespace, kwargs.get('version'))
+            secret_name = kwargs.get('env_secret_name')
+            if secret_name is None:
+                # the name env secrets had before they were named after their content
+                secret_name = "{}-{}-env".format(namespace, kwargs.get('version'))
+
             for key in env.keys():
-                item = {
-                    "name": key,
-                    "valueFrom": {
-                        "secretKeyRef": {
-                            "name": secret_name,
-                            # k8s doesn't allow _ so translate to -, see above
-                            "key": key.lower().replace('_', '-')
+                if key in values:
+                    item = {"name": key, "value": str(values[key])}
+                else:
+                    item = {
+                        "name": key,
+                        "valueFrom": {
+                            "secretKeyRef": {
+                                "name": secret_name,
+                                # k8s doesn't allow _ so translate to -, see above
+                                "key": key.lower().replace('_', '-')
+                            }
                         }
                     }
-                }
 
                 # add value to env hash. Overwrite hardcoded values if need be
                 match = next((k for k, e in enumerate(data["env"]) if e['name'] == key), None)
@@ -373,9 +384,23 @@ class Pod(Resource):
 
         return response
 
-    def logs(self, namespace, name):
+    def logs(self, namespace, name, follow=False, since_seconds=None, limit_bytes=None,
+             **kwargs):
+        """
+        Get the log of a Pod. When following it the response is streamed, and ends when the
+        container terminates; read it with iter_content() rather than .text
+        """
         url = self.api("/namespaces/{}/pods/{}/log", namespace, name)
-        response = self.http_get(url)
+        params = {}
+        if follow:
+            params['follow'] = 'true'
+            kwargs['stream'] = True
+        if since_seconds is not None:
+            params['sinceSeconds'] = int(since_seconds)
+        if limit_bytes:
+            params['limitBytes'] = int(limit_bytes)
+
+        response = self.http_get(url, params=params, **kwargs)
         if self.unhealthy(response.status_code):
             raise KubeHTTPException(
                 response,
@@ -443,8 +468,12 @@ class Pod(Resource):
 
         return False
 
-    def pending_status(self, pod):
-        """Introspect the pod containers when pod is in Pending state"""
+    def pending_status(self, pod, index=None):
+        """
+        Introspect the pod containers when pod is in Pending state
+
+        Events are read from the EventIndex if one is passed in
+        """
         if 'containerStatuses' not in pod['status']:
             return 'Pending', ''
 
@@ -464,7 +493,7 @@ class Pod(Resource):
 
             if reason == 'ContainerCreating':
                 # get the last event
-                events = self.events(pod)
+                events = self.events(pod, index)
                 if not events:
                     # could not find any events
                     return reason, message
@@ -477,20 +506,29 @@ class Pod(Resource):
         # Return Pending if nothing else can be found
         return 'Pending', ''
 
-    def events(self, pod):
-        """Process events for a given Pod to find if Pulling is happening, among other events"""
+    def events(self, pod, index=None):
+        """
+        Process events for a given Pod to find if Pulling is happening, among other events
+
+        Answered from an EventIndex when one is passed in, otherwise the events of the
+        Pod are queried on their own
+        """
+        if index is not None:
+            return index.get(pod)
+
         # fetch all events for this pod
         fields = {
             'involvedObject.name': pod['metadata']['name'],
             'involvedObject.namespace': pod['metadata']['namespace'],
             'involvedObject.uid': pod['metadata']['uid']
         }
-        events = self.ns.events(pod['metadata']['namespace'], fields=fields).json()
+        pages = self.pages(self.ns.events, pod['metadata']['namespace'], fields=fields)
+        events = [event for page in pages for event in page['items']]
         # make sure that events are sorted
-        events['items'].sort(key=lambda x: x['lastTimestamp'])
-        return events['items']
+        events.sort(key=lambda x: x['lastTimestamp'])
+        return events
 
-    def _handle_pod_errors(self, pod, reason, message):
+    def _handle_pod_errors(self, pod, reason, message, index=None):
         """
         Handle potential pod errors based on the Pending
         reason passed into the function
@@ -524,7 +562,7 @@ class Pod(Resource):
         # collect all error messages of worth
         messages = []
         if reason in container_errors:
-            for event in self.events(pod):
+            for event in self.events(pod, index):
                 if event['reason'] in event_errors.keys():
                     # only show a given error once
                     event_errors.pop(event['reason'])
@@ -535,7 +573,7 @@ class Pod(Resource):
         if messages:
             raise KubeException("\n".join(messages))
 
-    def _handle_long_image_pulling(self, reason, pod):
+    def _handle_long_image_pulling(self, reason, pod, index=None):
         """
         If pulling an image is taking long (1 minute) then return how many seconds
         the pod ready state timeout should be extended by
@@ -550,7 +588,7 @@ class Pod(Resource):
             return 0
 
         # last event should be Pulling in this case
-        event = self.events(pod).pop()
+        event = self.events(pod, index).pop()
         # see if pull operation has been happening for over 1 minute
         seconds = 60  # time threshold before padding timeout
         start = self.parse_date(event['firstTimestamp'])
@@ -561,26 +599,32 @@ class Pod(Resource):
 
         return 0
 
-    def _handle_pending_pods(self, namespace, labels):
+    def _handle_pending_pods(self, namespace, labels, pods=None):
         """
         Detects if any pod is in the starting phases and handles
         any potential issues around that, and increases timeouts
         or throws errors as needed
+
+        An already fetched list of pods can be passed in to save a round trip
         """
         timeout = 0
-        pods = self.get(namespace, labels=labels).json()
-        for pod in pods['items']:
+        if pods is None:
+            pods = self.items(namespace, labels=labels)
+
+        # events of all pods are fetched at most once for this check
+        index = EventIndex(self, namespace)
+        for pod in pods:
             # only care about pods that are not starting or in the starting phases
             if pod['status']['phase'] not in ['Pending', 'ContainerCreating']:
                 continue
 
             # Get more information on why a pod is pending
-            reason, message = self.pending_status(pod)
+            reason, message = self.pending_status(pod, index)
             # If pulling an image is taking long then increase the timeout
-            timeout += self._handle_long_image_pulling(pod, reason)
+            timeout += self._handle_long_image_pulling(pod, reason, index)
 
             # handle errors and bubble up if need be
-            self._handle_pod_errors(pod, reason, message)
+            self._handle_pod_errors(pod, reason, message, index)
 
         return timeout
 
@@ -601,7 +645,7 @@ class Pod(Resource):
         # http://kubernetes.io/docs/user-guide/pods/#termination-of-pods
 
         # fetch timeout from the first pod
-        pods = self.get(namespace, labels=labels).json()
+        pods = self.get(namespace, labels=labels, limit=1).json()
         if not pods['items']:
             return
 
@@ -611,27 +655,24 @@ class Pod(Resource):
 
         delta = current - desired
         self.log(namespace, "waiting for {} pods to be terminated ({}s timeout)".format(delta, timeout))  # noqa
-        for waited in range(timeout):
-            pods = self.get(namespace, labels=labels).json()
-            count = len(pods['items'])
 
+        def remaining(pods):
             # see if any pods are past their terminationGracePeriodsSeconds (as in stuck)
             # seems to be a problem in k8s around that:
             # https://github.com/kubernetes/kubernetes/search?q=terminating&type=Issues
             # these will be eventually GC'ed by k8s, ignoring them for now
-            for pod in pods['items']:
-                # remove pod if it is passed the graceful termination period
-                if self.deleted(pod):
-                    count -= 1
+            return len([pod for pod in pods.values() if not self.deleted(pod)])
 
+        def terminated(pods):
             # stop when all pods are terminated as expected
-            if count == desired:
-                break
+            return remaining(pods) == desired
 
-            if waited > 0 and (waited % 10) == 0:
-                self.log(namespace, "waited {}s and {} pods out of {} are fully terminated".format(waited, (delta - count), delta))  # noqa
+        def tick(waited, pods):
+            self.log(namespace, "waited {}s and {} pods out of {} are fully terminated".format(waited, (delta - remaining(pods)), delta))  # noqa
+            progress.emit(namespace, 'terminating', waited=waited, terminated=(delta - remaining(pods)), total=delta)  # noqa
 
-            time.sleep(1)
+        url = self.api('/namespaces/{}/pods', namespace)
+        self.wait_until(url, terminated, timeout, tick=tick, labels=labels)
 
         self.log(namespace, "{} pods are terminated".format(delta))
 
@@ -643,20 +684,9 @@ class Pod(Resource):
         timeout = self.deploy_probe_timeout(timeout, namespace, labels, containers)
         self.log(namespace, "waiting for {} pods in {} namespace to be in services ({}s timeout)".format(desired, namespace, timeout))  # noqa
 
-        # Ensure the minimum desired number of pods are available
-        waited = 0
-        while waited < timeout:
-            # figure out if there are any pending pod issues
-            additional_timeout = self._handle_pending_pods(namespace, labels)
-            if additional_timeout:
-                timeout += additional_timeout
-                # add 10 minutes to timeout to allow a pull image operation to finish
-                self.log(namespace, 'Kubernetes has been pulling the image for {}s'.format(waited))  # noqa
-                self.log(namespace, 'Increasing timeout by {}s to allow a pull image operation to finish for pods'.format(additional_timeout))  # noqa
-
+        def in_service(pods):
             count = 0  # ready pods
-            pods = self.get(namespace, labels=labels).json()
-            for pod in pods['items']:
+            for pod in pods.values():
                 # now that state is running time to see if probes are passing
                 if self.ready(pod):
                     count += 1
@@ -670,29 +700,43 @@ class Pod(Resource):
                     count += 1
                     continue
 
-            if count == desired:
-                break
+            return count
 
-            if waited > 0 and (waited % 10) == 0:
-                self.log(namespace, "waited {}s and {} pods are in service".format(waited, count))
+        # ready pods as of the last evaluation
+        counts = [0]
 
-            # increase wait time without dealing with jitters from above code
-            waited += 1
-            time.sleep(1)
+        def ready(pods):
+            counts.append(in_service(pods))
+            return counts[-1] == desired
 
-        # timed out
-        if waited > timeout:
+        def tick(waited, pods):
+            # figure out if there are any pending pod issues
+            additional_timeout = self._handle_pending_pods(namespace, labels, pods.values())
+            if additional_timeout:
+                # add 10 minutes to timeout to allow a pull image operation to finish
+                self.log(namespace, 'Kubernetes has been pulling the image for {}s'.format(waited))  # noqa
+                self.log(namespace, 'Increasing timeout by {}s to allow a pull image operation to finish for pods'.format(additional_timeout))  # noqa
+                progress.emit(namespace, 'image_pull', waited=waited, additional_timeout=additional_timeout)  # noqa
+
+            self.log(namespace, "waited {}s and {} pods are in service".format(waited, counts[-1]))  # noqa
+            progress.emit(namespace, 'pods', waited=waited, ready=counts[-1], desired=desired)
+
+            return additional_timeout
+
+        # Ensure the minimum desired number of pods are available
+        url = self.api('/namespaces/{}/pods', namespace)
+        if not self.wait_until(url, ready, timeout, tick=tick, labels=labels):
             self.log(namespace, 'timed out ({}s) waiting for pods to come up in namespace {}'.format(timeout, namespace))  # noqa
 
-        self.log(namespace, "{} out of {} pods are in service".format(count, desired))  # noqa
+        self.log(namespace, "{} out of {} pods are in service".format(counts[-1], desired))  # noqa
 
     def _handle_not_ready_pods(self, namespace, labels):
         """
         Detects if any pod is in the Running phase but not Ready and handles
         any potential issues around that mainly failed healthcheks
         """
-        pods = self.get(namespace, labels=labels).json()
-        for pod in pods['items']:
+        index = EventIndex(self, namespace)
+        for pod in self.items(namespace, labels=labels):
             # only care about pods that are in running phase
             if pod['status']['phase'] != 'Running':
                 continue
@@ -703,7 +747,7 @@ class Pod(Resource):
             if container is None or container['ready'] == 'true':
                 continue
 
-            for event in self.events(pod):
+            for event in self.events(pod, index):
                 if event['reason'] == 'Unhealthy':
                     # strip out whitespaces on either side
                     message = "\n".join([x.strip() for x in event['message'].split("\n")])
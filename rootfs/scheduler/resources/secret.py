@@ -44,7 +44,7 @@ class Secret(Resource):
 
         return response
 
-    def manifest(self, namespace, name, data, secret_type='Opaque', labels={}):
+    def manifest(self, namespace, name, data, secret_type='Opaque', labels={}, immutable=False):
         secret_types = ['Opaque', 'kubernetes.io/dockerconfigjson']
         if secret_type not in secret_types:
             raise KubeException('{} is not a supported secret type. Use one of the following: '.format(secret_type, ', '.join(secret_types)))  # noqa
@@ -64,6 +64,10 @@ class Secret(Resource):
             'data': {}
         }
 
+        # the data can never change, so kubelets do not have to watch the secret for updates
+        if immutable:
+            manifest['immutable'] = True
+
         # add in any additional label info
         manifest['metadata']['labels'].update(labels)
 
@@ -76,10 +80,10 @@ class Secret(Resource):
             item = base64.b64encode(value).decode(encoding='UTF-8')
             manifest['data'].update({key: item})
 
-        return manifest
+        return self.stamp(manifest)
 
-    def create(self, namespace, name, data, secret_type='Opaque', labels={}):
-        manifest = self.manifest(namespace, name, data, secret_type, labels)
+    def create(self, namespace, name, data, secret_type='Opaque', labels={}, immutable=False):
+        manifest = self.manifest(namespace, name, data, secret_type, labels, immutable)
         url = self.api("/namespaces/{}/secrets", namespace)
         response = self.http_post(url, json=manifest)
         if self.unhealthy(response.status_code):
@@ -90,8 +94,15 @@ class Secret(Resource):
 
         return response
 
-    def update(self, namespace, name, data, secret_type='Opaque', labels={}):
+    def update(self, namespace, name, data, secret_type='Opaque', labels={}, current=None):
+        """
+        Replace a Secret, unless current (the Secret as fetched) shows it already has the data
+        """
         manifest = self.manifest(namespace, name, data, secret_type, labels)
+        if self.unchanged(current, manifest):
+            self.log(namespace, 'Secret {} is up to date, not updating it'.format(name), 'DEBUG')
+            return
+
         url = self.api("/namespaces/{}/secrets/{}", namespace, name)
         response = self.http_put(url, json=manifest)
         if self.unhealthy(response.status_code):
@@ -103,6 +114,37 @@ class Secret(Resource):
 
         return response
 
+    def patch(self, namespace, name, data=None, labels=None):
+        """
+        Change only the given data keys and labels of a Secret, without fetching it first
+
+        Values are base64 encoded as needed, keys set to None are removed
+        """
+        # the hash of what was last written no longer holds
+        patch = {'metadata': {'annotations': {self.hash_annotation: None}}}
+        if labels:
+            patch['metadata']['labels'] = labels
+
+        if data:
+            patch['data'] = {}
+            for key, value in data.items():
+                if value is not None:
+                    value = value if isinstance(value, bytes) else bytes(str(value), 'UTF-8')
+                    value = base64.b64encode(value).decode(encoding='UTF-8')
+
+                patch['data'][key] = value
+
+        url = self.api("/namespaces/{}/secrets/{}", namespace, name)
+        response = self.http_patch(url, json=patch)
+        if self.unhealthy(response.status_code):
+            raise KubeHTTPException(
+                response,
+                'failed to patch Secret "{}" in Namespace "{}"',
+                name, namespace
+            )
+
+        return response
+
     def delete(self, namespace, name):
         url = self.api("/namespaces/{}/secrets/{}", namespace, name)
         response = self.http_delete(url)
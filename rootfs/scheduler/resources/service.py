@@ -76,6 +76,42 @@ class Service(Resource):
 
         return response
 
+    def patch(self, namespace, name, data, strategic=False, current=None):
+        """
+        Change only the parts of a Service given in data, without fetching it first
+
+        Keys set to None are removed. When current (the Service as fetched) is given and
+        already has everything in data nothing is written
+        """
+        if current is not None and not self.changes(current, data):
+            self.log(namespace, 'Service {} is up to date, not patching it'.format(name), 'DEBUG')  # noqa
+            return
+
+        url = self.api("/namespaces/{}/services/{}", namespace, name)
+        response = self.http_patch(url, json=data, strategic=strategic)
+        if self.unhealthy(response.status_code):
+            raise KubeHTTPException(
+                response,
+                'patch Service "{}" in Namespace "{}"', name, namespace
+            )
+
+        return response
+
+    @classmethod
+    def changes(cls, current, data):
+        """Whether patching an object with data would change anything about it"""
+        for key, value in data.items():
+            if value is None:
+                if key in current:
+                    return True
+            elif isinstance(value, dict) and isinstance(current.get(key), dict):
+                if cls.changes(current[key], value):
+                    return True
+            elif current.get(key) != value:
+                return True
+
+        return False
+
     def delete(self, namespace, name):
         url = self.api("/namespaces/{}/services/{}", namespace, name)
         response = self.http_delete(url)
@@ -108,6 +108,38 @@ class DeploymentsTest(TestCase):
         deployment = self.scheduler.deployment.get(self.namespace, name).json()
         self.assertEqual(deployment['spec']['replicas'], 2, deployment)
 
+    def test_update_unchanged(self):
+        name = self.create()
+        current = self.scheduler.deployment.get(self.namespace, name).json()
+        kwargs = {
+            'app_type': 'web',
+            'version': 'v99',
+            'replicas': 4,
+            'pod_termination_grace_period_seconds': 2,
+            'image': 'quay.io/fake/image',
+            'entrypoint': 'sh',
+            'command': 'start',
+        }
+
+        # written from the same manifest, nothing to do
+        response = self.scheduler.deployment.update(
+            self.namespace, name, current=current, **kwargs
+        )
+        self.assertIsNone(response)
+        deployment = self.scheduler.deployment.get(self.namespace, name).json()
+        self.assertEqual(
+            deployment['metadata']['resourceVersion'], current['metadata']['resourceVersion']
+        )
+
+        # replicas are not part of the hash but still get written
+        kwargs['replicas'] = 2
+        response = self.scheduler.deployment.update(
+            self.namespace, name, current=current, **kwargs
+        )
+        self.assertEqual(response.status_code, 200, response.json())
+        deployment = self.scheduler.deployment.get(self.namespace, name).json()
+        self.assertEqual(deployment['spec']['replicas'], 2, deployment)
+
     def test_delete_failure(self):
         # test failure
         with self.assertRaises(
@@ -0,0 +1,52 @@
+import unittest
+from unittest import mock
+
+from scheduler.events import EventIndex
+
+
+def event(uid, reason, timestamp):
+    return {
+        'involvedObject': {'kind': 'Pod', 'uid': uid},
+        'reason': reason,
+        'message': reason,
+        'lastTimestamp': timestamp,
+    }
+
+
+def pod(uid):
+    return {'metadata': {'name': uid, 'namespace': 'foo', 'uid': uid}}
+
+
+class TestEventIndex(unittest.TestCase):
+    """Test the namespace wide event index"""
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.pages.return_value = [
+            {'items': [
+                event('a', 'Pulled', '2016-09-30T20:01:00Z'),
+                event('b', 'Scheduled', '2016-09-30T20:00:00Z'),
+            ]},
+            {'items': [
+                event('a', 'Pulling', '2016-09-30T20:00:00Z'),
+            ]},
+        ]
+        self.index = EventIndex(self.client, 'foo')
+
+    def test_lazy(self):
+        self.assertFalse(self.client.pages.called)
+
+    def test_get(self):
+        def reasons(events):
+            return [e['reason'] for e in events]
+
+        # grouped by pod and sorted by lastTimestamp
+        self.assertEqual(reasons(self.index.get(pod('a'))), ['Pulling', 'Pulled'])
+        self.assertEqual(reasons(self.index.get(pod('b'))), ['Scheduled'])
+        self.assertEqual(self.index.get(pod('c')), [])
+
+        # events were listed once for all pods
+        self.assertEqual(self.client.pages.call_count, 1)
+
+        # callers can pop off their copy without changing the index
+        self.index.get(pod('a')).pop()
+        self.assertEqual(reasons(self.index.get(pod('a'))), ['Pulling', 'Pulled'])
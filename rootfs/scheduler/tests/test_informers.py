@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+
+from scheduler import informers
+
+
+def pod(name, namespace='foo', **labels):
+    labels.setdefault('heritage', 'deis')
+    return {
+        'metadata': {
+            'name': name,
+            'namespace': namespace,
+            'labels': labels,
+            'resourceVersion': '1'
+        }
+    }
+
+
+class TestInformers(unittest.TestCase):
+    """Test the label indexed informer cache"""
+    def setUp(self):
+        resource = mock.Mock()
+        resource.api.return_value = '/api/v1/pods'
+        self.informer = informers.Informer(resource, 'pods')
+
+    def test_match_labels(self):
+        labels = {'app': 'foo', 'version': 'v2', 'type': 'web'}
+        self.assertTrue(informers.match_labels({'app': 'foo'}, labels))
+        self.assertFalse(informers.match_labels({'app': 'bar'}, labels))
+        self.assertTrue(informers.match_labels({'version__in': ['v1', 'v2']}, labels))
+        self.assertTrue(informers.match_labels({'version': ['v1', 'v2']}, labels))
+        self.assertFalse(informers.match_labels({'version__notin': ['v1', 'v2']}, labels))
+        self.assertTrue(informers.match_labels({'version__notin': ['v1']}, labels))
+        self.assertTrue(informers.match_labels({'type': None}, labels))
+        self.assertFalse(informers.match_labels({'release': None}, labels))
+
+    def test_list(self):
+        self.informer._apply('ADDED', pod('a', app='foo', version='v1', type='web'))
+        self.informer._apply('ADDED', pod('b', app='foo', version='v2', type='web'))
+        self.informer._apply('ADDED', pod('c', app='foo', version='v2', type='worker'))
+        self.informer._apply('ADDED', pod('d', namespace='bar', app='bar', version='v2'))
+
+        def names(items):
+            return sorted([item['metadata']['name'] for item in items])
+
+        self.assertEqual(names(self.informer.list('foo')), ['a', 'b', 'c'])
+        self.assertEqual(names(self.informer.list('foo', {'version': 'v2'})), ['b', 'c'])
+        self.assertEqual(
+            names(self.informer.list('foo', {'version': 'v2', 'type': 'web'})), ['b']
+        )
+        self.assertEqual(names(self.informer.list('foo', {'version__notin': ['v2']})), ['a'])
+        self.assertEqual(names(self.informer.list('baz')), [])
+
+        # labels changing moves the object around in the index
+        self.informer._apply('MODIFIED', pod('a', app='foo', version='v2', type='web'))
+        self.assertEqual(
+            names(self.informer.list('foo', {'version': 'v2', 'type': 'web'})), ['a', 'b']
+        )
+        self.assertEqual(names(self.informer.list('foo', {'version': 'v1'})), [])
+
+        self.informer._apply('DELETED', pod('b', app='foo', version='v2', type='web'))
+        self.assertEqual(names(self.informer.list('foo', {'type': 'web'})), ['a'])
+
+        # callers get copies they can not use to change the cache
+        self.informer.list('foo', {'type': 'web'})[0]['metadata']['name'] = 'z'
+        self.assertEqual(names(self.informer.list('foo', {'type': 'web'})), ['a'])
+
+    def test_get_only_synced(self):
+        with mock.patch.dict(informers.informers, {'pods': self.informer}):
+            self.assertIsNone(informers.get('pods'))
+            self.informer._synced.set()
+            self.assertEqual(informers.get('pods'), self.informer)
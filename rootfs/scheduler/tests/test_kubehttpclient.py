@@ -104,3 +104,118 @@ class KubeHTTPClientTest(TestCase):
         self.adapter.add_matcher(connection_refused_matcher)
         with self.assertRaises(exceptions.KubeException):
             self.scheduler.http_delete(self.path)
+
+    def test_watch(self):
+        """
+        Test that .watch() streams events and errors out when it can not be used.
+        """
+        events = [
+            {'type': 'ADDED', 'object': {'metadata': {'name': 'foo', 'resourceVersion': '2'}}},
+            {'type': 'DELETED', 'object': {'metadata': {'name': 'foo', 'resourceVersion': '3'}}},
+        ]
+        self.adapter.register_uri(
+            'GET', self.url,
+            text='\n'.join([json.dumps(event) for event in events]) + '\n'
+        )
+        data = list(self.scheduler.watch(self.path, resource_version='1', timeout=5))
+        self.assertEqual(data, [(event['type'], event['object']) for event in events])
+        self.assertEqual(self.adapter.last_request.qs['watch'], ['true'])
+        self.assertEqual(self.adapter.last_request.qs['resourceversion'], ['1'])
+        self.assertEqual(self.adapter.last_request.qs['timeoutseconds'], ['5'])
+
+        # the resource version is too old
+        self.adapter.register_uri(
+            'GET', self.url,
+            text=json.dumps({'type': 'ERROR', 'object': {'code': 410, 'message': 'too old'}})
+        )
+        with self.assertRaises(exceptions.KubeException):
+            list(self.scheduler.watch(self.path, resource_version='1'))
+
+        # a server that does not stream sends back the whole list
+        self.adapter.register_uri('GET', self.url, json={'items': []})
+        with self.assertRaises(exceptions.KubeException):
+            list(self.scheduler.watch(self.path, resource_version='1'))
+
+    def test_wait_until(self):
+        """
+        Test that .wait_until() lists once and then reacts to watch events.
+        """
+        pending = {'metadata': {'name': 'foo', 'resourceVersion': '1'}, 'status': 'Pending'}
+        running = {'metadata': {'name': 'foo', 'resourceVersion': '2'}, 'status': 'Running'}
+
+        def collection(request, context):
+            if 'watch' in request.qs:
+                return json.dumps({'type': 'MODIFIED', 'object': running}) + '\n'
+
+            return json.dumps({'metadata': {'resourceVersion': '1'}, 'items': [pending]})
+
+        self.adapter.register_uri('GET', self.url, text=collection)
+        done = self.scheduler.wait_until(
+            self.path, lambda items: items['foo']['status'] == 'Running', 30
+        )
+        self.assertTrue(done)
+        self.assertEqual(self.adapter.call_count, 2)
+
+        # without a resourceVersion to watch from it polls until the deadline
+        self.adapter.register_uri('GET', self.url, json={'items': [pending]})
+        done = self.scheduler.wait_until(
+            self.path, lambda items: items['foo']['status'] == 'Running', 1
+        )
+        self.assertFalse(done)
+
+    def test_get_client(self):
+        """
+        Test that get_client() hands out a single client until it is reset.
+        """
+        with mock.patch('scheduler.client_factory', None), \
+                mock.patch('scheduler.client', None), \
+                mock.patch('scheduler.session', self.scheduler.session), \
+                mock.patch.dict('scheduler.resource_mapping'):
+            client = scheduler.get_client(settings.SCHEDULER_URL)
+            self.assertIsInstance(client, scheduler.KubeHTTPClient)
+            self.assertIs(client, scheduler.get_client(settings.SCHEDULER_URL))
+
+            scheduler.reset_client()
+            self.assertIsNone(scheduler.session)
+            self.assertIsNot(client, scheduler.get_client(settings.SCHEDULER_URL))
+
+        # a registered factory builds a new client every time
+        with mock.patch('scheduler.client_factory', scheduler.KubeHTTPClient):
+            self.assertIsNot(
+                scheduler.get_client(settings.SCHEDULER_URL),
+                scheduler.get_client(settings.SCHEDULER_URL)
+            )
+
+    def test_discovery(self):
+        """
+        Test that the server version and API groups are fetched once and then cached.
+        """
+        url = 'http://discovery.example.com'
+        adapter = requests_mock.Adapter()
+        adapter.register_uri('GET', url + '/version', json={'major': '1', 'minor': '4+'})
+        adapter.register_uri('GET', url + '/apis', json={'groups': [
+            {'name': 'autoscaling', 'versions': [{'groupVersion': 'autoscaling/v1'}]},
+            {'name': 'extensions', 'versions': [{'groupVersion': 'extensions/v1beta1'}]},
+        ]})
+        client = scheduler.KubeHTTPClient(url)
+        client.session.mount(url, adapter)
+
+        self.assertEqual(client.version(), 1.4)
+        self.assertEqual(client.version(), 1.4)
+        self.assertEqual(
+            client.preferred_version(['autoscaling/v2alpha1', 'autoscaling/v1']),
+            'autoscaling/v1'
+        )
+        self.assertIsNone(client.preferred_version(['batch/v1']))
+        self.assertEqual(adapter.call_count, 2)
+
+        # forgetting about the server makes it go back to discovery
+        scheduler.discovery.invalidate(url)
+        self.assertEqual(client.version(), 1.4)
+        self.assertEqual(adapter.call_count, 4)
+
+        # servers without /apis can still say what version they are
+        scheduler.discovery.invalidate(url)
+        adapter.register_uri('GET', url + '/apis', status_code=404, json={})
+        self.assertIsNone(client.preferred_version(['autoscaling/v1']))
+        self.assertEqual(client.version(), 1.4)
@@ -3,8 +3,10 @@ Unit tests for the Deis scheduler module.
 
 Run the tests with "./manage.py test scheduler"
 """
+from unittest import mock
+
 from scheduler.tests import TestCase
-from scheduler import KubeHTTPException
+from scheduler import KubeHTTPException, inventory
 
 
 class NodesTest(TestCase):
@@ -35,3 +37,21 @@ class NodesTest(TestCase):
         self.assertEqual(data['kind'], 'Node')
         self.assertEqual(data['metadata']['name'], name)
         self.assertDictContainsSubset({'ssd': 'true'}, data['metadata']['labels'])
+
+    def test_count_nodes(self):
+        inventory.invalidate()
+        self.assertEqual(self.scheduler.node.count(), 1)
+        self.assertEqual(self.scheduler.node.count(labels={'environ': 'dev'}), 1)
+        self.assertEqual(self.scheduler.node.count(labels={'environ': 'dev', 'rack': 1}), 1)
+        self.assertEqual(self.scheduler.node.count(labels={'environ': 'prod'}), 0)
+
+        with mock.patch.object(self.scheduler.node, 'get') as get:
+            # answered from the inventory
+            self.assertEqual(self.scheduler.node.count(labels={'rack': '1'}), 1)
+            self.assertFalse(get.called)
+
+            # a miss goes to the API server and drops the inventory if it is stale
+            get.return_value.json.return_value = {'items': [{}]}
+            self.assertEqual(self.scheduler.node.count(labels={'rack': '2'}), 1)
+            self.assertEqual(get.call_count, 1)
+            self.assertNotIn(self.scheduler.url, inventory.cache)
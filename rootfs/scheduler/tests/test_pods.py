@@ -5,7 +5,7 @@ Run the tests with './manage.py test scheduler'
 """
 from unittest import mock
 from datetime import datetime, timedelta
-from scheduler import KubeHTTPException
+from scheduler import KubeHTTPException, progress
 from scheduler.tests import TestCase
 from scheduler.utils import generate_random_name
 
@@ -59,6 +59,45 @@ class PodsTest(TestCase):
         data = response.json()
         self.assertEqual(response.status_code, 200, data)
 
+    def test_delete_collection(self):
+        old = self.create(name=generate_random_name(), version='v98')
+        new = self.create(name=generate_random_name(), version='v99')
+        labels = {'heritage': 'deis', 'version': None, 'version__notin': ['v99']}
+        response = self.scheduler.pod.delete_collection(self.namespace, labels=labels)
+        self.assertEqual(response.status_code, 200, response.json())
+
+        # only the pods matching the selector are terminating
+        pod = self.scheduler.pod.get(self.namespace, old).json()
+        self.assertIn('deletionTimestamp', pod['metadata'])
+        pod = self.scheduler.pod.get(self.namespace, new).json()
+        self.assertNotIn('deletionTimestamp', pod['metadata'])
+
+    def test_wait_ticks(self):
+        name = self.create()
+        pod = self.scheduler.pod.get(self.namespace, name).json()
+        labels = pod['metadata']['labels']
+
+        def wait_until(path, condition, timeout, tick=None, **kwargs):
+            # a wait that lasts until the first tick
+            tick(10, {name: pod})
+            return True
+
+        events = progress.subscribe(self.namespace)
+        try:
+            with mock.patch('scheduler.KubeHTTPClient.wait_until', side_effect=wait_until):
+                containers = pod['spec']['containers']
+                self.scheduler.pod.wait_until_ready(self.namespace, containers, labels, 1, 30)
+                self.scheduler.pod.wait_until_terminated(self.namespace, labels, 2, 1)
+        finally:
+            progress.unsubscribe(self.namespace, events)
+
+        emitted = []
+        while not events.empty():
+            emitted.append(events.get_nowait()['event'])
+
+        self.assertIn('pods', emitted)
+        self.assertIn('terminating', emitted)
+
     def test_get_pods(self):
         # test success
         name = self.create()
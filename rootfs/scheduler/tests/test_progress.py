@@ -0,0 +1,27 @@
+import unittest
+
+from scheduler import progress
+
+
+class TestProgress(unittest.TestCase):
+    """Test handing rollout progress events to subscribers"""
+    def test_subscribe(self):
+        events = progress.subscribe('foo')
+        other = progress.subscribe('bar')
+        try:
+            progress.emit('foo', 'pods', ready=1, desired=2)
+            event = events.get_nowait()
+            self.assertEqual(event['event'], 'pods')
+            self.assertEqual(event['namespace'], 'foo')
+            self.assertEqual((event['ready'], event['desired']), (1, 2))
+            self.assertTrue(other.empty())
+        finally:
+            progress.unsubscribe('foo', events)
+            progress.unsubscribe('bar', other)
+
+        self.assertNotIn('foo', progress.subscribers)
+        self.assertNotIn('bar', progress.subscribers)
+
+    def test_nobody_listening(self):
+        progress.emit('foo', 'pods', ready=1, desired=2)
+        self.assertNotIn('foo', progress.subscribers)
@@ -3,6 +3,11 @@ Unit tests for the Deis scheduler module.
 
 Run the tests with "./manage.py test scheduler"
 """
+import time
+from unittest import mock
+
+from scheduler.exceptions import KubeException
+from scheduler.states import PodState
 from scheduler.tests import TestCase
 
 
@@ -103,3 +108,78 @@ class SchedulerTest(TestCase):
         self.assertEqual(data['resources']['limits']['cpu'], '500m', 'CPU should be lower cased')
         # make sure first char of Memory is upper cased
         self.assertEqual(data['resources']['limits']['memory'], '1024Mi', 'Memory should be upper cased')  # noqa
+
+    def run_kwargs(self):
+        return {
+            'app_type': 'run',
+            'version': 'v99',
+            'replicas': 1,
+            'deploy_timeout': 10,
+            'pod_termination_grace_period_seconds': 2,
+        }
+
+    @mock.patch('time.sleep', lambda seconds: None)
+    def test_run_stream(self):
+        log = mock.Mock()
+        # a multibyte character split across chunks
+        log.iter_content.return_value = [b'hello \xe2\x9c', b'\x93\n', b'done\n']
+        states = [PodState.initializing, PodState.up, PodState.up, PodState.down]
+        # the states are those seen by the run, not the wait for the pod to be created
+        with mock.patch.object(self.scheduler.pod, 'wait_until_ready'), \
+                mock.patch.object(self.scheduler.pod, 'state', side_effect=states), \
+                mock.patch.object(self.scheduler.pod, 'logs', return_value=log) as logs:
+            events = list(self.scheduler.run_stream(
+                self.namespace, 'run-abcde', 'quay.io/fake/image', 'sh', ['ls'],
+                **self.run_kwargs()
+            ))
+
+        self.assertEqual(events, [
+            ('state', 'initializing'),
+            ('state', 'up'),
+            ('output', 'hello '),
+            ('output', '\u2713\n'),
+            ('output', 'done\n'),
+            ('state', 'up'),
+            ('state', 'down'),
+            ('exit', 0),
+        ])
+        self.assertTrue(logs.call_args[1]['follow'])
+        log.close.assert_called_once_with()
+        # the pod is on its way out again
+        pods = list(self.scheduler.pod.items(self.namespace))
+        self.assertEqual(len(pods), 1)
+        self.assertIn('deletionTimestamp', pods[0]['metadata'])
+
+    def test_run_output_deadline(self):
+        log = mock.Mock()
+        # a command that keeps talking never hits the read timeout
+        log.iter_content.return_value = iter([b'still going\n'] * 5)
+        with mock.patch.object(self.scheduler.pod, 'logs', return_value=log):
+            output = self.scheduler._run_output(self.namespace, 'run-abcde', time.time())
+            self.assertEqual(next(output), ('output', 'still going\n'))
+            with self.assertRaisesRegex(KubeException, 'Timed out'):
+                next(output)
+
+        log.close.assert_called_once_with()
+
+    @mock.patch('time.sleep', lambda seconds: None)
+    def test_run(self):
+        log = mock.Mock()
+        log.iter_content.return_value = [b'I did ', b'stuff today']
+        crashed = {'containerStatuses': [{'state': {'terminated': {'exitCode': 3}}}]}
+        states = [PodState.up, PodState.crashed]
+        with mock.patch.object(self.scheduler.pod, 'wait_until_ready'), \
+                mock.patch.object(self.scheduler.pod, 'state', side_effect=states), \
+                mock.patch.object(self.scheduler.pod, 'get') as get, \
+                mock.patch.object(self.scheduler.pod, 'logs', return_value=log) as logs, \
+                mock.patch.object(self.scheduler.pod, 'delete'):
+            get.return_value.json.return_value = {'status': crashed}
+            exit_code, output = self.scheduler.run(
+                self.namespace, 'run-abcde', 'quay.io/fake/image', 'sh', ['ls'],
+                **self.run_kwargs()
+            )
+
+        self.assertEqual(exit_code, 3)
+        self.assertEqual(output, 'I did stuff today')
+        # output returned in one go is bounded
+        self.assertEqual(logs.call_args[1]['limit_bytes'], 10 * 1024 * 1024)
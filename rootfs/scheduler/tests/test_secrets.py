@@ -3,6 +3,8 @@ Unit tests for the Deis scheduler module.
 
 Run the tests with './manage.py test scheduler'
 """
+from unittest import mock
+
 from scheduler import KubeHTTPException, KubeException
 from scheduler.tests import TestCase
 from scheduler.utils import generate_random_name
@@ -72,6 +74,28 @@ class SecretsTest(TestCase):
         secret = self.scheduler.secret.get(self.namespace, name).json()
         self.assertEqual(secret['data']['foo'], '5001', secret)
 
+    def test_update_unchanged(self):
+        name = self.create()
+        current = self.scheduler.secret.get(self.namespace, name).json()
+        data = {'foo': 'bar', 'this': 'that', 'empty': None}
+
+        # the hash annotation shows nothing changed
+        with mock.patch('scheduler.KubeHTTPClient.http_put') as put:
+            response = self.scheduler.secret.update(self.namespace, name, data, current=current)
+            self.assertIsNone(response)
+            self.assertFalse(put.called)
+
+        data['foo'] = 'baz'
+        response = self.scheduler.secret.update(self.namespace, name, data, current=current)
+        self.assertEqual(response.status_code, 200, response.json())
+        secret = self.scheduler.secret.get(self.namespace, name).json()
+        self.assertEqual(secret['data']['foo'], 'baz', secret)
+
+        # a patch leaves no hash behind to go by
+        self.scheduler.secret.patch(self.namespace, name, {'foo': 'bar'})
+        secret = self.scheduler.secret.get(self.namespace, name).json()
+        self.assertNotIn(self.scheduler.secret.hash_annotation, secret['metadata']['annotations'])
+
     def test_delete_failure(self):
         # test failure
         with self.assertRaises(
@@ -87,6 +111,23 @@ class SecretsTest(TestCase):
         data = response.json()
         self.assertEqual(response.status_code, 200, data)
 
+    def test_delete_collection(self):
+        names = [generate_random_name() for _ in range(2)]
+        for name in names:
+            self.scheduler.secret.create(self.namespace, name, {}, labels={'type': 'old'})
+
+        self.scheduler.secret.create(self.namespace, 'keep', {}, labels={'type': 'env'})
+        response = self.scheduler.secret.delete_collection(
+            self.namespace, labels={'heritage': 'deis', 'type': None, 'type__notin': ['env']}
+        )
+        self.assertEqual(response.status_code, 200, response.json())
+
+        for name in names:
+            with self.assertRaises(KubeHTTPException):
+                self.scheduler.secret.get(self.namespace, name)
+
+        self.scheduler.secret.get(self.namespace, 'keep')
+
     def test_get_secrets(self):
         # test success
         name = self.create()
@@ -98,6 +139,20 @@ class SecretsTest(TestCase):
         # simple verify of data
         self.assertEqual(data['items'][0]['metadata']['name'], name)
 
+    def test_get_secrets_in_chunks(self):
+        names = sorted([self.create() for _ in range(5)])
+
+        # a page holds at most limit secrets and points to the next one
+        data = self.scheduler.secret.get(self.namespace, limit=2).json()
+        self.assertEqual(2, len(data['items']), data['items'])
+        self.assertIn('continue', data['metadata'])
+
+        # items reads all pages
+        with mock.patch.object(self.scheduler.secret, 'get', wraps=self.scheduler.secret.get) as get:  # noqa
+            secrets = self.scheduler.secret.items(self.namespace, limit=2)
+            self.assertEqual(names, sorted([s['metadata']['name'] for s in secrets]))
+            self.assertEqual(get.call_count, 3)
+
     def test_get_secret_failure(self):
         # test failure
         with self.assertRaises(
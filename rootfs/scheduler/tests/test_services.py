@@ -3,6 +3,8 @@ Unit tests for the Deis scheduler module.
 
 Run the tests with './manage.py test scheduler'
 """
+from unittest import mock
+
 from scheduler import KubeHTTPException
 from scheduler.tests import TestCase
 from scheduler.utils import generate_random_name
@@ -71,6 +73,50 @@ class ServicesTest(TestCase):
         service = self.scheduler.svc.get(self.namespace, name).json()
         self.assertEqual(service['spec']['ports'][0]['targetPort'], 5001, service)
 
+    def test_patch_failure(self):
+        # test failure
+        with self.assertRaises(
+            KubeHTTPException,
+            msg='failed to patch Service foo in Namespace {}: 404 Not Found'.format(self.namespace)  # noqa
+        ):
+            self.scheduler.svc.patch(self.namespace, 'foo', {})
+
+    def test_patch(self):
+        # test success
+        name = self.create()
+        data = {'metadata': {'annotations': {'router.deis.io/domains': 'foo.com'}}}
+        response = self.scheduler.svc.patch(self.namespace, name, data)
+        self.assertEqual(response.status_code, 200, response.json())
+
+        service = self.scheduler.svc.get(self.namespace, name).json()
+        self.assertEqual(service['metadata']['annotations']['router.deis.io/domains'], 'foo.com')
+        # the rest of the service is left alone
+        self.assertEqual(service['metadata']['labels']['heritage'], 'deis', service)
+        self.assertEqual(service['spec']['ports'][0]['targetPort'], 5000, service)
+
+        # keys set to None are removed
+        data = {'metadata': {'annotations': {'router.deis.io/domains': None}}}
+        self.scheduler.svc.patch(self.namespace, name, data)
+        service = self.scheduler.svc.get(self.namespace, name).json()
+        self.assertNotIn('router.deis.io/domains', service['metadata']['annotations'])
+
+    def test_patch_unchanged(self):
+        name = self.create()
+        data = {'metadata': {'annotations': {'router.deis.io/domains': 'foo.com'}}}
+        self.scheduler.svc.patch(self.namespace, name, data)
+        current = self.scheduler.svc.get(self.namespace, name).json()
+
+        # the service already has everything in the patch
+        with mock.patch('scheduler.KubeHTTPClient.http_patch') as patch:
+            self.assertIsNone(self.scheduler.svc.patch(self.namespace, name, data, current=current))  # noqa
+            data = {'metadata': {'annotations': {'router.deis.io/certificates': None}}}
+            self.scheduler.svc.patch(self.namespace, name, data, current=current)
+            self.assertFalse(patch.called)
+
+        data = {'metadata': {'annotations': {'router.deis.io/domains': None}}}
+        response = self.scheduler.svc.patch(self.namespace, name, data, current=current)
+        self.assertEqual(response.status_code, 200, response.json())
+
     def test_delete_failure(self):
         # test failure
         with self.assertRaises(
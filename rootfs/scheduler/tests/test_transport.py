@@ -0,0 +1,79 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import threading
+import unittest
+
+import requests
+
+from scheduler import transport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    # keep-alive connections would otherwise block the server from handling others
+    daemon_threads = True
+
+
+class TestTransport(unittest.TestCase):
+    """Test the pooled Kubernetes transport against a local HTTP server"""
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        adapter = transport.PooledAdapter(keepalive=30, pool_maxsize=2, pool_block=True)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        for _ in range(5):
+            session.get(self.url)
+
+        stats = adapter.stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['host'], 'http://127.0.0.1:{}'.format(self.server.server_port))
+        self.assertEqual(stats[0]['maxsize'], 2)
+        self.assertEqual(stats[0]['requests'], 5)
+        self.assertEqual(stats[0]['connections'], 1)
+        self.assertEqual(stats[0]['idle'], 1)
+
+    def test_thread_local_sessions_share_pools(self):
+        base = requests.Session()
+        adapter = transport.PooledAdapter(keepalive=30, pool_maxsize=2, pool_block=True)
+        base.mount('http://', adapter)
+        session = transport.ThreadLocalSession(base)
+
+        sessions = []
+
+        def work():
+            sessions.append(session.current())
+            session.get(self.url)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # every thread had its own session on top of the same connection pool
+        self.assertEqual(len(set(id(s) for s in sessions)), 4)
+        stats = adapter.stats()
+        self.assertEqual(stats[0]['requests'], 4)
+        self.assertLessEqual(stats[0]['connections'], 2)
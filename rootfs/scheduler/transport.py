@@ -0,0 +1,144 @@
+"""
+HTTP transport used to talk to the Kubernetes API server
+
+All sessions share one PooledAdapter so threads fanning out requests (see api.utils.async_run)
+reuse warm keep-alive connections instead of opening and TLS handshaking new ones, and the
+number of connections a process holds open to a host never goes above the pool size.
+"""
+import socket
+import threading
+
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection
+from requests.packages.urllib3.util.retry import Retry
+
+# every adapter handed out, for statistics
+adapters = []
+
+
+def keepalive_options(idle):
+    """TCP keep-alive socket options so idle pooled connections are not silently dropped"""
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # not all platforms allow tuning the probes
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options += [
+            (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle),
+            (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, idle // 3)),
+            (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3),
+        ]
+
+    return options
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that keeps connections alive and caps how many are open per host
+
+    With pool_block set, threads wait for a connection to be returned to the pool
+    when all of them are in use rather than opening extra ones
+    """
+    def __init__(self, keepalive=60, **kwargs):
+        self.socket_options = HTTPConnection.default_socket_options + keepalive_options(keepalive)  # noqa
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+    def stats(self):
+        """Connection statistics for each host this adapter has a pool for"""
+        stats = []
+        pools = self.poolmanager.pools
+        with pools.lock:
+            keys = list(pools._container.keys())
+
+        for key in keys:
+            pool = pools.get(key)
+            if pool is None:
+                continue
+
+            stats.append({
+                'host': '{}://{}:{}'.format(pool.scheme, pool.host, pool.port),
+                'maxsize': pool.pool.maxsize,
+                # connections sitting in the pool ready to be reused
+                'idle': len([conn for conn in list(pool.pool.queue) if conn is not None]),
+                # connections opened over the lifetime of the pool
+                'connections': pool.num_connections,
+                'requests': pool.num_requests,
+            })
+
+        return stats
+
+
+def adapter():
+    """Build a PooledAdapter as configured in settings"""
+    pooled = PooledAdapter(
+        keepalive=settings.KUBERNETES_POOL_KEEPALIVE,
+        pool_connections=settings.KUBERNETES_POOL_CONNECTIONS,
+        pool_maxsize=settings.KUBERNETES_POOL_MAXSIZE,
+        pool_block=settings.KUBERNETES_POOL_BLOCK,
+        # only retry when a connection could not be made, requests may not be idempotent
+        max_retries=Retry(total=3, read=False, backoff_factor=0.1),
+    )
+    adapters.append(pooled)
+    return pooled
+
+
+def session(headers, verify):
+    """
+    Build a requests.Session using the pooled transport, or a thread local session proxy
+    if KUBERNETES_THREAD_LOCAL_SESSIONS is set
+    """
+    base = requests.Session()
+    base.headers = headers
+    base.verify = verify
+    pooled = adapter()
+    base.mount('http://', pooled)
+    base.mount('https://', pooled)
+
+    if settings.KUBERNETES_THREAD_LOCAL_SESSIONS:
+        return ThreadLocalSession(base)
+
+    return base
+
+
+class ThreadLocalSession(object):
+    """
+    Stands in for a requests.Session but hands each thread its own Session
+
+    All of them share the adapters (and so the connection pools) of the base session,
+    anything mounted on one of them is visible to all
+    """
+    def __init__(self, base):
+        self.base = base
+        self.local = threading.local()
+
+    def current(self):
+        current = getattr(self.local, 'session', None)
+        if current is None:
+            current = requests.Session()
+            current.headers = self.base.headers.copy()
+            current.verify = self.base.verify
+            current.adapters = self.base.adapters
+            self.local.session = current
+
+        return current
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+
+def pool_stats():
+    """Connection statistics of every pooled adapter in this process"""
+    stats = []
+    for pooled in adapters:
+        stats.extend(pooled.stats())
+
+    return stats
+
+
+def reset():
+    """Forget all adapters, after a fork the connections belong to the parent"""
+    del adapters[:]
@@ -1,4 +1,6 @@
 from copy import deepcopy
+import hashlib
+import json
 import random
 
 
@@ -91,3 +93,11 @@ def dict_merge(origin, merge):
             else:
                 result[key] = deepcopy(value)
     return result
+
+
+def manifest_hash(manifest):
+    """
+    Return a hash of the content of a manifest that does not depend on the order of its keys
+    """
+    content = json.dumps(manifest, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()